@@ -59,7 +59,12 @@ _six = "six >= 1.10.0"
 # The rest in alphabetic order
 author = "Rocky Bernstein, Hartmut Goebel and others"
 author_email = "rb@dustyfeet.com"
-entry_points = {"console_scripts": ["pydisasm=xdis.bin.pydisasm:main"]}
+entry_points = {
+    "console_scripts": [
+        "pycheader=xdis.bin.pycheader:main",
+        "pydisasm=xdis.bin.pydisasm:main",
+    ]
+}
 ftp_url = None
 
 # Python-version | package | last-version |
@@ -3,9 +3,15 @@
 import os.path as osp
 import sys
 
-from xdis import findlinestarts
-from xdis.bytecode import offset2line
+from xdis import findlinestarts, iscode
+from xdis.bytecode import (
+    Bytecode,
+    InstructionArray,
+    get_instructions_bytes,
+    offset2line,
+)
 from xdis.load import load_module
+from xdis.op_imports import get_opcode_module
 from xdis.opcodes import opcode_27, opcode_36
 from xdis.version_info import PYTHON_VERSION_TRIPLE
 
@@ -183,7 +189,57 @@ def findlabels():
     assert expect == offset_map
 
 
+def test_instruction_array():
+    my_dir = osp.dirname(osp.abspath(__file__))
+    for test_pyc in (
+        osp.join(my_dir, "testdata", "multi-fn-2.7.pyc"),
+        osp.join(my_dir, "..", "test", "bytecode_1.0", "posixpath.pyc"),
+        osp.join(my_dir, "..", "test", "bytecode_3.6", "01_dead_code.pyc"),
+        osp.join(my_dir, "..", "test", "bytecode_3.11", "04_withas.py.pyc"),
+    ):
+        version, _, _, co, pypy, _, _ = load_module(test_pyc)
+        opc = get_opcode_module(version, "pypy" if pypy else None)
+        codes = [co]
+        for code in codes:
+            args = (
+                code.co_code,
+                opc,
+                code.co_varnames,
+                code.co_names,
+                code.co_consts,
+                None,
+                dict(opc.findlinestarts(code)),
+            )
+            instructions = list(get_instructions_bytes(*args))
+            insts = InstructionArray(*args)
+            assert len(insts) == len(instructions)
+            assert list(insts) == instructions, test_pyc
+            assert insts[-1] == instructions[-1]
+            assert insts[1:3] == instructions[1:3]
+            for i, inst in enumerate(instructions):
+                assert insts.opcodes[i] == inst.opcode
+                assert insts.offsets[i] == inst.offset
+                assert insts.offset2index(inst.offset) == i
+                assert insts.at_offset(inst.offset) == inst
+            codes.extend(c for c in code.co_consts if iscode(c))
+
+    # Offsets in the middle of an instruction
+    insts = InstructionArray(code.co_code, opc)
+    for offset in (-2, 1, len(code.co_code)):
+        try:
+            insts.offset2index(offset)
+        except ValueError:
+            pass
+        else:
+            assert False, offset
+
+    opc = get_opcode_module()
+    bytecode = Bytecode(bug708901, opc)
+    assert list(bytecode.instruction_array()) == list(bytecode)
+
+
 if __name__ == "__main__":
     # test_get_jump_targets()
     # test_offset2line()
     test_find_linestarts()
+    test_instruction_array()
@@ -0,0 +1,84 @@
+"""xdis.codeindex testing"""
+
+import os.path as osp
+import shutil
+
+from xdis.codeindex import CodeIndex, build_code_index, load_code_at
+from xdis.load import CODE_INDEX_SUFFIX, load_module_code, load_module_index
+from xdis.magics import magic2int
+from xdis.unmarshal import iter_code_objects
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def test_build_code_index():
+    for path, header_size in ((PYC_38, 16), (PYC_27, 8)):
+        with open(path, "rb") as fp:
+            data = fp.read()
+        magic_int = magic2int(data[:4])
+        body = data[header_size:]
+        codes = list(iter_code_objects(body, magic_int))
+
+        index = build_code_index(body, magic_int)
+        # Saving and restoring the index shouldn't change it.
+        index = CodeIndex.from_json(index.to_json())
+
+        assert len(index.entries) == len(codes)
+        for entry, code in zip(index.entries, codes):
+            assert entry.co_name == code.co_name
+            assert entry.co_firstlineno == code.co_firstlineno
+            assert 0 <= entry.start < entry.end <= len(body)
+            co = load_code_at(body, index, entry)
+            assert co.co_code == code.co_code
+            assert [c for c in co.co_consts if not hasattr(c, "co_code")] == [
+                c for c in code.co_consts if not hasattr(c, "co_code")
+            ]
+            assert co.co_names == code.co_names
+            assert co.co_filename == code.co_filename
+
+
+def test_load_module_code(tmp_path):
+    path = str(tmp_path / osp.basename(PYC_38))
+    shutil.copy(PYC_38, path)
+    sidecar_path = path + CODE_INDEX_SUFFIX
+
+    index = load_module_index(path)
+    assert osp.exists(sidecar_path)
+    assert index.find("<module>")
+
+    # The saved index is used when it is still current.
+    saved = load_module_index(path)
+    assert saved.entries == index.entries
+
+    # ... and rebuilt when the file changes.
+    with open(sidecar_path, "w") as fp:
+        fp.write(index.to_json().replace('"size":', '"size":1'))
+    assert load_module_index(path).size == index.size
+
+    for entry in index.entries:
+        co = load_module_code(path, entry.co_name, entry.co_firstlineno, index)
+        assert co.co_name == entry.co_name
+        assert co.co_firstlineno == entry.co_firstlineno
+
+    # Without an index, the one saved alongside is used.
+    co = load_module_code(path, "<module>")
+    assert co.co_name == "<module>"
+
+    # The caller can hand over the file's contents rather than have them
+    # read again.
+    with open(path, "rb") as fp:
+        data = fp.read()
+    assert load_module_index(path, sidecar=False, data=data).entries == index.entries
+
+
+if __name__ == "__main__":
+    test_build_code_index()
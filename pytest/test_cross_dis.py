@@ -1,6 +1,7 @@
 from dis import findlabels as findlabels_std
 
-from xdis.cross_dis import findlabels
+from xdis.bytecode import Bytecode, parse_exception_table
+from xdis.cross_dis import JumpTargetIndex, findlabels, get_jump_target_maps
 from xdis.op_imports import get_opcode_module
 
 
@@ -10,5 +11,46 @@ def test_findlabels():
     assert findlabels(code, opc) == findlabels_std(code)
 
 
+def loops(n):
+    total = 0
+    for i in range(n):
+        while total < i:
+            try:
+                total += i
+            except ValueError:
+                continue
+    return total
+
+
+def test_jump_target_index():
+    co = loops.__code__
+    opc = get_opcode_module()
+    if hasattr(co, "co_exceptiontable"):
+        exception_entries = parse_exception_table(co.co_exceptiontable)
+    else:
+        exception_entries = None
+    index = JumpTargetIndex(co, opc, exception_entries)
+    assert index.targets == set(findlabels_std(co.co_code))
+    assert list(index.sources) == findlabels(co.co_code, opc)
+
+    # Sources are the instructions whose argval is the target.
+    jumps = {}
+    for inst in Bytecode(co, opc):
+        if inst.opcode in opc.JUMP_OPs:
+            jumps.setdefault(inst.argval, []).append(inst.offset)
+        assert inst.is_jump_target == (inst.offset in index.labels)
+    assert index.sources == jumps
+
+    if exception_entries:
+        assert index.handlers == set(entry.target for entry in exception_entries)
+    assert index.labels == index.targets | index.handlers
+
+    offset2prev = get_jump_target_maps(co.co_code, opc)
+    assert offset2prev == index.jump_target_maps()
+    for target, sources in index.sources.items():
+        assert set(sources) <= set(offset2prev[target])
+
+
 if __name__ == "__main__":
     test_findlabels()
+    test_jump_target_index()
@@ -0,0 +1,54 @@
+"""xdis.detect testing"""
+
+import marshal
+import os.path as osp
+
+from xdis.detect import detect_version, detect_versions
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def body(path, header_size):
+    with open(path, "rb") as fp:
+        return fp.read()[header_size:]
+
+
+def best_versions(guesses):
+    return [g.version for g in guesses if g.score == guesses[0].score]
+
+
+def test_detect_version():
+    assert best_versions(detect_version(body(PYC_38, 16)))[0] == (3, 8)
+    guesses = detect_version(body(PYC_27, 8))
+    assert guesses[0].version == (2, 7) and not guesses[0].is_pypy
+
+    data = marshal.dumps(
+        compile("def f(x):\n    return [i for i in x]\n", "<s>", "exec")
+    )
+    assert PYTHON_VERSION_TRIPLE[:2] in best_versions(detect_version(data))
+
+    # Things that aren't code objects.
+    for data in (b"", b"N", b"c" + b"\xff" * 64, marshal.dumps((1, 2, 3))):
+        assert detect_version(data) == []
+
+
+def test_detect_versions():
+    blobs = [body(PYC_38, 16), body(PYC_27, 8), b"junk"]
+    expect = [detect_version(blob) for blob in blobs]
+    assert detect_versions(blobs, workers=1) == expect
+    assert detect_versions(blobs, workers=2) == expect
+
+
+if __name__ == "__main__":
+    test_detect_version()
+    test_detect_versions()
@@ -0,0 +1,113 @@
+"""xdis.headerscan testing"""
+
+import os
+import os.path as osp
+import py_compile
+import shutil
+from struct import pack
+
+from xdis.headerscan import read_header, scan_headers, source_path
+from xdis.load import load_module
+from xdis.magics import magics
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def test_read_header():
+    for path in (PYC_38, PYC_27):
+        header = read_header(path)
+        version, timestamp, magic_int, _, _, source_size, sip_hash = load_module(
+            path, get_code=False
+        )
+        assert header.error is None
+        assert header.version == version
+        assert header.magic_int == magic_int
+        assert header.timestamp == timestamp
+        assert header.source_size == source_size
+        assert header.sip_hash == sip_hash
+        assert header.stale is None
+
+
+def test_scan_headers(tmp_path):
+    source = tmp_path / "mod.py"
+    source.write_text("x = 1\n")
+    timestamp_pyc = py_compile.compile(str(source))
+    hash_source = tmp_path / "hashed.py"
+    hash_source.write_text("y = 2\n")
+    hash_pyc = py_compile.compile(
+        str(hash_source),
+        invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+    )
+    assert source_path(timestamp_pyc) == str(source)
+
+    orphan = str(tmp_path / "orphan.pyc")
+    shutil.copy(PYC_27, orphan)
+    junk = tmp_path / "junk.pyc"
+    junk.write_bytes(b"\xff\xff\r\n")
+
+    def scan():
+        return {
+            osp.basename(h.filename): h
+            for h in scan_headers(str(tmp_path), check_source=True, workers=4)
+        }
+
+    headers = scan()
+    assert len(headers) == 4
+    assert headers[osp.basename(timestamp_pyc)].stale is False
+    assert headers[osp.basename(hash_pyc)].sip_hash is not None
+    assert headers[osp.basename(hash_pyc)].stale is False
+    assert headers["orphan.pyc"].source is None
+    assert headers["orphan.pyc"].stale is None
+    assert headers["junk.pyc"].error is not None
+
+    # Change the sources.
+    stat_result = os.stat(str(source))
+    os.utime(str(source), (stat_result.st_atime, stat_result.st_mtime + 10))
+    hash_source.write_text("y = 3\n")
+    headers = scan()
+    assert headers[osp.basename(timestamp_pyc)].stale is True
+    assert headers[osp.basename(hash_pyc)].stale is True
+
+    assert list(scan_headers(str(tmp_path), workers=1)) == list(
+        scan_headers(str(tmp_path), workers=2)
+    )
+
+
+def test_hash_other_version(tmp_path):
+    """A hash-based file for a Python other than the running one is
+    checked against its source too."""
+    from _imp import source_hash
+
+    source = tmp_path / "other.py"
+    source.write_text("z = 3\n")
+    magic = magics["3.8"]
+    pyc = tmp_path / "other.pyc"
+    sip_hash = source_hash(int.from_bytes(magic, "little"), source.read_bytes())
+    pyc.write_bytes(magic + pack("<I", 3) + sip_hash + b"\xe3")
+
+    header = read_header(str(pyc), check_source=True)
+    assert header.error is None
+    assert header.version[:2] == (3, 8)
+    assert header.stale is False
+    source.write_text("z = 4\n")
+    assert read_header(str(pyc), check_source=True).stale is True
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    test_read_header()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_scan_headers(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_hash_other_version(Path(tmp))
@@ -0,0 +1,76 @@
+"""xdis.headerwrite testing"""
+
+import os.path as osp
+import py_compile
+import shutil
+
+from xdis.headerwrite import rewrite_header, rewrite_headers
+from xdis.load import load_module
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+MODES = {
+    "timestamp": py_compile.PycInvalidationMode.TIMESTAMP,
+    "checked-hash": py_compile.PycInvalidationMode.CHECKED_HASH,
+    "unchecked-hash": py_compile.PycInvalidationMode.UNCHECKED_HASH,
+}
+
+
+def test_rewrite_header(tmp_path):
+    source = tmp_path / "mod.py"
+    source.write_text("def f(x):\n    return x + 1\n")
+    pyc = str(tmp_path / "mod.pyc")
+    expect = str(tmp_path / "expect.pyc")
+    for mode, invalidation_mode in MODES.items():
+        py_compile.compile(
+            str(source), cfile=expect, invalidation_mode=invalidation_mode
+        )
+        for atomic in (False, True):
+            # Start from a different kind of header.
+            other = "checked-hash" if mode == "timestamp" else "timestamp"
+            py_compile.compile(str(source), cfile=pyc, invalidation_mode=MODES[other])
+            assert rewrite_header(pyc, mode, atomic=atomic) == (pyc, True, None)
+            with open(pyc, "rb") as fp, open(expect, "rb") as expect_fp:
+                assert fp.read() == expect_fp.read()
+            # Nothing more to do.
+            assert rewrite_header(pyc, mode, atomic=atomic) == (pyc, False, None)
+
+    # Bytecode from before hash-based files, and with no source.
+    orphan = str(tmp_path / "orphan.pyc")
+    shutil.copy(PYC_27, orphan)
+    assert rewrite_header(orphan, "checked-hash").error is not None
+    assert rewrite_header(orphan, "timestamp").error is not None
+    assert rewrite_header(orphan, "timestamp", timestamp=1234).changed
+    version, timestamp, _, co, _, _, _ = load_module(orphan)
+    assert version == (2, 7) and timestamp == 1234
+    assert co.co_code == load_module(PYC_27)[3].co_code
+
+
+def test_rewrite_headers(tmp_path):
+    for i in range(20):
+        source = tmp_path / ("mod%d.py" % i)
+        source.write_text("x = %d\n" % i)
+        py_compile.compile(str(source), cfile=str(tmp_path / ("mod%d.pyc" % i)))
+    results = list(rewrite_headers(str(tmp_path), "timestamp", timestamp=0, workers=4))
+    assert len(results) == 20
+    assert all(result.changed and result.error is None for result in results)
+    for result in results:
+        assert load_module(result.filename)[1] == 0
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_rewrite_header(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_rewrite_headers(Path(tmp))
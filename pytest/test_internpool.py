@@ -0,0 +1,83 @@
+"""xdis.internpool testing"""
+
+import os.path as osp
+
+from xdis.internpool import InternPool
+from xdis.load import load_module
+from xdis.marsh import loads
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def test_intern():
+    pool = InternPool()
+    s = "".join(["a", "bc"])
+    assert pool.intern(s) is s
+    assert pool.intern("".join(["ab", "c"])) is s
+
+    # Equal but different constants are kept apart.
+    for a, b in ((0.0, -0.0), (1, 1.0), (1, True), ((1,), (1.0,))):
+        assert pool.intern(a) is a
+        assert pool.intern(b) is b
+
+    # Mutable objects are left alone.
+    items = []
+    assert pool.intern(items) is items
+
+    # So are containers of things that aren't pooled by value.
+    code = test_intern.__code__
+    for container in ((1, code), frozenset([code]), ((code,),)):
+        entries = len(pool)
+        assert pool.intern(container) is container
+        assert len(pool) == entries
+    # Containers of such constants are pooled, items first as a load does.
+    nested = (pool.intern((None, True, ...)), pool.intern(frozenset(["a"])))
+    assert pool.intern(nested) is nested
+    again = (
+        pool.intern(tuple([None, True, ...])),
+        pool.intern(frozenset(["a"])),
+    )
+    assert again is not nested and again[0] is nested[0]
+    assert pool.intern(again) is nested
+
+    stats = pool.stats()
+    assert stats.hits == 4
+    assert stats.by_type["str"][0] == 1
+    assert stats.entries == len(pool)
+
+
+def test_load_module_intern_pool():
+    for path in (PYC_38, PYC_27):
+        pool = InternPool()
+        co1 = load_module(path, intern_pool=pool)[3]
+        hits = pool.stats().hits
+        co2 = load_module(path, intern_pool=pool)[3]
+        assert co1 is not co2
+        assert co1.co_code is co2.co_code
+        assert co1.co_names is co2.co_names
+        assert co1.co_filename is co2.co_filename
+        assert pool.stats().hits > hits
+
+
+def test_marsh_intern_pool():
+    pool = InternPool()
+    data = b"(\x02\x00\x00\x00u\x03\x00\x00\x00abci\x07\x00\x00\x00"
+    t1 = loads(data, intern_pool=pool)
+    t2 = loads(data, intern_pool=pool)
+    assert t1 == ("abc", 7)
+    assert t1 is t2
+
+
+if __name__ == "__main__":
+    test_intern()
+    test_load_module_intern_pool()
+    test_marsh_intern_pool()
@@ -1,10 +1,20 @@
+import io
+import mmap
 import os
 import os.path as osp
+import py_compile
+import threading
 
 import pytest
 from xdis import IS_GRAAL, IS_PYPY
 from xdis.codetype import CodeTypeUnionFields
-from xdis.load import check_object_path, load_file, load_module
+from xdis.load import (
+    check_object_path,
+    iter_stream_modules,
+    load_file,
+    load_module,
+    load_module_from_file_object,
+)
 
 
 def get_srcdir():
@@ -78,5 +88,128 @@ def test_load_file():
             print("ok %s" % field)
 
 
+def test_load_module_mmap(tmp_path):
+    srcdir = get_srcdir()
+    pyc_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+    for path, kwargs in (
+        (pyc_38, {}),
+        (osp.join(srcdir, "testdata", "multi-fn-2.7.pyc"), {}),
+        (osp.join(srcdir, "testdata", "multi-fn-2.7.pyc"), {"lazy": True}),
+    ):
+        expect = load_module(path)
+        got = load_module(path, use_mmap=True, **kwargs)
+        assert got[:3] == expect[:3] and got[4:] == expect[4:]
+        assert got[3].co_code == expect[3].co_code
+        assert [c.co_name for c in got[3].co_consts if hasattr(c, "co_code")] == [
+            c.co_name for c in expect[3].co_consts if hasattr(c, "co_code")
+        ]
+
+    # A PEP 552 hash-based bytecode file.
+    load_py = osp.realpath(osp.join(srcdir, "..", "xdis", "load.py"))
+    pyc = str(tmp_path / "load.pyc")
+    py_compile.compile(
+        load_py,
+        cfile=pyc,
+        invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+    )
+    for use_mmap in (False, True):
+        _, timestamp, _, _, _, source_size, sip_hash = load_module(
+            pyc, use_mmap=use_mmap
+        )
+        assert timestamp is None and source_size is None
+        assert sip_hash is not None
+
+    # The mapping stays open only while lazily decoded code needs it.
+    for path, kwargs, stays_open in (
+        (pyc, {"lazy": True}, False),
+        (pyc_38, {"lazy": True, "fast_load": True}, False),
+        (pyc_38, {"lazy": True, "get_code": False}, False),
+        (pyc_38, {"lazy": True}, True),
+    ):
+        with open(path, "rb") as fp:
+            mapping = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        co = load_module_from_file_object(mapping, filename=path, **kwargs)[3]
+        assert mapping.closed != stays_open
+        del co
+
+
+class ChunkReader:
+    """A stream that gives at most `chunk_size` bytes of `data` a read."""
+
+    def __init__(self, data, chunk_size):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def read(self, size=-1):
+        chunk = self.data[: min(size, self.chunk_size)]
+        self.data = self.data[len(chunk) :]
+        return chunk
+
+
+def test_iter_stream_modules():
+    srcdir = get_srcdir()
+    paths = [
+        osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc"),
+        osp.join(srcdir, "testdata", "multi-fn-2.7.pyc"),
+        osp.join(srcdir, "..", "test", "bytecode_1.0", "dis.pyc"),
+    ]
+    data = b"".join(open(path, "rb").read() for path in paths)
+
+    # Write to a pipe a few bytes at a time.
+    read_fd, write_fd = os.pipe()
+
+    def writer():
+        with os.fdopen(write_fd, "wb", buffering=0) as fp:
+            for i in range(0, len(data), 100):
+                fp.write(data[i : i + 100])
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    with os.fdopen(read_fd, "rb") as fp:
+        got = list(iter_stream_modules(fp, chunk_size=64))
+    thread.join()
+
+    assert len(got) == len(paths)
+    for path, module in zip(paths, got):
+        expect = load_module(path)
+        assert module[:3] == expect[:3] and module[4:] == expect[4:]
+        assert module[3].co_code == expect[3].co_code
+
+    # Reads that end in the middle of a multi-byte UTF-8 character.
+    for path, chunk_size in (
+        ("bytecode_3.2/01_unicode.pyc", 59),
+        ("bytecode_3.2pypy/01_unicode.pyc", 59),
+        ("bytecode_3.10/00_docstring.pyc", 75),
+    ):
+        path = osp.join(srcdir, "..", "test", path)
+        with open(path, "rb") as fp:
+            stream = fp.read()
+        assert any(
+            0x80 <= stream[i] < 0xC0 and stream[i - 1] >= 0x80
+            for i in range(chunk_size, len(stream), chunk_size)
+        )
+        (module,) = iter_stream_modules(
+            ChunkReader(stream, chunk_size), chunk_size=chunk_size
+        )
+        expect = load_module(path)
+        assert module[:3] == expect[:3]
+        assert module[3].co_code == expect[3].co_code
+        assert [c for c in module[3].co_consts if isinstance(c, str)] == [
+            c for c in expect[3].co_consts if isinstance(c, str)
+        ]
+
+    # A file cut short in the middle.
+    with open(paths[0], "rb") as fp:
+        stream = fp.read()
+    with pytest.raises(ImportError):
+        list(iter_stream_modules(io.BytesIO(stream[: len(stream) // 2])))
+
+
 if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
     test_load_file()
+    test_iter_stream_modules()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_load_module_mmap(Path(tmp))
@@ -0,0 +1,141 @@
+"""xdis.load.load_modules testing"""
+
+import io
+import os.path as osp
+import shutil
+import zipfile
+
+from xdis.disasm import disassemble_file
+from xdis.load import (
+    iter_archive_members,
+    iter_bytecode_files,
+    load_module,
+    load_modules,
+)
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def make_tree(tmp_path):
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    shutil.copy(PYC_38, str(tmp_path / "a.pyc"))
+    shutil.copy(PYC_27, str(sub / "b.pyc"))
+    (sub / "c.pyc").write_bytes(b"not a bytecode file" * 10)
+    (sub / "notes.txt").write_text("ignored")
+    return [str(tmp_path / "a.pyc"), str(sub / "b.pyc"), str(sub / "c.pyc")]
+
+
+def test_iter_bytecode_files(tmp_path):
+    paths = make_tree(tmp_path)
+    assert list(iter_bytecode_files(str(tmp_path))) == paths
+    assert list(iter_bytecode_files([paths[1], str(tmp_path)])) == paths[1:2] + paths
+
+
+def test_load_modules(tmp_path):
+    paths = make_tree(tmp_path)
+    for workers in (1, 2):
+        results = list(load_modules(str(tmp_path), workers=workers, ordered=True))
+        assert [r.filename for r in results] == paths
+        for r in results[:2]:
+            assert r.error is None
+            expect = load_module(r.filename)
+            assert r.result[:3] == expect[:3]
+            assert r.result[3].co_code == expect[3].co_code
+            assert r.result[3].co_names == expect[3].co_names
+        # A bad file gives its error, rather than stopping the rest.
+        assert results[2].result is None
+        assert isinstance(results[2].error, ImportError)
+
+    results = load_modules(paths + [str(tmp_path / "missing.pyc")], workers=2)
+    assert sorted(r.filename for r in results) == sorted(
+        paths + [str(tmp_path / "missing.pyc")]
+    )
+
+
+def test_load_from_archive(tmp_path):
+    wheel = str(tmp_path / "dist-1.0-py3-none-any.whl")
+    with zipfile.ZipFile(wheel, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(PYC_38, "pkg/__pycache__/a.cpython-38.pyc")
+        zf.write(PYC_27, "pkg/b.pyc")
+        zf.writestr("pkg/__init__.py", "")
+    members = list(iter_archive_members(wheel))
+    assert members == [
+        osp.join(wheel, "pkg", "__pycache__", "a.cpython-38.pyc"),
+        osp.join(wheel, "pkg", "b.pyc"),
+    ]
+
+    for member, path in zip(members, (PYC_38, PYC_27)):
+        expect = load_module(path)
+        for kwargs in ({}, {"lazy": True}):
+            got = load_module(member, **kwargs)
+            assert got[:3] == expect[:3]
+            assert got[3].co_code == expect[3].co_code
+            assert got[3].co_names == expect[3].co_names
+
+    out = io.StringIO()
+    disassemble_file(members[0], out)
+    assert "04_def_annotate" in out.getvalue()
+
+    results = list(load_modules(str(tmp_path), workers=2, ordered=True))
+    assert [r.filename for r in results] == members
+    assert all(r.error is None for r in results)
+
+    missing = osp.join(wheel, "pkg", "missing.pyc")
+    assert isinstance(next(load_modules(missing, workers=1)).error, ImportError)
+
+
+def test_load_bad_archive(tmp_path):
+    paths = make_tree(tmp_path)
+    corrupt = str(tmp_path / "sub" / "corrupt.zip")
+    with open(corrupt, "wb") as fp:
+        fp.write(b"PK\x03\x04" + b"not a zip file" * 10)
+    truncated = str(tmp_path / "truncated.whl")
+    with zipfile.ZipFile(truncated, "w") as zf:
+        zf.write(PYC_38, "pkg/a.pyc")
+    with open(truncated, "rb+") as fp:
+        fp.truncate(100)
+
+    assert list(iter_bytecode_files(str(tmp_path), archives=True)) == [
+        paths[0],
+        truncated,
+        paths[1],
+        paths[2],
+        corrupt,
+    ]
+    for workers in (0, 2):
+        results = list(load_modules(str(tmp_path), workers=workers, ordered=True))
+        assert [r.filename for r in results] == [
+            paths[0],
+            truncated,
+            paths[1],
+            paths[2],
+            corrupt,
+        ]
+        assert results[0].error is None and results[2].error is None
+        for r in (results[1], results[4]):
+            assert r.result is None
+            assert isinstance(r.error, zipfile.BadZipFile)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_iter_bytecode_files(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_load_modules(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_load_from_archive(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_load_bad_archive(Path(tmp))
@@ -0,0 +1,92 @@
+"""xdis.loadcache testing"""
+
+import os
+import os.path as osp
+import shutil
+
+from xdis.load import load_module, load_modules
+from xdis.loadcache import LoadCache
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def same_result(got, expect):
+    assert got[:3] == expect[:3] and got[4:] == expect[4:]
+    assert got[3].co_code == expect[3].co_code
+    assert got[3].co_names == expect[3].co_names
+    assert [c.co_name for c in got[3].co_consts if hasattr(c, "co_code")] == [
+        c.co_name for c in expect[3].co_consts if hasattr(c, "co_code")
+    ]
+
+
+def test_load_cache(tmp_path):
+    for key in ("content", "header"):
+        cache = LoadCache(str(tmp_path / key), key=key)
+        for path in (PYC_38, PYC_27):
+            expect = load_module(path)
+            same_result(load_module(path, cache=cache), expect)
+            same_result(load_module(path, cache=cache), expect)
+        assert cache.stats() == (2, 2, 2, 0)
+
+        # A damaged entry is dropped and loaded again.
+        _, entries = cache.scan()
+        with open(entries[0][2], "wb") as fp:
+            fp.write(b"junk")
+        for path in (PYC_38, PYC_27):
+            load_module(path, cache=cache)
+        assert cache.stats() == (3, 3, 3, 0)
+
+    # The same contents somewhere else are found by the content key.
+    cache = LoadCache(str(tmp_path / "content"))
+    copy = str(tmp_path / "copy.pyc")
+    shutil.copy(PYC_38, copy)
+    same_result(load_module(copy, cache=cache), load_module(PYC_38))
+    assert cache.stats().hits == 1
+
+
+def test_load_cache_eviction(tmp_path):
+    cache = LoadCache(str(tmp_path / "cache"), max_bytes=1)
+    load_module(PYC_38, cache=cache)
+    load_module(PYC_27, cache=cache)
+    assert cache.stats().evictions == 2
+    assert cache.scan() == (0, [])
+
+    cache = LoadCache(str(tmp_path / "cache"))
+    load_module(PYC_38, cache=cache)
+    size_38 = cache.scan()[0]
+    cache.max_bytes = size_38 + 1
+    cache.low_water = 1.0
+    # Make the 3.8 entry the least recently used one.
+    for _, _, path in cache.scan()[1]:
+        os.utime(path, (0, 0))
+    load_module(PYC_27, cache=cache)
+    assert cache.stats().evictions == 1
+    assert load_module(PYC_27, cache=cache) and cache.stats().hits == 1
+
+
+def test_load_modules_cache(tmp_path):
+    cache = LoadCache(str(tmp_path / "cache"))
+    for _ in range(2):
+        results = list(
+            load_modules([PYC_38, PYC_27], workers=2, ordered=True, cache=cache)
+        )
+        assert all(r.error is None for r in results)
+    assert len(cache.scan()[1]) == 2
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    for test in (test_load_cache, test_load_cache_eviction, test_load_modules_cache):
+        with tempfile.TemporaryDirectory() as tmp:
+            test(Path(tmp))
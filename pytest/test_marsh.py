@@ -0,0 +1,166 @@
+"""xdis.marsh testing"""
+
+import glob
+import io
+import marshal
+import os.path as osp
+
+from xdis.load import load_module, load_module_from_file_object
+from xdis.marsh import DUMP_CHUNK_SIZE, FLAG_REF, TYPE_REF, dump, dumps, loads
+from xdis.unmarshal import CODE_FIELD_NAMES, load_code
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def test_dumps():
+    assert dumps(None) == b"N"
+    assert dumps((True, False)) == b"(\x02\x00\x00\x00TF"
+    assert dumps(-2) == b"l\xff\xff\xff\xff\x02\x00"
+    assert dumps(b"ab") == dumps(bytearray(b"ab")) == b"s\x02\x00\x00\x00ab"
+    assert dumps(1.5) == b"f\x031.5"
+    # Strings are UTF-8.
+    assert dumps("caf\xe9") == b"u\x05\x00\x00\x00caf\xc3\xa9"
+
+    for path in (PYC_38, PYC_27):
+        version, _, magic_int, co, _, _, _ = load_module(path)
+        data = dumps(co, python_version=version)
+        assert isinstance(data, bytes)
+        co2 = load_code(data, magic_int)
+        assert co2.co_code == co.co_code
+        assert co2.co_names == co.co_names
+
+
+def test_dumps_refs():
+    name = "".join(["na", "me"])
+    other = "".join(["nam", "e"])
+    x = (name, name, [name], other, 0.0, -0.0, (1,), (1.0,), None, None)
+
+    # Before marshal version 3, or for Python before 3.4, there are none.
+    assert ord(TYPE_REF) not in dumps(x)
+    assert dumps(x, version=4, python_version=(3, 3)) == dumps(x)
+
+    identity = dumps(x, version=4)
+    equal = dumps(x, version=4, refs="equal")
+    assert identity[0] & FLAG_REF
+    assert len(equal) < len(identity) < len(dumps(x))
+    for data, same in ((identity, False), (equal, True)):
+        y = marshal.loads(data)
+        assert y == x and repr(y) == repr(x)
+        assert y[0] is y[1] is y[2][0]
+        # Equal but different strings.
+        assert (y[3] is y[0]) == same
+
+    version, _, magic_int, co, _, _, _ = load_module(PYC_38)
+    data = dumps(co, version=4, python_version=version)
+    assert len(data) < len(dumps(co, python_version=version))
+    co2 = load_code(data, magic_int)
+    assert co2.co_code == co.co_code
+    assert co2.co_names == co.co_names
+    assert co2.co_varnames == co.co_varnames
+
+
+def assert_same(x, y, where="co"):
+    """Check that unmarshalled `x` and `y` are alike, down through the
+    fields of code objects."""
+    assert type(x) is type(y), where
+    if hasattr(x, "co_code"):
+        for name in CODE_FIELD_NAMES:
+            assert_same(
+                getattr(x, name, None), getattr(y, name, None), where + "." + name
+            )
+    elif isinstance(x, (tuple, list)):
+        assert len(x) == len(y), where
+        for i, (a, b) in enumerate(zip(x, y)):
+            assert_same(a, b, "%s[%d]" % (where, i))
+    else:
+        assert repr(x) == repr(y), where
+
+
+def test_loads():
+    assert loads(b"s\x02\x00\x00\x00ab") == b"ab"
+    assert loads(b"s\x02\x00\x00\x00ab", magic_int=3413) == "ab"
+    for x in ((1, "a", b"b", 2.5, 3j, None, [{1: 2}]), frozenset([1, 2])):
+        assert loads(marshal.dumps(x)) == x
+    x = ("name", "name", (1,), (1,))
+    data = marshal.dumps(x)
+    assert data[0] & FLAG_REF
+    y = loads(data)
+    assert y == x and y[0] is y[1]
+    # A list can refer to itself.
+    x = []
+    x.append(x)
+    y = loads(marshal.dumps(x))
+    assert y[0] is y
+
+    # Buffers are read in place, and let go of afterwards.
+    x = (1, "caf\xe9", b"b", 2.5, 3j, {"k": "v"})
+    data = bytearray(marshal.dumps(x))
+    view = memoryview(data)
+    assert loads(data) == loads(view) == loads(view[:]) == x
+    view.release()
+    data.extend(b"!")
+
+    # A None or NULL value ends a dict, as it does for xdis.unmarshal.
+    data = marshal.dumps({"a": None, "b": 1})
+    assert loads(data) == {"a": None, "b": 1}
+    assert loads(data, magic_int=3413) == load_code(data, 3413) == {}
+
+
+def test_fast_load():
+    """load_module(fast_load=True) gives what load_module() does, for
+    the bytecode of every Python version."""
+    pattern = osp.join(srcdir, "..", "test", "bytecode_*", "*.py[co]")
+    count = 0
+    for path in sorted(glob.glob(pattern)):
+        if "dropbox" in path:
+            continue
+        with open(path, "rb") as fp:
+            data = fp.read()
+        modules = {}
+        for fast_load in (False, True):
+            try:
+                modules[fast_load] = load_module_from_file_object(
+                    io.BytesIO(data), filename=path, fast_load=fast_load
+                )
+            except ImportError:
+                break
+        else:
+            slow, fast = modules[False], modules[True]
+            assert fast[:3] == slow[:3], path
+            assert_same(slow[3], fast[3], path)
+            count += 1
+    assert count > 200
+
+
+def test_dump():
+    x = [("name%d" % i, b"\x00" * 100, i) for i in range(2000)]
+    writes = []
+
+    class Writer(io.BytesIO):
+        def write(self, data):
+            writes.append(len(data))
+            return super().write(data)
+
+    fp = Writer()
+    dump(x, fp)
+    assert fp.getvalue() == dumps(x)
+    # Written a piece at a time, rather than all at the end.
+    assert len(writes) > 1
+    assert max(writes) < 2 * DUMP_CHUNK_SIZE
+
+
+if __name__ == "__main__":
+    test_dumps()
+    test_dumps_refs()
+    test_loads()
+    test_fast_load()
+    test_dump()
@@ -1,6 +1,10 @@
 import dis
+import types
 
 from xdis import IS_PYPY, PYTHON_VERSION_TRIPLE, get_opcode
+from xdis.bytecode import get_optype
+from xdis.cross_dis import instruction_size, op_has_argument
+from xdis.op_imports import op_imports, remap_opcodes
 
 
 def test_opcode():
@@ -60,5 +64,41 @@ def test_opcode():
         )
 
 
+def check_decoders(opc):
+    decoders = opc.opcode_decoders
+    assert isinstance(decoders, tuple) and len(decoders) == 256
+    arg_fmt = getattr(opc, "opcode_arg_fmt", {})
+    for op, decoder in enumerate(decoders):
+        assert decoder.opname == opc.opname[op]
+        assert decoder.has_arg == op_has_argument(op, opc)
+        assert decoder.optype == get_optype(op, opc)
+        assert decoder.size == instruction_size(op, opc)
+        assert decoder.formatter is arg_fmt.get(opc.opname[op])
+        if not decoder.has_arg:
+            assert decoder.resolver is None
+
+
+def test_opcode_decoders():
+    for opc in set(op_imports.values()):
+        check_decoders(opc)
+
+    opc = get_opcode((3, 11), False)
+    decoders = opc.opcode_decoders
+    assert decoders[opc.opmap["LOAD_GLOBAL"]].resolver == "global"
+    assert decoders[opc.opmap["JUMP_BACKWARD"]].resolver == "jrel_backward"
+    assert decoders[opc.opmap["LOAD_FAST"]].resolver == "localplus"
+
+    # Remapping opcodes remaps their decoders.
+    remapped = types.ModuleType("remapped")
+    vars(remapped).update(vars(get_opcode((2, 7), False)))
+    load_const = remapped.opmap["LOAD_CONST"]
+    load_name = remapped.opmap["LOAD_NAME"]
+    remap_opcodes(remapped, {"LOAD_CONST": load_name, "LOAD_NAME": load_const})
+    check_decoders(remapped)
+    assert remapped.opcode_decoders[load_name].resolver == "const"
+    assert remapped.opcode_decoders[load_const].resolver == "name"
+
+
 if __name__ == "__main__":
     test_opcode()
+    test_opcode_decoders()
@@ -0,0 +1,71 @@
+"""xdis.pycpack testing"""
+
+import os.path as osp
+import shutil
+
+import pytest
+from xdis.load import load_module
+from xdis.pycpack import PycPack, PycPackWriter, write_pack
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def test_pycpack(tmp_path):
+    corpus = tmp_path / "corpus"
+    (corpus / "b").mkdir(parents=True)
+    shutil.copy(PYC_38, str(corpus / "b" / "a38.pyc"))
+    shutil.copy(PYC_27, str(corpus / "a27.pyc"))
+    pack_path = str(tmp_path / "corpus.pack")
+    assert write_pack(pack_path, str(corpus), root=str(corpus)) == 2
+
+    with PycPack(pack_path) as pack:
+        assert len(pack) == 2
+        assert pack.names() == ["a27.pyc", "b/a38.pyc"]
+        assert "b/a38.pyc" in pack and "b/a39.pyc" not in pack
+        with pytest.raises(KeyError):
+            pack.entry("b/a39.pyc")
+
+        for name, path in (("a27.pyc", PYC_27), ("b/a38.pyc", PYC_38)):
+            expect = load_module(path)
+            entry = pack.entry(name)
+            assert entry.magic_int == expect[2]
+            assert entry.timestamp == expect[1]
+            assert entry.source_size == expect[5]
+            assert entry.sip_hash == expect[6]
+            with open(path, "rb") as fp:
+                assert bytes(pack.data(name)) == fp.read()
+
+            got = pack.load_module(name)
+            assert got[:3] == expect[:3] and got[4:] == expect[4:]
+            assert got[3].co_code == expect[3].co_code
+            assert got[3].co_names == expect[3].co_names
+
+        assert [name for name, _ in pack.iter_modules(get_code=False)] == pack.names()
+
+    # A failed write leaves nothing behind.
+    with pytest.raises(ValueError):
+        with PycPackWriter(str(tmp_path / "bad.pack")) as writer:
+            writer.add_file(PYC_27, "x.pyc")
+            writer.add_file(PYC_27, "x.pyc")
+    assert not osp.exists(str(tmp_path / "bad.pack"))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["corpus", "corpus.pack"]
+
+    with pytest.raises(ValueError):
+        PycPack(PYC_27)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_pycpack(Path(tmp))
@@ -0,0 +1,274 @@
+"""xdis.unmarshal testing"""
+
+import io
+import marshal
+import mmap
+import os.path as osp
+
+import pytest
+from xdis.load import load_module
+from xdis.magics import PYTHON_MAGIC_INT, magic2int
+from xdis.unmarshal import (
+    LazyCode,
+    UnmarshalLimitError,
+    UnmarshalLimits,
+    _VersionIndependentUnmarshaller,
+    get_code_layout,
+    iter_code_objects,
+    load_code,
+    load_code_fields,
+)
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+# Python 3.8 bytecode has a 16-byte header and a code object with
+# nested functions, so it is a reasonable thing to pick apart.
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+HEADER_SIZE_38 = 16
+
+# Python 2.7 uses interned string references rather than FLAG_REF.
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+HEADER_SIZE_27 = 8
+
+
+def read_pyc(path, header_size):
+    with open(path, "rb") as fp:
+        data = fp.read()
+    return magic2int(data[:4]), data[header_size:]
+
+
+def code_summary(co):
+    """Return a comparable summary of a portable code object tree."""
+    consts = tuple(
+        code_summary(c) if hasattr(c, "co_code") else c for c in co.co_consts
+    )
+    return (
+        co.co_name,
+        co.co_code,
+        consts,
+        co.co_names,
+        co.co_varnames,
+        co.co_filename,
+        co.co_firstlineno,
+        co.co_lnotab,
+    )
+
+
+def test_load_code_buffer_types():
+    magic_int, body = read_pyc(PYC_38, HEADER_SIZE_38)
+    expect = code_summary(load_code(body, magic_int))
+
+    assert code_summary(load_code(bytearray(body), magic_int)) == expect
+    assert code_summary(load_code(memoryview(body), magic_int)) == expect
+
+    with open(PYC_38, "rb") as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)[HEADER_SIZE_38:]
+            assert code_summary(load_code(view, magic_int)) == expect
+            view.release()
+
+
+def test_load_code_file_position():
+    magic_int, body = read_pyc(PYC_38, HEADER_SIZE_38)
+    trailer = b"trailing data"
+    fp = io.BytesIO(body + trailer)
+    co = load_code(fp, magic_int)
+    assert co.co_name == "<module>"
+    # We should be left just after the marshaled code object.
+    assert fp.read() == trailer
+
+
+def test_lazy_load_code():
+    for path, header_size in ((PYC_38, HEADER_SIZE_38), (PYC_27, HEADER_SIZE_27)):
+        magic_int, body = read_pyc(path, header_size)
+        eager = load_code(body, magic_int)
+        lazy = load_code(body, magic_int, lazy=True)
+
+        lazy_codes = [c for c in lazy.co_consts if isinstance(c, LazyCode)]
+        assert lazy_codes, path
+        for placeholder in lazy_codes:
+            assert placeholder._code is None
+            assert placeholder.start < placeholder.end <= len(body)
+
+        # Fields of the module code object can refer back to objects
+        # inside the nested code objects that were skipped.
+        assert lazy.co_filename == eager.co_filename
+        assert lazy.co_names == eager.co_names
+
+        assert code_summary(lazy) == code_summary(eager)
+        for placeholder in lazy_codes:
+            assert placeholder._code is not None
+
+
+def test_iter_code_objects():
+    magic_int, body = read_pyc(PYC_38, HEADER_SIZE_38)
+    module = load_code(body, magic_int)
+    codes = list(iter_code_objects(body, magic_int))
+
+    # Inner code objects come first; the module comes last.
+    assert code_summary(codes[-1]) == code_summary(module)
+    nested = [c for c in module.co_consts if hasattr(c, "co_code")]
+    assert nested
+    names = [c.co_name for c in codes]
+    for code in nested:
+        assert names.index(code.co_name) < len(codes) - 1
+
+    # We can stop early.
+    first = next(iter_code_objects(body, magic_int))
+    assert first.co_name == codes[0].co_name
+
+
+def test_iter_code_objects_deep_nesting():
+    # A tuple nested far deeper than the recursion limit allows
+    # for load_code().
+    depth = 5000
+    data = b")\x01" * depth + b"N"
+    it = iter_code_objects(data, PYTHON_MAGIC_INT)
+    try:
+        next(it)
+    except StopIteration as stop:
+        value = stop.value
+    else:
+        assert False, "there are no code objects to yield"
+    for _ in range(depth):
+        assert len(value) == 1
+        value = value[0]
+    assert value is None
+
+
+def test_load_code_fields():
+    for path, header_size in ((PYC_38, HEADER_SIZE_38), (PYC_27, HEADER_SIZE_27)):
+        magic_int, body = read_pyc(path, header_size)
+        codes = list(iter_code_objects(body, magic_int))
+        records = load_code_fields(
+            body, magic_int, ("co_name", "co_names", "co_filename", "co_firstlineno")
+        )
+        assert len(records) == len(codes)
+        for record, code in zip(records, codes):
+            assert record._fields == (
+                "co_name",
+                "co_names",
+                "co_filename",
+                "co_firstlineno",
+            )
+            assert record.co_name == code.co_name
+            assert record.co_names == code.co_names
+            assert record.co_filename == code.co_filename
+            assert record.co_firstlineno == code.co_firstlineno
+
+        # Nested code objects in co_consts are replaced by their records.
+        records = load_code_fields(body, magic_int, ("co_name", "co_consts"))
+        module = records[-1]
+        assert module.co_name == "<module>"
+        nested = [c for c in module.co_consts if hasattr(c, "co_consts")]
+        assert nested
+        assert all(c in records for c in nested)
+
+    with pytest.raises(ValueError):
+        load_code_fields(body, magic_int, ("co_bogus",))
+
+
+def test_native_containers():
+    # A large constant tuple with repeated strings, which marshal
+    # saves as references, and a tuple that refers back to a string
+    # outside of it.
+    source = (
+        "x = 'outside'\n"
+        "T = (%s)\n"
+        "U = ('outside',) + (%s,)\n"
+        "S = frozenset({%s})\n"
+    ) % (
+        ", ".join(repr(("s%d" % (i % 7), i, i / 2.0)) for i in range(40)),
+        ", ".join(str(i) for i in range(40)),
+        ", ".join(repr("k%d" % i) for i in range(40)),
+    )
+    data = marshal.dumps(compile(source, "<native>", "exec"))
+    expect = _VersionIndependentUnmarshaller(
+        data, PYTHON_MAGIC_INT, False, native=False
+    ).load()
+    um_gen = _VersionIndependentUnmarshaller(data, PYTHON_MAGIC_INT, False)
+    assert um_gen.native
+    co = um_gen.load()
+    assert co.co_consts == expect.co_consts
+    assert [type(c) for c in co.co_consts] == [type(c) for c in expect.co_consts]
+    assert co.co_names == expect.co_names
+
+
+def test_load_code_limits():
+    magic_int, body = read_pyc(PYC_38, HEADER_SIZE_38)
+    limits = UnmarshalLimits(
+        max_objects=10000, max_bytes=len(body), max_depth=20, timeout=60
+    )
+    expect = code_summary(load_code(body, magic_int))
+    assert code_summary(load_code(body, magic_int, limits=limits)) == expect
+
+    for limits in (
+        UnmarshalLimits(max_objects=10),
+        UnmarshalLimits(max_bytes=len(body) // 2),
+        UnmarshalLimits(max_depth=2),
+        UnmarshalLimits(timeout=-1),
+    ):
+        with pytest.raises(UnmarshalLimitError):
+            load_code(body, magic_int, limits=limits)
+
+    with pytest.raises(UnmarshalLimitError):
+        load_module(PYC_38, limits=UnmarshalLimits(max_objects=10))
+
+    # Lengths that run past the end of the data are refused up front.
+    limits = UnmarshalLimits()
+    for data in (
+        b"s\xff\xff\xff\x7f",
+        b"(\xff\xff\xff\x7fN",
+        b"l\x00\x00\x00\x80",
+        b")\x05NNN",
+        b"z",
+    ):
+        with pytest.raises(UnmarshalLimitError):
+            load_code(data, PYTHON_MAGIC_INT, limits=limits)
+
+
+def test_get_code_layout():
+    # 2.7: four 32-bit ints before co_code.
+    layout = get_code_layout(62211)
+    assert layout.header_fields == (
+        "co_argcount",
+        "co_nlocals",
+        "co_stacksize",
+        "co_flags",
+    )
+    assert layout.header.size == 16
+
+    # 3.8 adds co_posonlyargcount, except in some 3.8 alphas.
+    assert "co_posonlyargcount" in get_code_layout(3413).header_fields
+    alpha_layout = get_code_layout(3400)
+    assert "co_posonlyargcount" not in alpha_layout.header_fields
+    assert alpha_layout.defaults["co_posonlyargcount"] == 0
+
+    # 3.11 derives locals from co_localsplusnames.
+    layout = get_code_layout(3495)
+    assert layout.has_localsplus
+    assert "co_nlocals" not in layout.header_fields
+    assert layout.trailer == ("co_lnotab", "co_exceptiontable")
+
+    # 1.0 .. 1.2 stores no integer fields at all.
+    layout = get_code_layout(39170)
+    assert layout.header is None
+    assert layout.firstlineno is None
+
+
+if __name__ == "__main__":
+    test_load_code_buffer_types()
+    test_load_code_file_position()
+    test_lazy_load_code()
+    test_iter_code_objects()
+    test_iter_code_objects_deep_nesting()
+    test_load_code_fields()
+    test_native_containers()
+    test_load_code_limits()
+    test_get_code_layout()
@@ -0,0 +1,72 @@
+"""xdis.unmarshal_profile testing"""
+
+import json
+import os.path as osp
+import py_compile
+
+from xdis.load import load_module
+from xdis.unmarshal_profile import UnmarshalProfile
+
+
+def get_srcdir():
+    filename = osp.normcase(osp.dirname(osp.abspath(__file__)))
+    return osp.realpath(filename)
+
+
+srcdir = get_srcdir()
+
+PYC_38 = osp.join(srcdir, "..", "test", "bytecode_3.8", "04_def_annotate.pyc")
+PYC_27 = osp.join(srcdir, "testdata", "multi-fn-2.7.pyc")
+
+
+def test_unmarshal_profile():
+    for path in (PYC_38, PYC_27):
+        profile = UnmarshalProfile()
+        co = load_module(path, profile=profile)[3]
+        info = profile.as_dict()
+
+        # Every byte is attributed to exactly one marshal type,
+        # and to one code field or code object type code.
+        assert info["total_bytes"] > 0
+        assert (
+            sum(stats["self_bytes"] for stats in info["types"].values())
+            == info["total_bytes"]
+        )
+        assert sum(info["fields"].values()) + len(info["codes"]) == info["total_bytes"]
+        assert info["types"]["t_code"]["count"] == len(profile.codes)
+        assert info["refs_reused"] > 0
+        assert info["refs_saved"] >= info["distinct_refs_reused"]
+
+        # Inner code objects finish first.
+        module = profile.codes[-1]
+        assert module.co_name == co.co_name
+        assert module.depth == 0
+        assert module.bytes == info["total_bytes"]
+        assert all(code.depth > 0 for code in profile.codes[:-1])
+
+        assert json.loads(profile.to_json()) == json.loads(json.dumps(info))
+        table = profile.format_table()
+        assert "t_code (c)" in table
+        assert "co_lnotab" in table
+
+
+def test_profile_running_python(tmp_path):
+    """Bytecode for the running Python is profiled too, rather than
+    handed to marshal, and so is fast_load."""
+    source = tmp_path / "mod.py"
+    source.write_text("def f(x):\n    return x + 1\n")
+    path = py_compile.compile(str(source), cfile=str(tmp_path / "mod.pyc"))
+    for fast_load in (False, True):
+        profile = UnmarshalProfile()
+        co = load_module(path, fast_load=fast_load, profile=profile)[3]
+        assert profile.as_dict()["total_bytes"] > 0
+        assert [code.co_name for code in profile.codes] == ["f", co.co_name]
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    test_unmarshal_profile()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_profile_running_python(Path(tmp))
@@ -26,11 +26,11 @@ __docformat__ = "restructuredtext"
 
 from xdis.bytecode import (
     Bytecode,
+    InstructionArray,
     get_instructions_bytes,
     list2bytecode,
     next_offset,
     offset2line,
-    op_has_argument,
 )
 from xdis.codetype import (
     Code2,
@@ -44,6 +44,7 @@ from xdis.codetype import (
 )
 from xdis.codetype.base import code_has_star_arg, code_has_star_star_arg, iscode
 from xdis.cross_dis import (
+    JumpTargetIndex,
     code_info,
     extended_arg_val,
     findlabels,
@@ -52,18 +53,24 @@ from xdis.cross_dis import (
     get_code_object,
     get_jump_target_maps,
     instruction_size,
+    op_has_argument,
     op_size,
     pretty_flags as pretty_code_flags,
     show_code,
 )
+from xdis.detect import detect_version
 from xdis.disasm import (
     disassemble_file,
+    disassemble_stream,
     disco_loop,
     disco_loop_asm_format,
     get_opcode,
     show_module_header,
 )
+from xdis.headerscan import scan_headers
+from xdis.headerwrite import rewrite_headers
 from xdis.instruction import Instruction
+from xdis.internpool import InternPool
 from xdis.lineoffsets import (
     LineOffsetInfo,
     LineOffsets,
@@ -76,11 +83,17 @@ from xdis.load import (
     is_bytecode_extension,
     is_pypy,
     is_python_source,
+    iter_stream_modules,
     load_file,
     load_module,
+    load_module_code,
+    load_module_from_archive,
     load_module_from_file_object,
+    load_module_index,
+    load_modules,
     write_bytecode_file,
 )
+from xdis.loadcache import LoadCache
 from xdis.magics import (
     PYTHON_MAGIC_INT,
     canonic_python_version,
@@ -112,6 +125,7 @@ from xdis.opcodes import (
     opcode_310,
     opcode_311,
 )
+from xdis.pycpack import PycPack, write_pack
 from xdis.util import (
     CO_ABSOLUTE_IMPORT,
     CO_ASYNC_GENERATOR,
@@ -151,6 +165,7 @@ from xdis.version_info import (
 __all__ = [
     # bytecode
     "Bytecode",
+    "InstructionArray",
     "get_instructions_bytes",
     "list2bytecode",
     "next_offset",
@@ -187,6 +202,7 @@ __all__ = [
     "codeType2Portable",
     "iscode",
     # cross_dis
+    "JumpTargetIndex",
     "code_info",
     "extended_arg_val",
     "findlinestarts",
@@ -204,14 +220,20 @@ __all__ = [
     "disco_loop",
     "disco_loop_asm_format",
     "disassemble_file",
+    "disassemble_stream",
     # load
     "check_object_path",
     "is_bytecode_extension",
     "is_pypy",
     "is_python_source",
+    "iter_stream_modules",
     "load_file",
     "load_module",
+    "load_module_code",
+    "load_module_from_archive",
     "load_module_from_file_object",
+    "load_module_index",
+    "load_modules",
     "write_bytecode_file",
     # lineoffsets
     "LineOffsetInfo",
@@ -221,6 +243,19 @@ __all__ = [
     "lineoffsets_in_module",
     # instruction
     "Instruction",
+    # detect
+    "detect_version",
+    # headerscan
+    "scan_headers",
+    # headerwrite
+    "rewrite_headers",
+    # internpool
+    "InternPool",
+    # loadcache
+    "LoadCache",
+    # pycpack
+    "PycPack",
+    "write_pack",
     # magic
     "canonic_python_version",
     "int2magic",
@@ -0,0 +1,77 @@
+# Mode: -*- python -*-
+# Copyright (c) 2024 by Rocky Bernstein <rb@dustyfeet.com>
+#
+# Note: we can't start with #! because setup.py bdist_wheel will look for that
+# and change that into something that's not portable. Thank you, Python!
+#
+#
+import os
+import sys
+
+import click
+
+from xdis.headerwrite import REWRITE_MODES, rewrite_headers
+from xdis.version import __version__
+
+if click.__version__ >= "7.":
+    case_sensitive = {"case_sensitive": False}
+else:
+    case_sensitive = {}
+
+
+@click.command()
+@click.option(
+    "--mode",
+    "-m",
+    type=click.Choice(REWRITE_MODES, **case_sensitive),
+    default="checked-hash",
+    show_default=True,
+    help="Kind of header to write.",
+)
+@click.option(
+    "--timestamp",
+    "-t",
+    type=int,
+    help="Timestamp to pin, for --mode timestamp. "
+    "Defaults to $SOURCE_DATE_EPOCH, or else the source's modification time.",
+)
+@click.option(
+    "--atomic/--in-place",
+    default=False,
+    help="Write a new file and rename it into place, "
+    "rather than overwriting the header.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    type=int,
+    default=16,
+    show_default=True,
+    help="Number of files rewritten at once.",
+)
+@click.version_option(version=__version__)
+@click.argument("paths", nargs=-1, type=click.Path(exists=True), required=True)
+def main(mode, timestamp, atomic: bool, workers: int, paths):
+    """Rewrites the headers of Python bytecode files, for reproducible builds.
+
+    PATHS are bytecode files, or directories which are searched for them.
+    Only the header of each file is changed: it is made a PEP 552
+    hash-based file, or given a fixed timestamp.
+    """
+    mode = mode.lower()
+    if timestamp is None and "SOURCE_DATE_EPOCH" in os.environ:
+        timestamp = int(os.environ["SOURCE_DATE_EPOCH"])
+
+    changed = errors = 0
+    for result in rewrite_headers(paths, mode, timestamp, atomic, workers):
+        if result.error is not None:
+            sys.stderr.write("%s: %s\n" % (result.filename, result.error))
+            errors += 1
+        elif result.changed:
+            changed += 1
+    print("%d bytecode files rewritten, %d with errors" % (changed, errors))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -13,7 +13,8 @@ import sys
 
 import click
 
-from xdis import disassemble_file
+from xdis import disassemble_file, disassemble_stream
+from xdis.load import split_archive_path
 from xdis.version import __version__
 from xdis.version_info import PYTHON_VERSION_STR, PYTHON_VERSION_TRIPLE
 
@@ -43,9 +44,15 @@ else:
     help="Intersperse Python source text from linecache if available.",
 )
 @click.version_option(version=__version__)
-@click.argument("files", nargs=-1, type=click.Path(readable=True), required=True)
+@click.argument(
+    "files",
+    nargs=-1,
+    type=click.Path(readable=True, allow_dash=True),
+    required=True,
+)
 def main(format, show_source: bool, files):
-    """Disassembles a Python bytecode file.
+    """Disassembles a Python bytecode file. Give "-" as a file to read
+    bytecode files, one after another, from standard input.
 
     We handle bytecode for virtually every release of Python and some releases of PyPy.
     The version of Python in the bytecode doesn't have to be the same version as
@@ -64,10 +71,18 @@ def main(format, show_source: bool, files):
         sys.exit(2)
 
     for path in files:
+        if path == "-":
+            # Bytecode files piped in, one after another.
+            disassemble_stream(
+                sys.stdin.buffer, sys.stdout, format, show_source=show_source
+            )
+            continue
+
         # Some sanity checks
         if not osp.exists(path):
-            sys.stderr.write("File name: '%s' doesn't exist\n" % path)
-            continue
+            if split_archive_path(path) is None:
+                sys.stderr.write("File name: '%s' doesn't exist\n" % path)
+                continue
         elif not osp.isfile(path):
             sys.stderr.write("File name: '%s' isn't a file\n" % path)
             continue
@@ -24,20 +24,22 @@ including those from Python 1.x and 2.x.
 import collections
 import inspect
 import sys
+from array import array
 from io import StringIO
 from linecache import getline
 from types import CodeType
 from typing import Iterable, Optional, Union
 
 from xdis.cross_dis import (
+    JumpTargetIndex,
     format_code_info,
     get_code_object,
     instruction_size,
-    op_has_argument,
 )
 from xdis.cross_types import UnicodeForPython3
 from xdis.instruction import Instruction
 from xdis.op_imports import get_opcode_module
+from xdis.opcodes.base import make_decoders
 from xdis.opcodes.opcode_36 import format_CALL_FUNCTION, format_CALL_FUNCTION_EX
 from xdis.util import code2num, num2code
 from xdis.version_info import IS_PYPY
@@ -223,6 +225,75 @@ def prefer_double_quote(string: str) -> str:
     return string
 
 
+def _resolve_arg(
+    decoder, arg, offset, bytecode, opc, varnames, names, constants, cells
+):
+    """Return the argval and argrepr of the instruction at `offset` in
+    `bytecode`, which `decoder` decodes and whose operand is `arg`.
+    """
+    #  Set argval to the dereferenced value of the argument when
+    #  available, and argrepr to the string representation of argval.
+    #    disassemble_bytes needs the string repr of the
+    #    raw name index for LOAD_GLOBAL, LOAD_CONST, etc.
+    argval = arg
+    argrepr = ""
+    # The offset of the next instruction
+    i = offset + decoder.size
+    resolver = decoder.resolver
+    if resolver is None:
+        pass
+    elif resolver == "const":
+        argval, argrepr = _get_const_info(arg, constants)
+    elif resolver == "name":
+        argval, argrepr = _get_name_info(arg, names)
+    elif resolver == "global":
+        argval, argrepr = _get_name_info(arg >> 1, names)
+        if arg & 1:
+            argrepr = "NULL + " + argrepr
+    elif resolver == "attr":
+        argval, argrepr = _get_name_info(arg >> 1, names)
+        if arg & 1:
+            argrepr = "NULL|self + " + argrepr
+    elif resolver == "super_attr":
+        argval, argrepr = _get_name_info(arg >> 2, names)
+        if arg & 1:
+            argrepr = "NULL|self + " + argrepr
+    elif resolver in ("jrel", "jrel_backward", "for_iter"):
+        signed_arg = -arg if resolver == "jrel_backward" else arg
+        argval = i + get_jump_val(signed_arg, opc.python_version)
+        # FOR_ITER has a cache instruction in 3.12
+        if resolver == "for_iter":
+            argval += 2
+        argrepr = "to " + repr(argval)
+    elif resolver == "jabs":
+        argval = get_jump_val(arg, opc.python_version)
+        argrepr = "to " + repr(argval)
+    elif resolver == "localplus":
+        argval, argrepr = _get_name_info(
+            arg, (varnames or tuple()) + (cells or tuple())
+        )
+    elif resolver == "local":
+        argval, argrepr = _get_name_info(arg, varnames)
+    elif resolver == "free":
+        argval, argrepr = _get_name_info(arg, cells)
+    elif resolver == "compare":
+        argval = argrepr = opc.cmp_op[arg]
+    elif resolver == "compare_shifted":
+        argval = argrepr = opc.cmp_op[arg >> 4]
+    elif resolver == "call_function":
+        argrepr = format_CALL_FUNCTION(code2num(bytecode, i - 1))
+    elif resolver == "call_function_ex":
+        argrepr = format_CALL_FUNCTION_EX(code2num(bytecode, i - 1))
+    elif resolver == "nargs":
+        argrepr = "%d positional, %d named" % (
+            code2num(bytecode, i - 2),
+            code2num(bytecode, i - 1),
+        )
+    if decoder.formatter is not None:
+        argrepr = decoder.formatter(arg)
+    return argval, argrepr
+
+
 def get_instructions_bytes(
     bytecode,
     opc,
@@ -233,6 +304,7 @@ def get_instructions_bytes(
     linestarts=None,
     line_offset=0,
     exception_entries=None,
+    jump_targets=None,
 ):
     """Iterate over the instructions in a bytecode string.
 
@@ -241,15 +313,12 @@ def get_instructions_bytes(
     e.g., variable names, constants, can be specified using optional
     arguments.
 
+    `jump_targets` is the JumpTargetIndex of `bytecode` and
+    `exception_entries`, if it has already been made.
     """
-    labels = opc.findlabels(bytecode, opc)
-
-    if exception_entries is not None:
-        for start, end, target, _, _ in exception_entries:
-            for i in range(start, end):
-                labels.append(target)
-
-    # label_maps = get_jump_target_maps(bytecode, opc)
+    if jump_targets is None:
+        jump_targets = JumpTargetIndex(bytecode, opc, exception_entries)
+    labels = jump_targets.labels
 
     # FIXME: We really need to distinguish 3.6.0a1 from 3.6.a3.
     # See below FIXME
@@ -262,13 +331,22 @@ def get_instructions_bytes(
     i = 0
     extended_arg_count = 0
     extended_arg = 0
-    if hasattr(opc, "EXTENDED_ARG"):
-        extended_arg_size = instruction_size(opc.EXTENDED_ARG, opc)
+
+    # What can be worked out from the opcode alone is looked up here,
+    # rather than worked out for each instruction.
+    decoders = getattr(opc, "opcode_decoders", None)
+    if decoders is None:
+        decoders = make_decoders(vars(opc))
+    extended_arg_op = getattr(opc, "EXTENDED_ARG", None)
+    if extended_arg_op is not None:
+        extended_arg_size = decoders[extended_arg_op].size
     else:
         extended_arg_size = 0
+    oppop = opc.oppop
 
     while i < n:
         op = code2num(bytecode, i)
+        decoder = decoders[op]
 
         offset = i
         if linestarts is not None:
@@ -282,14 +360,12 @@ def get_instructions_bytes(
 
         i += 1
         arg = None
-        argval = None
-        argrepr = ""
-        has_arg = op_has_argument(op, opc)
-        optype = get_optype(op, opc)
+        has_arg = decoder.has_arg
+        optype = decoder.optype
         if has_arg:
             if python_36:
                 arg = code2num(bytecode, i) | extended_arg
-                extended_arg = (arg << 8) if op == opc.EXTENDED_ARG else 0
+                extended_arg = (arg << 8) if op == extended_arg_op else 0
                 # FIXME: Python 3.6.0a1 is 2, for 3.6.a3 we have 1
                 i += 1
             else:
@@ -299,97 +375,17 @@ def get_instructions_bytes(
                     + extended_arg
                 )
                 i += 2
-                extended_arg = (
-                    arg * 0x10000
-                    if hasattr(opc, "EXTENDED_ARG") and op == opc.EXTENDED_ARG
-                    else 0
-                )
-
-            #  Set argval to the dereferenced value of the argument when
-            #  available, and argrepr to the string representation of argval.
-            #    disassemble_bytes needs the string repr of the
-            #    raw name index for LOAD_GLOBAL, LOAD_CONST, etc.
-
-            argval = arg
-            if op in opc.CONST_OPS:
-                argval, argrepr = _get_const_info(arg, constants)
-            elif op in opc.NAME_OPS:
-                if opc.version_tuple >= (3, 11) and opc.opname[op] == "LOAD_GLOBAL":
-                    argval, argrepr = _get_name_info(arg >> 1, names)
-                    if arg & 1:
-                        argrepr = "NULL + " + argrepr
-                elif opc.version_tuple >= (3, 12) and opc.opname[op] == "LOAD_ATTR":
-                    argval, argrepr = _get_name_info(arg >> 1, names)
-                    if arg & 1:
-                        argrepr = "NULL|self + " + argrepr
-                elif (
-                    opc.version_tuple >= (3, 12) and opc.opname[op] == "LOAD_SUPER_ATTR"
-                ):
-                    argval, argrepr = _get_name_info(arg >> 2, names)
-                    if arg & 1:
-                        argrepr = "NULL|self + " + argrepr
-                else:
-                    argval, argrepr = _get_name_info(arg, names)
-            elif op in opc.JREL_OPS:
-                signed_arg = -arg if "JUMP_BACKWARD" in opc.opname[op] else arg
-                argval = i + get_jump_val(signed_arg, opc.python_version)
-                # FOR_ITER has a cache instruction in 3.12
-                if opc.version_tuple >= (3, 12) and opc.opname[op] == "FOR_ITER":
-                    argval += 2
-                argrepr = "to " + repr(argval)
-            elif op in opc.JABS_OPS:
-                argval = get_jump_val(arg, opc.python_version)
-                argrepr = "to " + repr(argval)
-            elif op in opc.LOCAL_OPS:
-                if opc.version_tuple >= (3, 11):
-                    argval, argrepr = _get_name_info(
-                        arg, (varnames or tuple()) + (cells or tuple())
-                    )
-                else:
-                    argval, argrepr = _get_name_info(arg, varnames)
-            elif op in opc.FREE_OPS:
-                if opc.version_tuple >= (3, 11):
-                    argval, argrepr = _get_name_info(
-                        arg, (varnames or tuple()) + (cells or tuple())
-                    )
-                else:
-                    argval, argrepr = _get_name_info(arg, cells)
-            elif op in opc.COMPARE_OPS:
-                argval = (
-                    opc.cmp_op[arg >> 4]
-                    if opc.python_version >= (3, 12)
-                    else opc.cmp_op[arg]
-                )
-                argrepr = argval
-            elif op in opc.NARGS_OPS:
-                opname = opc.opname[op]
-                if python_36 and opname in ("CALL_FUNCTION", "CALL_FUNCTION_EX"):
-                    if opname == "CALL_FUNCTION":
-                        argrepr = format_CALL_FUNCTION(code2num(bytecode, i - 1))
-                    else:
-                        assert opname == "CALL_FUNCTION_EX"
-                        argrepr = format_CALL_FUNCTION_EX(code2num(bytecode, i - 1))
-                else:
-                    if not (
-                        python_36
-                        or opname in ("RAISE_VARARGS", "DUP_TOPX", "MAKE_FUNCTION")
-                    ):
-                        argrepr = "%d positional, %d named" % (
-                            code2num(bytecode, i - 2),
-                            code2num(bytecode, i - 1),
-                        )
-            if hasattr(opc, "opcode_arg_fmt") and opc.opname[op] in opc.opcode_arg_fmt:
-                argrepr = opc.opcode_arg_fmt[opc.opname[op]](arg)
-        else:
-            if python_36:
-                i += 1
-            if hasattr(opc, "opcode_arg_fmt") and opc.opname[op] in opc.opcode_arg_fmt:
-                argrepr = opc.opcode_arg_fmt[opc.opname[op]](arg)
+                extended_arg = arg * 0x10000 if op == extended_arg_op else 0
+        elif python_36:
+            i += 1
+        argval, argrepr = _resolve_arg(
+            decoder, arg, offset, bytecode, opc, varnames, names, constants, cells
+        )
 
-        opname = opc.opname[op]
-        inst_size = instruction_size(op, opc) + (extended_arg_count * extended_arg_size)
+        opname = decoder.opname
+        inst_size = decoder.size + (extended_arg_count * extended_arg_size)
         # fallthrough = op not in opc.nofollow
-        start_offset = offset if opc.oppop[op] == 0 else None
+        start_offset = offset if oppop[op] == 0 else None
 
         yield Instruction(
             is_jump_target=is_jump_target,
@@ -410,11 +406,7 @@ def get_instructions_bytes(
             start_offset=start_offset,
         )
         # fallthrough
-        extended_arg_count = (
-            extended_arg_count + 1
-            if hasattr(opc, "EXTENDED_ARG") and op == opc.EXTENDED_ARG
-            else 0
-        )
+        extended_arg_count = extended_arg_count + 1 if op == extended_arg_op else 0
 
 
 def next_offset(op: int, opc, offset: int) -> int:
@@ -425,6 +417,211 @@ def next_offset(op: int, opc, offset: int) -> int:
     return offset + instruction_size(op, opc)
 
 
+class InstructionArray:
+    """The instructions in a bytecode string, as get_instructions_bytes()
+    gives them, but decoded in a single pass into compact arrays, with
+    one entry for each instruction:
+
+      * ``opcodes``, the opcode;
+      * ``args``, the operand, including any EXTENDED_ARG prefixes. For
+        instructions without an operand, this is meaningless;
+      * ``offsets``, the offset of the instruction;
+      * ``sizes``, the instruction's ``inst_size``;
+      * ``line_starts``, the line that the instruction starts, or -1.
+
+    An Instruction, with its argval and argrepr, is made only when it
+    is asked for, by index or with at_offset(). The parameters are
+    those of get_instructions_bytes().
+    """
+
+    def __init__(
+        self,
+        bytecode,
+        opc,
+        varnames=None,
+        names=None,
+        constants=None,
+        cells=None,
+        linestarts=None,
+        line_offset=0,
+        exception_entries=None,
+        jump_targets=None,
+    ):
+        self.bytecode = bytecode
+        self.opc = opc
+        self.varnames = varnames
+        self.names = names
+        self.constants = constants
+        self.cells = cells
+        self.exception_entries = exception_entries
+        self._jump_targets = jump_targets
+
+        decoders = getattr(opc, "opcode_decoders", None)
+        if decoders is None:
+            decoders = make_decoders(vars(opc))
+        self._decoders = decoders
+        self._offset2index = None
+
+        self._wordcode = opc.python_version >= (3, 6)
+        if self._wordcode and isinstance(bytecode, (bytes, bytearray)):
+            self._decode_wordcode(linestarts, line_offset)
+        else:
+            self._decode(linestarts, line_offset)
+
+    def _decode(self, linestarts, line_offset):
+        bytecode = self.bytecode
+        decoders = self._decoders
+        python_36 = self._wordcode
+        extended_arg_op = getattr(self.opc, "EXTENDED_ARG", None)
+        if extended_arg_op is not None:
+            extended_arg_size = decoders[extended_arg_op].size
+        else:
+            extended_arg_size = 0
+
+        self.opcodes = opcodes = array("B")
+        self.args = args = array("q")
+        self.offsets = offsets = array("l")
+        self.sizes = sizes = array("H")
+        self.line_starts = line_starts = array("l")
+
+        n = len(bytecode)
+        i = 0
+        extended_arg_count = 0
+        extended_arg = 0
+        while i < n:
+            op = code2num(bytecode, i)
+            decoder = decoders[op]
+            opcodes.append(op)
+            offsets.append(i)
+            starts_line = None
+            if linestarts is not None:
+                starts_line = linestarts.get(i, None)
+            line_starts.append(-1 if starts_line is None else starts_line + line_offset)
+
+            arg = 0
+            if decoder.has_arg:
+                if python_36:
+                    arg = code2num(bytecode, i + 1) | extended_arg
+                    extended_arg = (arg << 8) if op == extended_arg_op else 0
+                else:
+                    arg = (
+                        code2num(bytecode, i + 1)
+                        + code2num(bytecode, i + 2) * 0x100
+                        + extended_arg
+                    )
+                    extended_arg = arg * 0x10000 if op == extended_arg_op else 0
+            args.append(arg)
+            sizes.append(decoder.size + (extended_arg_count * extended_arg_size))
+            extended_arg_count = extended_arg_count + 1 if op == extended_arg_op else 0
+            i += decoder.size
+
+    def _decode_wordcode(self, linestarts, line_offset):
+        # Every instruction is two bytes, so the arrays can be filled from
+        # slices of the bytecode. Only EXTENDED_ARG needs work done on it.
+        bytecode = self.bytecode
+        n = len(bytecode) & ~1
+        count = n >> 1
+        self.opcodes = opcodes = array("B", bytecode[0:n:2])
+        self.args = args = array("q", list(bytecode[1:n:2]))
+        self.offsets = array("l", range(0, n, 2))
+        self.sizes = sizes = array("H", [2]) * count
+        self.line_starts = line_starts = array("l", [-1]) * count
+        if linestarts is not None:
+            for offset, line in linestarts.items():
+                if line is not None and 0 <= offset < n and not offset & 1:
+                    line_starts[offset >> 1] = line + line_offset
+
+        extended_arg_op = getattr(self.opc, "EXTENDED_ARG", None)
+        if extended_arg_op is None or extended_arg_op not in opcodes:
+            return
+        decoders = self._decoders
+        extended_arg_count = 0
+        extended_arg = 0
+        for index, op in enumerate(opcodes):
+            if decoders[op].has_arg:
+                arg = args[index] | extended_arg
+                args[index] = arg
+                extended_arg = (arg << 8) if op == extended_arg_op else 0
+            sizes[index] = 2 + 2 * extended_arg_count
+            extended_arg_count = extended_arg_count + 1 if op == extended_arg_op else 0
+
+    @property
+    def jump_targets(self):
+        """The JumpTargetIndex of the bytecode, made the first time it is
+        asked for."""
+        if self._jump_targets is None:
+            self._jump_targets = JumpTargetIndex(
+                self.bytecode, self.opc, self.exception_entries
+            )
+        return self._jump_targets
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.opcodes)))]
+        op = self.opcodes[index]
+        offset = self.offsets[index]
+        size = self.sizes[index]
+        starts_line = self.line_starts[index]
+        decoder = self._decoders[op]
+        arg = self.args[index] if decoder.has_arg else None
+        argval, argrepr = _resolve_arg(
+            decoder,
+            arg,
+            offset,
+            self.bytecode,
+            self.opc,
+            self.varnames,
+            self.names,
+            self.constants,
+            self.cells,
+        )
+        return Instruction(
+            is_jump_target=offset in self.jump_targets.labels,
+            starts_line=None if starts_line == -1 else starts_line,
+            offset=offset,
+            opname=decoder.opname,
+            opcode=op,
+            has_arg=decoder.has_arg,
+            arg=arg,
+            argval=argval,
+            argrepr=argrepr,
+            tos_str=None,
+            positions=None,
+            optype=decoder.optype,
+            inst_size=size,
+            has_extended_arg=size != decoder.size,
+            fallthrough=None,
+            start_offset=offset if self.opc.oppop[op] == 0 else None,
+        )
+
+    def __iter__(self):
+        for index in range(len(self.opcodes)):
+            yield self[index]
+
+    def offset2index(self, offset: int) -> int:
+        """Return the index of the instruction at `offset`. Raise
+        ValueError if no instruction starts there."""
+        if self._wordcode:
+            index = offset >> 1
+            if 0 <= offset and not offset & 1 and index < len(self.opcodes):
+                return index
+        else:
+            if self._offset2index is None:
+                self._offset2index = {
+                    offset: index for index, offset in enumerate(self.offsets)
+                }
+            if offset in self._offset2index:
+                return self._offset2index[offset]
+        raise ValueError("no instruction starts at offset %r" % (offset,))
+
+    def at_offset(self, offset: int):
+        """Return the Instruction at `offset`."""
+        return self[self.offset2index(offset)]
+
+
 class Bytecode:
     """Bytecode operations involving a Python code object.
 
@@ -459,6 +656,7 @@ class Bytecode:
             self.exception_entries = parse_exception_table(co.co_exceptiontable)
         else:
             self.exception_entries = None
+        self._jump_targets = None
 
     def __iter__(self):
         co = self.codeobj
@@ -472,6 +670,34 @@ class Bytecode:
             self._linestarts,
             line_offset=self._line_offset,
             exception_entries=self.exception_entries,
+            jump_targets=self.jump_targets,
+        )
+
+    @property
+    def jump_targets(self):
+        """The JumpTargetIndex of the code, made the first time it is
+        asked for."""
+        if self._jump_targets is None:
+            self._jump_targets = JumpTargetIndex(
+                self.codeobj.co_code, self.opc, self.exception_entries
+            )
+        return self._jump_targets
+
+    def instruction_array(self):
+        """Return an InstructionArray of the instructions, which are
+        those that iterating over this gives."""
+        co = self.codeobj
+        return InstructionArray(
+            co.co_code,
+            self.opc,
+            co.co_varnames,
+            co.co_names,
+            co.co_consts,
+            self._cell_names,
+            self._linestarts,
+            line_offset=self._line_offset,
+            exception_entries=self.exception_entries,
+            jump_targets=self._jump_targets,
         )
 
     def __repr__(self):
@@ -531,6 +757,7 @@ class Bytecode:
             show_source=show_source,
             first_line_number=first_line_number,
             exception_entries=self.exception_entries,
+            jump_targets=self.jump_targets,
         )
         return output.getvalue()
 
@@ -562,6 +789,7 @@ class Bytecode:
         show_source=True,
         first_line_number: Optional[int] = None,
         exception_entries=None,
+        jump_targets=None,
     ) -> list:
         # Omit the line number column entirely if we have no line number info
         show_lineno = line_starts is not None or self.opc.version_tuple < (2, 3)
@@ -608,6 +836,7 @@ class Bytecode:
             line_starts,
             line_offset=line_offset,
             exception_entries=exception_entries,
+            jump_targets=jump_targets,
         ):
             # Python 1.x into early 2.0 uses SET_LINENO
             if last_was_set_lineno:
@@ -0,0 +1,242 @@
+# Copyright (c) 2024 by Rocky Bernstein
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+An index of where each code object lies in marshal data, so that a
+single code object can later be decoded without decoding everything
+before it.
+
+Besides the span of each code object, the index records where each
+object that can be the target of a back-reference (FLAG_REF) starts,
+and, for Python 2 bytecode, the interned strings. That is enough to
+restore the reference tables that a code object might need when it is
+decoded on its own.
+"""
+
+import json
+from collections import namedtuple
+from typing import List, Optional
+
+from xdis.unmarshal import (
+    FLAG_REF,
+    _code_record_type,
+    _LazyRef,
+    _VersionIndependentUnmarshaller,
+)
+
+# Version number of the sidecar file format.
+CODE_INDEX_FORMAT = 1
+
+# start and end are the span of the code object in the marshal data.
+# ref_index is the reference-table slot that the code object, or the first
+# object inside it, gets.
+CodeIndexEntry = namedtuple(
+    "CodeIndexEntry", "start end co_name co_qualname co_firstlineno ref_index"
+)
+
+
+class CodeIndex:
+    """
+    Where the code objects in some marshal data lie, along with what is
+    needed to decode them individually. See ``build_code_index()``.
+    """
+
+    def __init__(
+        self,
+        magic_int: int,
+        entries: List[CodeIndexEntry],
+        refs: list,
+        interned: list,
+        header: bytes = b"",
+        size: Optional[int] = None,
+    ):
+        self.magic_int = magic_int
+        # Innermost code objects come first, as in iter_code_objects().
+        self.entries = entries
+        # (offset, bytes_for_s) of each reference-table slot.
+        self.refs = refs
+        # Interned strings, used before Python 3.4.
+        self.interned = interned
+        # When the index is for a bytecode file, the file's header and size.
+        # These are used to check that a saved index is still current.
+        self.header = header
+        self.size = size
+
+    def find(self, name: str, firstlineno: Optional[int] = None) -> list:
+        """
+        Return the entries for code objects whose ``co_name`` or
+        ``co_qualname`` is ``name`` and, if given, whose ``co_firstlineno``
+        is ``firstlineno``.
+        """
+        return [
+            entry
+            for entry in self.entries
+            if name in (entry.co_name, entry.co_qualname)
+            and (firstlineno is None or entry.co_firstlineno == firstlineno)
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "format": CODE_INDEX_FORMAT,
+                "magic_int": self.magic_int,
+                "header": self.header.hex(),
+                "size": self.size,
+                "entries": [
+                    [_encode_str(field) for field in entry] for entry in self.entries
+                ],
+                "refs": [list(ref) for ref in self.refs],
+                "interned": [_encode_str(s) for s in self.interned],
+            },
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, text: str):
+        data = json.loads(text)
+        if data.get("format") != CODE_INDEX_FORMAT:
+            raise ValueError("unsupported code index format %r" % data.get("format"))
+        return cls(
+            magic_int=data["magic_int"],
+            entries=[
+                CodeIndexEntry(*[_decode_str(field) for field in entry])
+                for entry in data["entries"]
+            ],
+            refs=[tuple(ref) for ref in data["refs"]],
+            interned=[_decode_str(s) for s in data["interned"]],
+            header=bytes.fromhex(data["header"]),
+            size=data["size"],
+        )
+
+    def save(self, path: str):
+        with open(path, "w") as fp:
+            fp.write(self.to_json())
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r") as fp:
+            return cls.from_json(fp.read())
+
+
+def _encode_str(s):
+    # Strings that aren't UTF-8 are kept as bytes.
+    if isinstance(s, bytes):
+        return {"bytes": s.hex()}
+    return s
+
+
+def _decode_str(s):
+    if isinstance(s, dict):
+        return bytes.fromhex(s["bytes"])
+    return s
+
+
+class _IndexingUnmarshaller(_VersionIndependentUnmarshaller):
+    """
+    Walks marshal data recording a CodeIndexEntry for each code object,
+    and where each reference-table entry comes from. Only the fields that
+    go into the index are decoded; everything else is skipped over.
+    """
+
+    def __init__(self, fp, magic_int):
+        # The reference slots of containers handed to marshal would not be
+        # recorded in ref_offsets.
+        super().__init__(fp, magic_int, False, native=False)
+        self.projection = frozenset(("co_name", "co_qualname", "co_firstlineno"))
+        self.code_record = _code_record_type(
+            ("co_name", "co_qualname", "co_firstlineno")
+        )
+        self.entries = []
+        self.ref_offsets = {}
+        self.object_start = 0
+        self.object_bytes_for_s = False
+
+    def r_object(self, bytes_for_s=False):
+        self.object_start = self.offset
+        self.object_bytes_for_s = bytes_for_s
+        return super().r_object(bytes_for_s)
+
+    def r_ref_reserve(self, obj, save_ref):
+        obj, i = super().r_ref_reserve(obj, save_ref)
+        if i is not None:
+            # When replaying, the slot may have been filled by s_object()
+            # without going through here.
+            self.ref_offsets.setdefault(i, (self.object_start, self.object_bytes_for_s))
+        return obj, i
+
+    def p_code(self):
+        # The code object's type code has just been read.
+        start = self.offset - 1
+        ref_index = self.r_next_ref()
+        if self.buffer[start] & FLAG_REF:
+            ref_index -= 1
+        record = super().p_code()
+        self.entries.append(
+            CodeIndexEntry(
+                start,
+                self.offset,
+                record.co_name,
+                record.co_qualname,
+                record.co_firstlineno,
+                ref_index,
+            )
+        )
+        return record
+
+    def refs(self) -> list:
+        refs = []
+        for i, obj in enumerate(self.internObjects):
+            if isinstance(obj, _LazyRef):
+                refs.append((obj.offset, obj.bytes_for_s))
+            else:
+                refs.append(self.ref_offsets[i])
+        return refs
+
+
+def build_code_index(fp, magic_int: int) -> CodeIndex:
+    """
+    Build a CodeIndex for the marshal data in ``fp`` for bytecode with
+    magic ``magic_int``. ``fp`` is handled as in
+    ``xdis.unmarshal.load_code()``, and offsets in the index are relative
+    to the start of it.
+    """
+    um_gen = _IndexingUnmarshaller(fp, magic_int)
+    try:
+        um_gen.load()
+        return CodeIndex(
+            magic_int, um_gen.entries, um_gen.refs(), list(um_gen.internStrings)
+        )
+    finally:
+        um_gen.buffer.release()
+
+
+def load_code_at(fp, index: CodeIndex, entry: CodeIndexEntry):
+    """
+    Decode just the code object for ``entry`` in ``index`` from the marshal
+    data in ``fp``, which must be the data the index was built from.
+    Objects outside the code object that it refers to are decoded as
+    needed.
+    """
+    um_gen = _VersionIndependentUnmarshaller(fp, index.magic_int, False)
+    um_gen.internObjects = [
+        _LazyRef(offset, i, bytes_for_s)
+        for i, (offset, bytes_for_s) in enumerate(index.refs)
+    ]
+    um_gen.internStrings = list(index.interned)
+    try:
+        return um_gen.decode_at(entry.start, entry.ref_index)
+    finally:
+        um_gen.buffer.release()
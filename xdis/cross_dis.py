@@ -70,50 +70,122 @@ def get_code_object(x):
     raise TypeError("don't know how to disassemble %s objects" % type(x).__name__)
 
 
-def findlabels(code, opc):
-    if opc.version_tuple < (3, 10):
-        return findlabels_pre_310(code, opc)
-    else:
-        return findlabels_310(code, opc)
-
-
-def findlabels_310(code: bytes, opc):
-    """Returns a list of instruction offsets in the supplied bytecode
-    which are the targets of some sort of jump instruction.
+class JumpTargetIndex:
+    """The jump targets of some bytecode, found in a single pass over it.
+
+    ``sources`` maps each offset that is jumped to, to the offsets of
+    the instructions that jump there, in order. ``targets`` is the set
+    of those offsets, and ``handlers`` the set of exception handler
+    offsets in `exception_entries`, as parse_exception_table() gives
+    them for 3.11 and later. ``labels`` is both of these together: the
+    instructions that disassembly marks as jump targets.
+
+    A jump's target is the ``argval`` that get_instructions_bytes()
+    gives its instruction.
     """
-    labels = []
-    for offset, op, arg in unpack_opargs_bytecode_310(code, opc):
-        if arg is not None:
-            if op in opc.JREL_OPS:
-                if opc.version_tuple >= (3, 11) and "JUMP_BACKWARD" in opc.opname[op]:
-                    arg = -arg
-                label = offset + 2 + arg * 2
-            elif op in opc.JABS_OPS:
-                label = arg * 2
+
+    def __init__(self, code, opc, exception_entries=None):
+        try:
+            n = len(code)
+        except TypeError:
+            code = code.co_code
+            n = len(code)
+
+        decoders = getattr(opc, "opcode_decoders", None)
+        if decoders is None:
+            from xdis.opcodes.base import make_decoders
+
+            decoders = make_decoders(vars(opc))
+        python_36 = opc.python_version >= (3, 6)
+        jump_scale = 2 if opc.python_version[:2] >= (3, 10) else 1
+        extended_arg_op = getattr(opc, "EXTENDED_ARG", None)
+        nofollow = opc.NOFOLLOW
+
+        # Offsets of all instructions, and of those that don't fall
+        # through to the next, for jump_target_maps().
+        self.offsets = offsets = []
+        self._stops = stops = set()
+        self._jumps = jumps = {}
+        sources = {}
+
+        i = 0
+        extended_arg = 0
+        while i < n:
+            op = code2num(code, i)
+            decoder = decoders[op]
+            offset = i
+            offsets.append(offset)
+            if op in nofollow:
+                stops.add(offset)
+            i += decoder.size
+            if not decoder.has_arg:
+                continue
+            if python_36:
+                arg = code2num(code, offset + 1) | extended_arg
+                extended_arg = (arg << 8) if op == extended_arg_op else 0
+            else:
+                arg = (
+                    code2num(code, offset + 1)
+                    + code2num(code, offset + 2) * 0x100
+                    + extended_arg
+                )
+                extended_arg = arg * 0x10000 if op == extended_arg_op else 0
+
+            resolver = decoder.resolver
+            if resolver == "jrel":
+                target = i + arg * jump_scale
+            elif resolver == "jabs":
+                target = arg * jump_scale
+            elif resolver == "jrel_backward":
+                target = i - arg * jump_scale
+            elif resolver == "for_iter":
+                target = i + arg * jump_scale + 2
             else:
                 continue
-            if label not in labels:
-                labels.append(label)
-    return labels
+            if target < 0:
+                continue
+            jumps[offset] = target
+            if target in sources:
+                sources[target].append(offset)
+            else:
+                sources[target] = [offset]
+
+        self.sources = sources
+        self.targets = frozenset(sources)
+        if exception_entries:
+            self.handlers = frozenset(
+                target for start, end, target, _, _ in exception_entries if end > start
+            )
+        else:
+            self.handlers = frozenset()
+        self.labels = self.targets | self.handlers
+
+    def jump_target_maps(self) -> dict:
+        """Return what get_jump_target_maps() does: a dictionary from
+        each instruction offset which can be reached, to the offsets of
+        the instructions which can run just before it.
+        """
+        offset2prev = {}
+        prev_offset = -1
+        jumps = self._jumps
+        for offset in self.offsets:
+            if prev_offset >= 0:
+                offset2prev.setdefault(offset, []).append(prev_offset)
+            prev_offset = -1 if offset in self._stops else offset
+            if offset in jumps:
+                offset2prev.setdefault(jumps[offset], []).append(offset)
+        return offset2prev
 
 
-def findlabels_pre_310(code, opc):
+def findlabels(code, opc):
     """Returns a list of instruction offsets in the supplied bytecode
     which are the targets of some sort of jump instruction.
     """
-    offsets = []
-    for offset, op, arg in unpack_opargs_bytecode(code, opc):
-        if arg is not None:
-            jump_offset = -1
-            if op in opc.JREL_OPS:
-                op_len = op_size(op, opc)
-                jump_offset = offset + op_len + arg
-            elif op in opc.JABS_OPS:
-                jump_offset = arg
-            if jump_offset >= 0:
-                if jump_offset not in offsets:
-                    offsets.append(jump_offset)
-    return offsets
+    return list(JumpTargetIndex(code, opc).sources)
+
+
+# For compatibility
+findlabels_310 = findlabels_pre_310 = findlabels
 
 
 # For the `co_lines` attribute, we want to emit the full form, omitting
@@ -386,29 +458,7 @@ def get_jump_target_maps(code, opc):
     instructions. The values of the dictionary may be useful in control-flow
     analysis.
     """
-    offset2prev = {}
-    prev_offset = -1
-    for offset, op, arg in unpack_opargs_bytecode(code, opc):
-        if prev_offset >= 0:
-            prev_list = offset2prev.get(offset, [])
-            prev_list.append(prev_offset)
-            offset2prev[offset] = prev_list
-        if op in opc.NOFOLLOW:
-            prev_offset = -1
-        else:
-            prev_offset = offset
-        if arg is not None:
-            jump_offset = -1
-            if op in opc.JREL_OPS:
-                op_len = op_size(op, opc)
-                jump_offset = offset + op_len + arg
-            elif op in opc.JABS_OPS:
-                jump_offset = arg
-            if jump_offset >= 0:
-                prev_list = offset2prev.get(jump_offset, [])
-                prev_list.append(offset)
-                offset2prev[jump_offset] = prev_list
-    return offset2prev
+    return JumpTargetIndex(code, opc).jump_target_maps()
 
 
 # In CPython, this is C code. We redo this in Python using the
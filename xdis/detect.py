@@ -0,0 +1,289 @@
+# Copyright (c) 2024 by Rocky Bernstein
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Guess the Python version of a marshaled code object that has no
+bytecode file header, such as one taken from a frozen module, a
+PyInstaller archive or a memory dump.
+
+Each candidate version is first checked against the start of the
+code object: its fixed-size integer fields and the length of co_code.
+Most candidates fail there. The ones left are unmarshalled, and scored
+by how much of the bytecode in all of their code objects is made of
+opcodes that the version has.
+"""
+
+import multiprocessing
+from collections import namedtuple
+from struct import error as StructError, unpack_from
+
+from xdis.disasm import get_opcode
+from xdis.magics import magic2int, magic_int2tuple, magicint2version, magics
+from xdis.unmarshal import (
+    FLAG_REF,
+    UnmarshalLimits,
+    _VersionIndependentUnmarshaller,
+    get_code_layout,
+)
+
+# A guess at the version of a marshaled code object. score is between
+# 0 and 1: the fraction of instructions whose opcodes are valid and of
+# jumps whose targets are instructions, less a little if the marshal
+# data doesn't end where the code object does.
+VersionGuess = namedtuple("VersionGuess", "magic_int version is_pypy score")
+
+# A version to try. magic_int is the one used to unmarshal with, and
+# decode_key is the same for candidates that unmarshal the same way.
+_Candidate = namedtuple("_Candidate", "magic_int version is_pypy layout opc decode_key")
+
+# Limits on unmarshalling a candidate, which is often garbage.
+DETECT_MAX_DEPTH = 100
+
+# Bounds for the integer fields of a plausible code object.
+MAX_PLAUSIBLE_COUNT = 1 << 16
+MAX_PLAUSIBLE_FLAGS = 1 << 30
+
+# Bytecode for these isn't tried: it isn't Python's, or it is a
+# modified Python's.
+SKIPPED_VARIANTS = ("Graal", "Jython", "Pyston", "pyston", "dropbox")
+
+_candidates = None
+
+
+def candidates():
+    """Return the versions tried by detect_version(), one for each
+    Python version and implementation that xdis has opcodes for.
+    """
+    global _candidates
+    if _candidates is not None:
+        return _candidates
+
+    latest = {}
+    for magic_int, version_str in sorted(magicint2version.items()):
+        if any(variant in version_str for variant in SKIPPED_VARIANTS):
+            continue
+        try:
+            version = magic_int2tuple(magic_int)
+        except Exception:
+            continue
+        latest[version[:2], "pypy" in version_str] = magic_int
+
+    by_version = {}
+    for (version, pypy), magic_int in latest.items():
+        # Use the magic of the release, if xdis has it.
+        name = "%d.%d%s" % (version + ("pypy" if pypy else "",))
+        if name in magics:
+            magic_int = magic2int(magics[name])
+        try:
+            opc = get_opcode(version, pypy)
+            layout = get_code_layout(magic_int)
+        except Exception:
+            continue
+        by_version[version, pypy] = _Candidate(
+            magic_int,
+            version,
+            pypy,
+            layout,
+            opc,
+            (id(layout), version >= (3, 0), version >= (3, 4)),
+        )
+    # Newest first, and CPython before PyPy.
+    _candidates = sorted(
+        by_version.values(),
+        key=lambda c: (c.version, not c.is_pypy),
+        reverse=True,
+    )
+    return _candidates
+
+
+def plausible_start(data, candidate) -> bool:
+    """Return whether `data` could start with a code object marshaled by
+    `candidate`'s version, going by the code object's fixed-size fields
+    and the length of co_code.
+    """
+    code_type = data[0] & ~FLAG_REF if candidate.version >= (3, 4) else data[0]
+    if code_type != ord("c") and not (
+        # Python 1.0 to 1.2
+        code_type == ord("C")
+        and candidate.version < (1, 3)
+    ):
+        return False
+    offset = 1
+    layout = candidate.layout
+    try:
+        if layout.header is not None:
+            for name, value in zip(
+                layout.header_fields, layout.header.unpack_from(data, offset)
+            ):
+                if name == "co_flags":
+                    bound = MAX_PLAUSIBLE_FLAGS
+                else:
+                    bound = MAX_PLAUSIBLE_COUNT
+                if not 0 <= value < bound:
+                    return False
+            offset += layout.header.size
+        string_type = data[offset]
+        if candidate.version >= (3, 4):
+            string_type &= ~FLAG_REF
+        if string_type != ord("s"):
+            return False
+        code_size = unpack_from("<i", data, offset + 1)[0]
+    except (IndexError, StructError):
+        return False
+    if not 0 < code_size <= len(data) - offset - 5:
+        return False
+    return candidate.version < (3, 6) or code_size % 2 == 0
+
+
+class _DetectUnmarshaller(_VersionIndependentUnmarshaller):
+    def r_unknown(self, byte1: int):
+        # Rather than reporting it and going on, give up on the candidate.
+        raise ValueError("unknown marshal type %d" % byte1)
+
+
+def _decode(data, candidate):
+    """Unmarshal `data` as `candidate`'s version. Return the code object
+    and the number of bytes used, or None if it can't be done.
+    """
+    limits = UnmarshalLimits(max_bytes=len(data), max_depth=DETECT_MAX_DEPTH)
+    unmarshaller = _DetectUnmarshaller(data, candidate.magic_int, False, limits=limits)
+    try:
+        code = unmarshaller.load()
+    except Exception:
+        return None
+    if not hasattr(code, "co_code"):
+        return None
+    return code, unmarshaller.offset
+
+
+def _iter_code_objects(code):
+    stack = [code]
+    while stack:
+        code = stack.pop()
+        yield code
+        for const in code.co_consts:
+            if hasattr(const, "co_code"):
+                stack.append(const)
+
+
+def opcode_score(code, candidate) -> float:
+    """Return the fraction of the instructions in `code`, and the code
+    objects nested in it, that are valid opcodes for `candidate`, and of
+    the jumps that go to the start of an instruction.
+
+    Jumps are only checked before Python 3.11, where a jump's argument
+    doesn't depend on the inline caches between instructions.
+    """
+    opc = candidate.opc
+    opname = opc.opname
+    have_argument = opc.HAVE_ARGUMENT
+    extended_arg = opc.opmap.get("EXTENDED_ARG")
+    version = candidate.version
+    wordcode = version >= (3, 6)
+    check_jumps = version < (3, 11)
+    hasjrel = frozenset(opc.hasjrel)
+    hasjabs = frozenset(opc.hasjabs)
+    # Jump arguments count instructions rather than bytes from 3.10 on.
+    jump_scale = 2 if version >= (3, 10) else 1
+
+    valid = total = 0
+    for co in _iter_code_objects(code):
+        bytecode = co.co_code
+        if isinstance(bytecode, str):
+            bytecode = bytecode.encode("latin-1")
+        n = len(bytecode)
+        starts = set()
+        jumps = []
+        ext = i = 0
+        while i < n:
+            op = bytecode[i]
+            starts.add(i)
+            total += 1
+            if wordcode:
+                arg = bytecode[i + 1] | ext if i + 1 < n else 0
+                i += 2
+            elif op >= have_argument:
+                if i + 2 < n:
+                    arg = bytecode[i + 1] | bytecode[i + 2] << 8 | ext
+                else:
+                    arg = 0
+                i += 3
+            else:
+                arg = None
+                i += 1
+            if i > n or opname[op].startswith("<"):
+                continue
+            valid += 1
+            if op == extended_arg:
+                ext = arg << (8 if wordcode else 16)
+                continue
+            ext = 0
+            if check_jumps:
+                if op in hasjrel:
+                    jumps.append(i + arg * jump_scale)
+                elif op in hasjabs:
+                    jumps.append(arg * jump_scale)
+        total += len(jumps)
+        valid += sum(1 for target in jumps if target in starts)
+    if total == 0:
+        return 0.0
+    return valid / total
+
+
+def detect_version(data, max_results=5):
+    """Return a list of the VersionGuesses most likely for the marshaled
+    code object in `data`, best first. Versions that can't have
+    marshaled `data` at all are left out.
+    """
+    data = bytes(data)
+    if not data:
+        return []
+    decoded = {}
+    guesses = []
+    for candidate in candidates():
+        if not plausible_start(data, candidate):
+            continue
+        if candidate.decode_key not in decoded:
+            decoded[candidate.decode_key] = _decode(data, candidate)
+        result = decoded[candidate.decode_key]
+        if result is None:
+            continue
+        code, used = result
+        score = opcode_score(code, candidate)
+        if used != len(data):
+            score *= 0.9
+        guesses.append(
+            VersionGuess(
+                candidate.magic_int, candidate.version, candidate.is_pypy, score
+            )
+        )
+    # Python's sort is stable, so equal scores stay newest first.
+    guesses.sort(key=lambda guess: guess.score, reverse=True)
+    return guesses[:max_results]
+
+
+def detect_versions(blobs, workers=None, max_results=5):
+    """Return detect_version() for each of the marshaled code objects in
+    `blobs`, in order. These are shared out over `workers` processes, or
+    one per CPU if that's not given. If `workers` is 0 or 1, they are
+    done in this process.
+    """
+    if workers is not None and workers <= 1:
+        return [detect_version(blob, max_results) for blob in blobs]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.starmap(
+            detect_version, [(bytes(blob), max_results) for blob in blobs]
+        )
@@ -35,7 +35,7 @@ from xdis.bytecode import Bytecode
 from xdis.codetype import codeType2Portable
 from xdis.codetype.base import iscode
 from xdis.cross_dis import format_code_info, format_exception_table
-from xdis.load import check_object_path, load_module
+from xdis.load import check_object_path, iter_stream_modules, load_module
 from xdis.magics import GRAAL3_MAGICS, PYTHON_MAGIC_INT
 from xdis.op_imports import op_imports, remap_opcodes
 from xdis.version import __version__
@@ -351,6 +351,88 @@ def disassemble_file(
     else:
         filename = pyc_filename
 
+    _show_module(
+        version_tuple,
+        co,
+        timestamp,
+        outstream,
+        is_pypy,
+        magic_int,
+        source_size,
+        sip_hash,
+        asm_format,
+        alternate_opmap,
+        show_source,
+    )
+    # print co.co_filename
+    return (
+        filename,
+        co,
+        version_tuple,
+        timestamp,
+        magic_int,
+        is_pypy,
+        source_size,
+        sip_hash,
+    )
+
+
+def disassemble_stream(
+    stream,
+    outstream=sys.stdout,
+    asm_format="classic",
+    alternate_opmap=None,
+    show_source=False,
+    filename="<stdin>",
+):
+    """
+    Disassemble the Python byte-code files, one after another, in
+    readable binary stream `stream`, such as sys.stdin.buffer. Each is
+    disassembled as soon as it has been read.
+
+    Return the number of files disassembled.
+    """
+    count = 0
+    for (
+        version_tuple,
+        timestamp,
+        magic_int,
+        co,
+        is_pypy,
+        source_size,
+        sip_hash,
+    ) in iter_stream_modules(stream, filename):
+        _show_module(
+            version_tuple,
+            co,
+            timestamp,
+            outstream,
+            is_pypy,
+            magic_int,
+            source_size,
+            sip_hash,
+            asm_format,
+            alternate_opmap,
+            show_source,
+        )
+        outstream.flush()
+        count += 1
+    return count
+
+
+def _show_module(
+    version_tuple,
+    co,
+    timestamp,
+    outstream,
+    is_pypy,
+    magic_int,
+    source_size,
+    sip_hash,
+    asm_format,
+    alternate_opmap,
+    show_source,
+):
     is_graal = magic_int in GRAAL3_MAGICS
 
     if asm_format == "header":
@@ -382,17 +464,6 @@ def disassemble_file(
             show_source=show_source,
             is_graal=is_graal,
         )
-    # print co.co_filename
-    return (
-        filename,
-        co,
-        version_tuple,
-        timestamp,
-        magic_int,
-        is_pypy,
-        source_size,
-        sip_hash,
-    )
 
 
 def _test():
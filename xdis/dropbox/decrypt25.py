@@ -81,7 +81,7 @@ def load_code(self):
     data = list(struct.unpack("<%dL" % intsize, data))
     tea_decipher(data, key)
     self.bufpos += padsize
-    obj = xmarshal._FastUnmarshaller(struct.pack("<%dL" % intsize, *data))
+    obj = _DropboxUnmarshaller(struct.pack("<%dL" % intsize, *data))
     code = obj.load_code()
     co_code = patch(code.co_code)
     if PYTHON3:
@@ -276,14 +276,18 @@ except ImportError:
     builtinify = lambda f: f
 
 
+class _DropboxUnmarshaller(xmarshal._FastUnmarshaller):
+    dispatch = dict(xmarshal._FastUnmarshaller.dispatch)
+    dispatch[xmarshal.TYPE_CODE] = load_code
+
+
 @builtinify
 def loads(s):
     """
     xdis.marshal.load() but with its dispatch load_code() function replaced
     with our decoding version.
     """
-    um = xmarshal._FastUnmarshaller(s)
-    um.dispatch[xmarshal.TYPE_CODE] = load_code
+    um = _DropboxUnmarshaller(s)
     return um.load()
 
 
@@ -0,0 +1,231 @@
+# Copyright (c) 2024 by Rocky Bernstein
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Inventory of the bytecode files in a directory tree from their headers.
+
+Only the first 16 bytes of each file are read, so this is much quicker
+than ``xdis.load.load_module(get_code=False)`` over many files. Files
+are read by a pool of threads, since the time goes in waiting on the
+file system.
+
+Each file can also be checked against its Python source, to find
+bytecode that is out of date.
+"""
+
+import os
+import os.path as osp
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from xdis.load import _header_size, iter_bytecode_files, unpack_header
+from xdis.magics import magic2int, magic_int2tuple
+
+try:
+    from _imp import source_hash
+except ImportError:
+    # Before Python 3.7 there is no hash-based bytecode.
+    source_hash = None
+
+# What scan_headers() gives for each bytecode file.
+#
+# flags is the PEP 552 flags word, for Python 3.7 and later. timestamp
+# and source_size are None when they aren't stored, which includes
+# hash-based files, and sip_hash is None unless the file is hash-based.
+#
+# source is the Python source file that the bytecode file was compiled
+# from, if that was looked for and found. stale is True or False if the
+# bytecode file was checked against it, and None otherwise.
+#
+# error is a message saying why the header can't be read, and is None
+# for the rest.
+PycHeader = namedtuple(
+    "PycHeader",
+    "filename magic_int version flags timestamp source_size sip_hash "
+    "source stale error",
+)
+
+# Bytes read from each file: the largest header there is.
+MAX_HEADER_SIZE = 16
+
+# Files handed to a thread at a time.
+SCAN_CHUNK_SIZE = 64
+
+
+def source_path(filename):
+    """Return where the Python source for bytecode file `filename` would
+    be. This is next to it, or for a file in a __pycache__ directory, in
+    the directory above.
+    """
+    dirname, basename = osp.split(filename)
+    if osp.basename(dirname) == "__pycache__":
+        # e.g. __pycache__/mod.cpython-38.opt-1.pyc -> mod.py
+        return osp.join(osp.dirname(dirname), basename.split(".", 1)[0] + ".py")
+    return osp.splitext(filename)[0] + ".py"
+
+
+def read_header(filename, check_source=False):
+    """Return a PycHeader for bytecode file `filename`.
+
+    If `check_source` is set, the file is checked against its source as
+    the importer would. For a timestamp-based file the modification time
+    and size of the source are compared. For a hash-based file the hash
+    of the source, keyed by the file's magic number, is compared. That
+    needs Python 3.7 or later to run on.
+    """
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+        try:
+            data = os.read(fd, MAX_HEADER_SIZE)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        return _error(filename, None, None, str(e))
+    return parse_header(filename, data, check_source)
+
+
+def parse_header(filename, data, check_source=False):
+    """Return a PycHeader for bytecode file `filename`, which starts with
+    `data`. See read_header() for `check_source`.
+    """
+    if len(data) < 4:
+        return _error(filename, None, None, "too short to have a magic number")
+    if data[0:1] == b"0":
+        # PyPy 3.2, as in load_module_from_file_object()
+        magic_int = 3180 + 7
+    else:
+        magic_int = magic2int(data[:4])
+    try:
+        version = magic_int2tuple(magic_int)
+    except KeyError:
+        return _error(filename, magic_int, None, "unknown magic number %d" % magic_int)
+
+    header_size = _header_size(version, magic_int)
+    if len(data) < header_size:
+        return _error(
+            filename, magic_int, version, "header cut short at %d bytes" % len(data)
+        )
+    flags, timestamp, source_size, sip_hash = unpack_header(
+        data, magic_int, header_size, 4
+    )
+
+    source = stale = None
+    if check_source:
+        source = source_path(filename)
+        if sip_hash is not None:
+            if source_hash is not None:
+                try:
+                    stale = _source_hash(data[:4], source) != data[8:16]
+                except OSError:
+                    source = None
+        else:
+            try:
+                stat_result = os.stat(source)
+            except OSError:
+                source = None
+            else:
+                stale = timestamp != int(stat_result.st_mtime) & 0xFFFFFFFF or (
+                    source_size is not None
+                    and source_size != stat_result.st_size & 0xFFFFFFFF
+                )
+
+    return PycHeader(
+        filename,
+        magic_int,
+        version,
+        flags,
+        timestamp,
+        source_size,
+        sip_hash,
+        source,
+        stale,
+        None,
+    )
+
+
+def _error(filename, magic_int, version, message):
+    return PycHeader(
+        filename, magic_int, version, None, None, None, None, None, None, message
+    )
+
+
+def _source_hash(magic, path):
+    """Return the PEP 552 hash of Python source file `path`, for bytecode
+    with magic number `magic`, the first 4 bytes of the file.
+
+    Raise ValueError before Python 3.7, and OSError if `path` can't be
+    read.
+    """
+    if source_hash is None:
+        raise ValueError("hashing source needs Python 3.7 or later")
+    with open(path, "rb") as fp:
+        # As importlib.util.source_hash() does for the running Python,
+        # the key is the magic number.
+        return source_hash(int.from_bytes(magic, "little"), fp.read())
+
+
+def _call_chunk(fn, chunk, args):
+    return [fn(filename, *args) for filename in chunk]
+
+
+def _map_chunked(fn, filenames, workers, *args):
+    """Yield fn(filename, *args) for each of `filenames`, in order.
+
+    If `workers` is more than 1, fn is called by that many threads,
+    SCAN_CHUNK_SIZE files at a time.
+    """
+    if workers <= 1:
+        for filename in filenames:
+            yield fn(filename, *args)
+        return
+
+    def chunks():
+        chunk = []
+        for filename in filenames:
+            chunk.append(filename)
+            if len(chunk) == SCAN_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    # Keep only a few chunks per thread in flight, rather than queuing
+    # up the whole tree.
+    with ThreadPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunks():
+            pending.append(executor.submit(_call_chunk, fn, chunk, args))
+            if len(pending) >= 4 * workers:
+                for result in pending.popleft().result():
+                    yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
+
+
+def scan_headers(paths_or_dirs, check_source=False, workers=16):
+    """Yield a PycHeader for each bytecode file in `paths_or_dirs`.
+
+    `paths_or_dirs` is a path, or a list of paths, to bytecode files or
+    to directories, which are searched for bytecode files. Headers come
+    in the order the files are found, and are read by `workers` threads.
+    A file whose header can't be read has the reason in its error field.
+
+    See read_header() for `check_source`.
+    """
+    return _map_chunked(
+        read_header, iter_bytecode_files(paths_or_dirs), workers, check_source
+    )
@@ -0,0 +1,185 @@
+# Copyright (c) 2024 by Rocky Bernstein
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Rewrite the headers of bytecode files in bulk, for reproducible builds.
+
+Only the header is changed; the marshaled code after it is left as it
+is. A file can be made a PEP 552 hash-based file, checked or unchecked,
+or be given a pinned timestamp, such as $SOURCE_DATE_EPOCH.
+
+Files are rewritten in place, or if ``atomic`` is set, by writing a
+temporary file and renaming it over the original, as
+``xdis.verify.dump_compile()`` does, so that a reader never sees a half
+written file.
+"""
+
+import os
+import os.path as osp
+import shutil
+import tempfile
+from collections import namedtuple
+from struct import pack
+
+from xdis.headerscan import (
+    MAX_HEADER_SIZE,
+    _map_chunked,
+    _source_hash,
+    parse_header,
+    source_path,
+)
+from xdis.load import _header_size, iter_bytecode_files
+
+# What rewrite_headers() gives for each bytecode file. changed is False
+# when the file already had the header asked for, and error is a message
+# saying why the header couldn't be rewritten, or None.
+HeaderRewrite = namedtuple("HeaderRewrite", "filename changed error")
+
+# The kinds of header that can be written. These are the names of
+# py_compile.PycInvalidationMode, in lower case with dashes.
+REWRITE_MODES = ("timestamp", "checked-hash", "unchecked-hash")
+
+# PEP 552 flags.
+FLAG_HASH_BASED = 1
+FLAG_CHECK_SOURCE = 2
+
+
+def new_header(filename, data, mode, timestamp=None, source=None):
+    """Return the header that bytecode file `filename`, which starts with
+    `data`, should have for `mode`, one of REWRITE_MODES.
+
+    The source file is `source`, or if that's not given, the one that
+    headerscan.source_path() finds. The hash of a hash-based header is
+    that of the source, so the source has to be there. A timestamp header
+    gets `timestamp`, if given, and otherwise the modification time of
+    the source. The source size comes from the source, or if that can't
+    be found, from the existing header.
+
+    Raise ValueError if the header can't be made.
+    """
+    if mode not in REWRITE_MODES:
+        raise ValueError(
+            "mode should be one of %s, not %r" % (", ".join(REWRITE_MODES), mode)
+        )
+    header = parse_header(filename, data)
+    if header.error is not None:
+        raise ValueError(header.error)
+    header_size = _header_size(header.version, header.magic_int)
+    magic = bytes(data[:4])
+    if source is None:
+        source = source_path(filename)
+
+    if mode != "timestamp":
+        if header_size != 16:
+            raise ValueError(
+                "Python %s bytecode has no hash-based form"
+                % ".".join(str(v) for v in header.version)
+            )
+        sip_hash = _source_hash(magic, source)
+        flags = FLAG_HASH_BASED
+        if mode == "checked-hash":
+            flags |= FLAG_CHECK_SOURCE
+        return magic + pack("<I", flags) + sip_hash
+
+    try:
+        stat_result = os.stat(source)
+    except OSError:
+        stat_result = None
+    if timestamp is None:
+        if stat_result is None:
+            raise ValueError("no source %s to take the timestamp from" % source)
+        timestamp = int(stat_result.st_mtime)
+    if stat_result is not None:
+        source_size = stat_result.st_size
+    elif header.source_size is not None or header_size < 12:
+        source_size = header.source_size
+    else:
+        raise ValueError("no source %s to take the size from" % source)
+
+    new = magic
+    if header_size == 16:
+        new += pack("<I", 0)
+    new += pack("<I", timestamp & 0xFFFFFFFF)
+    if header_size >= 12:
+        new += pack("<I", source_size & 0xFFFFFFFF)
+    return new
+
+
+def rewrite_header(filename, mode, timestamp=None, source=None, atomic=False):
+    """Give bytecode file `filename` the header new_header() makes, and
+    return a HeaderRewrite. The file is only written if its header
+    changes.
+
+    If `atomic` is set, the new file is written alongside and renamed
+    over `filename`. Otherwise just the header is overwritten in place.
+    """
+    try:
+        with open(filename, "rb") as fp:
+            data = fp.read(MAX_HEADER_SIZE)
+        header = new_header(filename, data, mode, timestamp, source)
+        if data[: len(header)] == header:
+            return HeaderRewrite(filename, False, None)
+        if atomic:
+            _replace_header(filename, header)
+        else:
+            with open(filename, "r+b") as fp:
+                fp.write(header)
+    except (OSError, ValueError) as e:
+        return HeaderRewrite(filename, False, str(e))
+    return HeaderRewrite(filename, True, None)
+
+
+def _replace_header(filename, header):
+    fd, tmp_path = tempfile.mkstemp(
+        dir=osp.dirname(osp.abspath(filename)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as out, open(filename, "rb") as fp:
+            fp.seek(len(header))
+            out.write(header)
+            shutil.copyfileobj(fp, out)
+        shutil.copymode(filename, tmp_path)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def rewrite_headers(paths_or_dirs, mode, timestamp=None, atomic=False, workers=16):
+    """Yield a HeaderRewrite for each bytecode file in `paths_or_dirs`,
+    after giving it the header for `mode`, as rewrite_header() does.
+
+    `paths_or_dirs` is a path, or a list of paths, to bytecode files or
+    to directories, which are searched for bytecode files. Files are
+    rewritten by `workers` threads, and results come in the order the
+    files are found.
+    """
+    if mode not in REWRITE_MODES:
+        raise ValueError(
+            "mode should be one of %s, not %r" % (", ".join(REWRITE_MODES), mode)
+        )
+    return _map_chunked(
+        rewrite_header,
+        iter_bytecode_files(paths_or_dirs),
+        workers,
+        mode,
+        timestamp,
+        None,
+        atomic,
+    )
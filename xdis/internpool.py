@@ -0,0 +1,154 @@
+# Copyright (c) 2024 by Rocky Bernstein
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A pool of immutable constants that can be shared by many loads.
+
+Each load of a bytecode file creates its own strings, numbers and
+tuples. When many modules are kept in memory at once, the same
+identifiers, file names and constant tuples show up over and over.
+Passing the same InternPool to each load makes equal constants the
+same object.
+"""
+
+import sys
+from collections import namedtuple
+
+from xdis.cross_types import LongTypeForPython3, UnicodeForPython3
+
+# entries: the number of distinct objects in the pool.
+# lookups: the number of objects offered to the pool.
+# hits: the number of those that were replaced by an object in the pool.
+# bytes_saved: the shallow size of the objects that were replaced.
+# by_type: a dictionary from type name to (hits, bytes_saved).
+InternPoolStats = namedtuple(
+    "InternPoolStats", "entries lookups hits bytes_saved by_type"
+)
+
+
+def _float_key(x: float):
+    # 0.0 == -0.0, but they are different constants.
+    return x.hex()
+
+
+def _complex_key(x: complex):
+    return (x.real.hex(), x.imag.hex())
+
+
+# Constants that are the same object whenever they are equal, and so
+# can be kept apart by identity inside a container.
+_SINGLETONS = (None, True, False, Ellipsis)
+
+
+def _poolable(item) -> bool:
+    """Return True if `item` is pooled by its value, rather than being an
+    object like a code object, which is only ever equal to itself."""
+    item_type = type(item)
+    if item_type in (tuple, frozenset):
+        return all(_poolable(x) for x in item)
+    return item_type in _POOL_KEYS or any(item is x for x in _SINGLETONS)
+
+
+def _items_key(items):
+    # Items have been pooled before their container, so equal items are
+    # the same object. Comparing identities keeps (1,) and (1.0,) apart.
+    # A container holding something that isn't pooled by value, such as
+    # a code object, is not pooled: it would never be seen again, and
+    # the pool would keep it alive.
+    if not all(_poolable(item) for item in items):
+        return None
+    return tuple(id(item) for item in items)
+
+
+def _frozenset_key(items):
+    key = _items_key(items)
+    return None if key is None else frozenset(key)
+
+
+# How to turn each kind of constant we pool into a dictionary key.
+# Only exact types are matched; in particular, bool is not an int here.
+# A key of None means the object is not pooled.
+_POOL_KEYS = {
+    str: None,
+    bytes: None,
+    int: None,
+    float: _float_key,
+    complex: _complex_key,
+    tuple: _items_key,
+    frozenset: _frozenset_key,
+    UnicodeForPython3: lambda s: s.value,
+    LongTypeForPython3: int,
+}
+
+
+class InternPool:
+    """
+    Immutable constants seen across loads. Pass one to
+    ``xdis.unmarshal.load_code()``, ``xdis.load.load_module()`` or
+    ``xdis.marsh.load()`` as ``intern_pool``.
+    """
+
+    def __init__(self):
+        self.pool = {}
+        self.lookups = 0
+        self.hits = 0
+        self.bytes_saved = 0
+        self.by_type = {}
+
+    def intern(self, obj):
+        """
+        Return the pooled object equal to ``obj``, adding ``obj`` to the
+        pool if there is none. Objects of other types are returned as is.
+        """
+        obj_type = type(obj)
+        try:
+            key_func = _POOL_KEYS[obj_type]
+        except KeyError:
+            return obj
+        if key_func is None:
+            key = (obj_type, obj)
+        else:
+            key_value = key_func(obj)
+            if key_value is None:
+                return obj
+            key = (obj_type, key_value)
+        self.lookups += 1
+        pooled = self.pool.get(key)
+        if pooled is None:
+            self.pool[key] = obj
+            return obj
+        if pooled is not obj:
+            size = sys.getsizeof(obj)
+            self.hits += 1
+            self.bytes_saved += size
+            hits, bytes_saved = self.by_type.get(obj_type.__name__, (0, 0))
+            self.by_type[obj_type.__name__] = (hits + 1, bytes_saved + size)
+        return pooled
+
+    def stats(self) -> InternPoolStats:
+        return InternPoolStats(
+            len(self.pool),
+            self.lookups,
+            self.hits,
+            self.bytes_saved,
+            dict(self.by_type),
+        )
+
+    def clear(self):
+        self.__init__()
+
+    def __len__(self) -> int:
+        return len(self.pool)
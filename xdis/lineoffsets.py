@@ -12,6 +12,7 @@ from collections import namedtuple
 
 from xdis.bytecode import get_instructions_bytes
 from xdis.codetype.base import iscode
+from xdis.cross_dis import JumpTargetIndex
 from xdis.load import check_object_path, load_module
 from xdis.op_imports import get_opcode_module
 
@@ -42,6 +43,7 @@ class LineOffsetInfo(object):
         self.lines = []
         self.offsets = []
         self.linestarts = dict(opc.findlinestarts(code, dup_lines=True))
+        self.jump_targets = JumpTargetIndex(code.co_code, opc)
         self.instructions = []
         self.include_children = include_children
         self._populate_lines()
@@ -59,6 +61,7 @@ class LineOffsetInfo(object):
             constants=code.co_consts,
             cells=code.co_cellvars + code.co_freevars,
             linestarts=self.linestarts,
+            jump_targets=self.jump_targets,
         ):
             offset = instr.offset
             self.offsets.append(offset)
@@ -13,17 +13,27 @@
 #  along with this program; if not, write to the Free Software
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import io
 import marshal
+import mmap
+import multiprocessing
+import os
 import os.path as osp
+import pickle
 import py_compile
+import stat
 import sys
 import tempfile
 import types
+import zipfile
+from collections import namedtuple
 from datetime import datetime
-from struct import pack, unpack
+from functools import lru_cache
+from struct import error as StructError, pack, unpack_from
 
 import xdis.marsh
 import xdis.unmarshal
+from xdis.codeindex import CodeIndex, build_code_index, load_code_at
 from xdis.dropbox.decrypt25 import fix_dropbox_pyc
 from xdis.magics import (
     PYPY3_MAGICS,
@@ -35,6 +45,7 @@ from xdis.magics import (
     py_str2tuple,
     versions,
 )
+from xdis.unmarshal import UnmarshalLimitError
 from xdis.version_info import PYTHON3, PYTHON_VERSION_TRIPLE
 
 
@@ -63,6 +74,113 @@ def is_bytecode_extension(path: str):
     return path.endswith(".pyc") or path.endswith(".pyo")
 
 
+# Extensions of zip archives that bytecode files are loaded from:
+# plain zip files, wheels, eggs and zipapps.
+ARCHIVE_EXTENSIONS = (".zip", ".whl", ".egg", ".pyz")
+
+
+def is_archive_extension(path: str):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def split_archive_path(path):
+    """If `path` is the path of a zip archive followed by the name of a
+    member in it, as for zipimport, return the archive path and the
+    member name. Otherwise return None.
+    """
+    archive = path
+    while True:
+        head = osp.dirname(archive)
+        if not head or head == archive:
+            return None
+        archive = head
+        if osp.isfile(archive):
+            if not zipfile.is_zipfile(archive):
+                return None
+            member = osp.relpath(path, archive)
+            return archive, member.replace(os.sep, "/")
+
+
+@lru_cache(maxsize=16)
+def _open_archive(archive, mtime_ns, size, pid):
+    return zipfile.ZipFile(archive)
+
+
+def open_archive(archive):
+    """Return a zipfile.ZipFile for `archive`.
+
+    Archives are kept open, so that loading many members of one doesn't
+    read its directory each time, until the archive changes. A process
+    has its own ZipFiles, rather than sharing a file position with the
+    process it was forked from.
+    """
+    stat_result = os.stat(archive)
+    return _open_archive(
+        archive, stat_result.st_mtime_ns, stat_result.st_size, os.getpid()
+    )
+
+
+def iter_archive_members(archive):
+    """Yield the paths of the bytecode files in zip archive `archive`,
+    which load_module() accepts. Each is the archive path followed by
+    the member name.
+    """
+    for name in open_archive(archive).namelist():
+        if is_bytecode_extension(name):
+            yield osp.join(archive, *name.split("/"))
+
+
+def load_module_from_archive(
+    archive,
+    member,
+    code_objects=None,
+    fast_load=False,
+    get_code=True,
+    lazy=False,
+    intern_pool=None,
+    limits=None,
+    profile=None,
+):
+    """load a module from member `member` of zip archive `archive`,
+    which can be a wheel, egg or zipapp, without extracting it.
+
+    The member is read into memory and unmarshalled from there.
+    See :func:load_module for the other parameters and the return values.
+    """
+    filename = osp.join(archive, *member.split("/"))
+    zip_file = open_archive(archive)
+    try:
+        info = zip_file.getinfo(member)
+    except KeyError:
+        raise ImportError("File name: '%s' doesn't exist" % filename)
+    if info.file_size < 50:
+        raise ImportError(
+            "File name: '%s (%d bytes)' is too short to be a valid pyc file"
+            % (filename, info.file_size)
+        )
+    elif (
+        limits is not None
+        and limits.max_bytes is not None
+        and info.file_size > limits.max_bytes
+    ):
+        raise UnmarshalLimitError(
+            "File name: '%s (%d bytes)' is larger than %d bytes"
+            % (filename, info.file_size, limits.max_bytes)
+        )
+
+    return load_module_from_file_object(
+        io.BytesIO(zip_file.read(info)),
+        filename=filename,
+        code_objects=code_objects,
+        fast_load=fast_load,
+        get_code=get_code,
+        lazy=lazy,
+        intern_pool=intern_pool,
+        limits=limits,
+        profile=profile,
+    )
+
+
 def check_object_path(path):
     if not is_bytecode_extension(path) and is_python_source(path):
         try:
@@ -127,23 +245,82 @@ def load_file(filename, out=sys.stdout):
     return co
 
 
-def load_module(filename, code_objects=None, fast_load=False, get_code=True):
+def load_module(
+    filename,
+    code_objects=None,
+    fast_load=False,
+    get_code=True,
+    lazy=False,
+    intern_pool=None,
+    limits=None,
+    profile=None,
+    use_mmap=False,
+    cache=None,
+):
     """load a module without importing it.
     Parameters:
        filename:    name of file containing Python byte-code object
-                    (normally a .pyc)
+                    (normally a .pyc). This can also be the path of a
+                    member of a zip archive, such as a wheel or egg,
+                    following the path of the archive, as for zipimport,
+                    e.g. dist.whl/pkg/__pycache__/mod.cpython-38.pyc
 
        code_objects: list of additional code_object from this
                      file. This might be a types.CodeType or one of
                      the portable xdis code types, e.g. Code38, Code3,
                      Code2, etc. This can be empty
 
+       fast_load:    bool. If set, bytecode that is not for the running
+                     Python is unmarshalled by xdis.marsh.loads(), which
+                     gives the same code objects as xdis.unmarshal, but
+                     faster, and without its other options.
+
        get_code:     bool. Parsing the code object takes a bit of
                      parsing time, but sometimes all you want is the
                      module info, time string, code size, python
                      version, etc. For that, set `get_code` to
                      `False`.
 
+       lazy:         bool. If set, code objects nested inside the
+                     module's code object are not decoded up front.
+                     Instead, they are xdis.unmarshal.LazyCode
+                     placeholders that are decoded when first used.
+                     This only applies when the bytecode is not for
+                     the running Python.
+
+       intern_pool:  an xdis.internpool.InternPool to share constants
+                     with other loads given the same pool. This too
+                     only applies when the bytecode is not for the
+                     running Python.
+
+       limits:       an xdis.unmarshal.UnmarshalLimits bounding the
+                     objects, bytes, nesting depth and time taken to
+                     load bytecode that can't be trusted. When one of
+                     these is exceeded, xdis.unmarshal.UnmarshalLimitError
+                     is raised. The size of the file is also checked
+                     against max_bytes before it is read. Otherwise,
+                     limits only apply when the bytecode is not for the
+                     running Python and fast_load is not set.
+
+       profile:      an xdis.unmarshal_profile.UnmarshalProfile to record
+                     the objects, bytes and time taken by each marshal
+                     type and code object in. When it is given, the
+                     bytecode is always unmarshalled by xdis.unmarshal,
+                     even for the running Python or with fast_load set,
+                     so the code object is an xdis portable one.
+
+       use_mmap:     bool. If set, the file is memory mapped, and the
+                     code object is unmarshalled straight from the
+                     mapping rather than from a copy of the file read
+                     into memory. The mapping is closed afterwards,
+                     unless lazy is also set, in which case it stays
+                     open as long as the code objects need it.
+
+       cache:        an xdis.loadcache.LoadCache to look the result up
+                     in, and save it to. This is only used when none of
+                     code_objects, lazy, intern_pool, limits and profile
+                     are given, and get_code is set.
+
     Return values are as follows:
         version_tuple: a tuple version number for the given magic_int,
                        e.g. (2, 7) or (3, 4)
@@ -160,32 +337,154 @@ def load_module(filename, code_objects=None, fast_load=False, get_code=True):
                      none, then the timestamp and source_size will be invalid.
     """
 
-    # Some sanity checks
-    if not osp.exists(filename):
-        raise ImportError("File name: '%s' doesn't exist" % filename)
-    elif not osp.isfile(filename):
+    # Some sanity checks, with a single stat() call.
+    try:
+        stat_result = os.stat(filename)
+    except OSError:
+        archive_member = split_archive_path(filename)
+        if archive_member is None:
+            raise ImportError("File name: '%s' doesn't exist" % filename)
+        return load_module_from_archive(
+            archive_member[0],
+            archive_member[1],
+            code_objects=code_objects,
+            fast_load=fast_load,
+            get_code=get_code,
+            lazy=lazy,
+            intern_pool=intern_pool,
+            limits=limits,
+            profile=profile,
+        )
+    size = stat_result.st_size
+    if not stat.S_ISREG(stat_result.st_mode):
         raise ImportError("File name: '%s' isn't a file" % filename)
-    elif osp.getsize(filename) < 50:
+    elif size < 50:
         raise ImportError(
             "File name: '%s (%d bytes)' is too short to be a valid pyc file"
-            % (filename, osp.getsize(filename))
+            % (filename, size)
+        )
+    elif (
+        limits is not None and limits.max_bytes is not None and size > limits.max_bytes
+    ):
+        raise UnmarshalLimitError(
+            "File name: '%s (%d bytes)' is larger than %d bytes"
+            % (filename, size, limits.max_bytes)
         )
 
+    if (
+        cache is not None
+        and get_code
+        and code_objects is None
+        and not lazy
+        and intern_pool is None
+        and limits is None
+        and profile is None
+    ):
+        return cache.load_module(filename, fast_load=fast_load)
+
     with open(filename, "rb") as fp:
+        if use_mmap:
+            # The mapping keeps its own handle on the file.
+            fp = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
         return load_module_from_file_object(
             fp,
             filename=filename,
             code_objects=code_objects,
             fast_load=fast_load,
             get_code=get_code,
+            lazy=lazy,
+            intern_pool=intern_pool,
+            limits=limits,
+            profile=profile,
+        )
+
+
+def _check_magic(magic, filename):
+    """Return the magic, magic_int and version tuple of a bytecode file
+    that starts with `magic`. Raise ImportError if it isn't bytecode that
+    xdis can load.
+    """
+    magic_int = magic2int(magic)
+
+    # For reasons I don't understand, PyPy 3.2 stores a magic
+    # of '0'...  The two values below are for Python 2.x and 3.x respectively
+    if magic[0:1] in ["0", b"0"]:
+        magic = int2magic(3180 + 7)
+
+    try:
+        # FIXME: use the internal routine below
+        tuple_version = magic_int2tuple(magic_int)
+    except KeyError:
+        if magic_int in (2657, 22138):
+            raise ImportError("This smells like Pyston which is not supported.")
+
+        if len(magic) >= 2:
+            raise ImportError(
+                "Unknown magic number %s in %s"
+                % (ord(magic[0:1]) + 256 * ord(magic[1:2]), filename)
+            )
+        else:
+            raise ImportError("Bad magic number: '%s'" % magic)
+
+    if magic_int in (
+        3010,
+        3020,
+        3030,
+        3040,
+        3050,
+        3060,
+        3061,
+        3071,
+        3361,
+        3091,
+        3101,
+        3103,
+        3141,
+        3270,
+        3280,
+        3290,
+        3300,
+        3320,
+        3330,
+        3371,
+        62071,
+        62071,
+        62081,
+        62091,
+        62092,
+        62111,
+    ):
+        raise ImportError(
+            "%s is interim Python %s (%d) bytecode which is "
+            "not supported.\nFinal released versions are "
+            "supported." % (filename, versions[magic], magic2int(magic))
         )
+    elif magic_int == 62215:
+        raise ImportError(
+            "%s is a dropbox-hacked Python %s (bytecode %d).\n"
+            "See https://github.com/kholia/dedrop for how to "
+            "decrypt." % (filename, versions[magic], magic2int(magic))
+        )
+    return magic, magic_int, tuple_version
 
 
 def load_module_from_file_object(
-    fp, filename="<unknown>", code_objects=None, fast_load=False, get_code=True
+    fp,
+    filename="<unknown>",
+    code_objects=None,
+    fast_load=False,
+    get_code=True,
+    lazy=False,
+    intern_pool=None,
+    limits=None,
+    profile=None,
 ):
     """load a module from a file object without importing it.
 
+    `fp` can also be an mmap.mmap, or have a getbuffer() method like
+    io.BytesIO, in which case the code object is unmarshalled from its
+    buffer in place.
+
     See :func:load_module for a list of return values.
     """
 
@@ -193,127 +492,77 @@ def load_module_from_file_object(
         code_objects = {}
 
     timestamp = 0
+    body = None
+    # Whether code objects were left to decode lazily from body.
+    decoded_lazily = False
     try:
         magic = fp.read(4)
-        magic_int = magic2int(magic)
-
-        # For reasons I don't understand, PyPy 3.2 stores a magic
-        # of '0'...  The two values below are for Python 2.x and 3.x respectively
-        if magic[0:1] in ["0", b"0"]:
-            magic = int2magic(3180 + 7)
-
-        try:
-            # FIXME: use the internal routine below
-            tuple_version = magic_int2tuple(magic_int)
-        except KeyError:
-            if magic_int in (2657, 22138):
-                raise ImportError("This smells like Pyston which is not supported.")
-
-            if len(magic) >= 2:
-                raise ImportError(
-                    "Unknown magic number %s in %s"
-                    % (ord(magic[0:1]) + 256 * ord(magic[1:2]), filename)
-                )
-            else:
-                raise ImportError("Bad magic number: '%s'" % magic)
-
-        if magic_int in (
-            3010,
-            3020,
-            3030,
-            3040,
-            3050,
-            3060,
-            3061,
-            3071,
-            3361,
-            3091,
-            3101,
-            3103,
-            3141,
-            3270,
-            3280,
-            3290,
-            3300,
-            3320,
-            3330,
-            3371,
-            62071,
-            62071,
-            62081,
-            62091,
-            62092,
-            62111,
-        ):
-            raise ImportError(
-                "%s is interim Python %s (%d) bytecode which is "
-                "not supported.\nFinal released versions are "
-                "supported." % (filename, versions[magic], magic2int(magic))
-            )
-        elif magic_int == 62135:
+        magic, magic_int, tuple_version = _check_magic(magic, filename)
+        if magic_int == 62135:
+            if not getattr(fp, "seekable", lambda: False)():
+                # A pipe, say.
+                return fix_dropbox_pyc(io.BytesIO(magic + fp.read()))
             fp.seek(0)
             return fix_dropbox_pyc(fp)
-        elif magic_int == 62215:
-            raise ImportError(
-                "%s is a dropbox-hacked Python %s (bytecode %d).\n"
-                "See https://github.com/kholia/dedrop for how to "
-                "decrypt." % (filename, versions[magic], magic2int(magic))
-            )
 
         try:
             my_magic_int = PYTHON_MAGIC_INT
             magic_int = magic2int(magic)
             version = magic_int2tuple(magic_int)
 
-            timestamp = None
-            source_size = None
-            sip_hash = None
-
-            ts = fp.read(4)
-            if magic_int in (3439,) or version >= (3, 7):
-                # PEP 552. https://www.python.org/dev/peps/pep-0552/
-                pep_bits = ts[-1]
-                if PYTHON_VERSION_TRIPLE <= (2, 7):
-                    pep_bits = ord(pep_bits)
-                if (pep_bits & 1) or magic_int == 3393:  # 3393 is 3.7.0beta3
-                    # SipHash
-                    sip_hash = unpack("<Q", fp.read(8))[0]
-                else:
-                    # Uses older-style timestamp and size
-                    timestamp = unpack("<I", fp.read(4))[0]  # pep552_bits
-                    source_size = unpack("<I", fp.read(4))[0]  # size mod 2**32
-                    pass
+            # Read the rest of the header at once.
+            header_size = _header_size(version, magic_int)
+            header = fp.read(header_size - 4)
+            if len(header) < header_size - 4:
+                raise ImportError("Header of %s is cut short" % filename)
+            _, timestamp, source_size, sip_hash = unpack_header(
+                header, magic_int, header_size
+            )
+
+            if isinstance(fp, mmap.mmap):
+                # Unmarshal from the mapping without copying it.
+                body = memoryview(fp)[fp.tell() :]
+            elif hasattr(fp, "getbuffer"):
+                # io.BytesIO, or a file in an xdis.pycpack.PycPack
+                body = fp.getbuffer()[fp.tell() :]
             else:
-                timestamp = unpack("<I", ts)[0]
-                # Note: a higher magic number doesn't necessarily mean a later
-                # release.  At Python 3.0 the magic number decreased
-                # significantly. Hence, the range below. Also note inclusion of
-                # the size info, occurred within a Python major/minor
-                # release. That is why there is the test on the magic value rather than
-                # PYTHON_VERSION, although PYTHON_VERSION would probably work.
-                if (
-                    (3200 <= magic_int < 20121)
-                    and version >= (1, 5)
-                    or magic_int in PYPY3_MAGICS
-                ):
-                    source_size = unpack("<I", fp.read(4))[0]  # size mod 2**32
+                body = fp
 
             if get_code:
-                if my_magic_int == magic_int:
-                    bytecode = fp.read()
+                # A profile is only recorded by xdis.unmarshal.
+                if my_magic_int == magic_int and profile is None:
+                    bytecode = fp.read() if body is fp else body
                     co = marshal.loads(bytecode)
                     # Python 3.10 returns a tuple here?
                     if isinstance(co, tuple):
                         co = co[0]
                         assert isinstance(co, types.CodeType)
 
-                elif fast_load:
-                    co = xdis.marsh.load(fp, magicint2version[magic_int])
+                elif fast_load and profile is None:
+                    if body is fp:
+                        co = xdis.marsh.load(
+                            fp, magic_int=magic_int, intern_pool=intern_pool
+                        )
+                    else:
+                        co = xdis.marsh.loads(
+                            body, magic_int=magic_int, intern_pool=intern_pool
+                        )
                 else:
-                    co = xdis.unmarshal.load_code(fp, magic_int, code_objects)
+                    co = xdis.unmarshal.load_code(
+                        body,
+                        magic_int,
+                        code_objects=code_objects,
+                        lazy=lazy,
+                        intern_pool=intern_pool,
+                        limits=limits,
+                        profile=profile,
+                    )
+                    decoded_lazily = lazy
                 pass
             else:
                 co = None
+        except UnmarshalLimitError:
+            raise
         except Exception:
             kind, msg = sys.exc_info()[0:2]
             import traceback
@@ -324,7 +573,15 @@ def load_module_from_file_object(
             )
 
     finally:
-        fp.close()
+        if not (isinstance(fp, mmap.mmap) or hasattr(fp, "getbuffer")):
+            fp.close()
+        elif not decoded_lazily:
+            # Lazily decoded code objects still refer to the buffer,
+            # which is closed when the last of them goes away.
+            # Otherwise close it now.
+            if body is not None:
+                body.release()
+            fp.close()
 
     return (
         tuple_version,
@@ -337,6 +594,411 @@ def load_module_from_file_object(
     )
 
 
+# How much is read from a stream at a time, and how much of one bytecode
+# file from it is buffered at most, unless limits.max_bytes says.
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_MAX_BYTES = 256 * 1024 * 1024
+
+
+def iter_stream_modules(
+    stream,
+    filename="<stream>",
+    fast_load=False,
+    get_code=True,
+    limits=None,
+    chunk_size=STREAM_CHUNK_SIZE,
+):
+    """Yield the load_module() return values for each of the bytecode
+    files, one after another, in readable binary stream `stream`, which
+    can be a pipe, a socket or sys.stdin.buffer.
+
+    The stream isn't seeked, and each module is yielded as soon as enough
+    of the stream has been read to unmarshal it. At most
+    `limits.max_bytes`, or STREAM_MAX_BYTES, of one bytecode file is
+    buffered; UnmarshalLimitError is raised for a larger one.
+
+    A dropbox-hacked file has to be the last one in the stream.
+    """
+    max_bytes = STREAM_MAX_BYTES
+    if limits is not None and limits.max_bytes is not None:
+        max_bytes = limits.max_bytes
+    # read1() returns what there is, rather than waiting for a full chunk.
+    read = getattr(stream, "read1", stream.read)
+    buffer = bytearray()
+    at_eof = False
+
+    def fill(size):
+        nonlocal at_eof
+        while len(buffer) < size and not at_eof:
+            if len(buffer) >= max_bytes:
+                raise UnmarshalLimitError(
+                    "Bytecode file in %s is larger than %d bytes"
+                    % (filename, max_bytes)
+                )
+            data = read(max(chunk_size, size - len(buffer)))
+            if data:
+                buffer.extend(data)
+            else:
+                at_eof = True
+        return len(buffer) >= size
+
+    while fill(1):
+        if not fill(4):
+            raise ImportError("Bad magic number in %s" % filename)
+        magic, magic_int, tuple_version = _check_magic(bytes(buffer[:4]), filename)
+        if magic_int == 62135:
+            fill(max_bytes + 1)
+            yield fix_dropbox_pyc(io.BytesIO(bytes(buffer)))
+            return
+        magic_int = magic2int(magic)
+        header_size = _header_size(magic_int2tuple(magic_int), magic_int)
+        if not fill(header_size):
+            raise ImportError("Header of %s is cut short" % filename)
+        _, timestamp, source_size, sip_hash = unpack_header(
+            buffer, magic_int, header_size, 4
+        )
+
+        # Marshal data doesn't say how long it is, so try to unmarshal
+        # what has been read, and read as much again each time that
+        # comes up short. Doubling keeps the retries linear overall.
+        while True:
+            fp = io.BytesIO(bytes(buffer[header_size:]))
+            try:
+                if magic_int == PYTHON_MAGIC_INT:
+                    co = marshal.load(fp)
+                    # Python 3.10 returns a tuple here?
+                    if isinstance(co, tuple):
+                        co = co[0]
+                elif fast_load:
+                    co = xdis.marsh.load(fp, magic_int=magic_int)
+                else:
+                    co = xdis.unmarshal.load_code(fp, magic_int, limits=limits)
+                # Strings are cut short rather than failing.
+                complete = fp.tell() <= len(fp.getbuffer())
+            # A read can also end in the middle of a multi-byte character,
+            # which fails to decode (ValueError) until the rest is read.
+            except (
+                EOFError,
+                IndexError,
+                StructError,
+                UnmarshalLimitError,
+                ValueError,
+            ) as e:
+                if at_eof:
+                    if isinstance(e, UnmarshalLimitError):
+                        raise
+                    raise ImportError(
+                        "Ill-formed bytecode file %s\n%s; %s" % (filename, type(e), e)
+                    )
+                complete = False
+            if complete:
+                break
+            if at_eof:
+                raise ImportError("Bytecode file in %s is cut short" % filename)
+            fill(2 * len(buffer))
+
+        del buffer[: header_size + fp.tell()]
+        yield (
+            tuple_version,
+            timestamp,
+            magic_int,
+            co if get_code else None,
+            is_pypy(magic_int, filename),
+            source_size,
+            sip_hash,
+        )
+
+
+# What load_modules() gives for each file: the load_module() return
+# values, or None and the exception that was raised.
+LoadResult = namedtuple("LoadResult", "filename result error")
+
+
+class _MarshaledCode:
+    """
+    A code object for the running Python, which can't be pickled, on its
+    way back from a load_modules() worker process.
+    """
+
+    def __init__(self, co):
+        self.data = marshal.dumps(co)
+
+
+def _archive_members(archive):
+    try:
+        return list(iter_archive_members(archive))
+    except (zipfile.BadZipFile, OSError):
+        return [archive]
+
+
+def iter_bytecode_files(paths_or_dirs, archives=False):
+    """Yield the paths in `paths_or_dirs` that are not directories, and
+    the bytecode files found under those that are. `paths_or_dirs` can
+    also be a single path.
+
+    If `archives` is set, zip archives given or found are not yielded
+    themselves, but instead the paths of the bytecode files in them, as
+    iter_archive_members() gives. An archive that can't be read, being
+    corrupt or truncated say, is yielded itself, for the caller to find
+    out what is wrong with it.
+    """
+    if isinstance(paths_or_dirs, str):
+        paths_or_dirs = [paths_or_dirs]
+    for path in paths_or_dirs:
+        if not osp.isdir(path):
+            if archives and is_archive_extension(path):
+                for member_path in _archive_members(path):
+                    yield member_path
+            else:
+                yield path
+            continue
+        dirs = [path]
+        while dirs:
+            with os.scandir(dirs.pop()) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif is_bytecode_extension(entry.name) and entry.is_file():
+                    yield entry.path
+                elif archives and is_archive_extension(entry.name) and entry.is_file():
+                    for member_path in _archive_members(entry.path):
+                        yield member_path
+            # Pop subdirectories in name order.
+            dirs.extend(reversed(subdirs))
+
+
+def _init_load_worker():
+    # Import all of the opcode modules now, rather than in the middle
+    # of the first load that needs each one.
+    import xdis.op_imports  # noqa
+
+
+def _load_module_result(args):
+    """Run load_module() in a load_modules() worker."""
+    filename, kwargs = args
+    try:
+        if is_archive_extension(filename) and osp.isfile(filename):
+            # An archive that iter_bytecode_files() couldn't read: give
+            # the error reading it, rather than that it isn't bytecode.
+            open_archive(filename)
+        result = load_module(filename, **kwargs)
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = ImportError("%s: %s" % (type(e).__name__, e))
+        return LoadResult(filename, None, e)
+    co = result[3]
+    if isinstance(co, types.CodeType):
+        result = result[:3] + (_MarshaledCode(co),) + result[4:]
+    return LoadResult(filename, result, None)
+
+
+def _unwrap_load_result(load_result):
+    result = load_result.result
+    if result is not None and isinstance(result[3], _MarshaledCode):
+        co = marshal.loads(result[3].data)
+        return load_result._replace(result=result[:3] + (co,) + result[4:])
+    return load_result
+
+
+def load_modules(
+    paths_or_dirs,
+    workers=None,
+    ordered=False,
+    chunksize=16,
+    fast_load=False,
+    get_code=True,
+    limits=None,
+    cache=None,
+):
+    """Load many bytecode files, in parallel.
+
+    `paths_or_dirs` is a path, or a list of paths, to bytecode files,
+    zip archives, or to directories, which are searched for bytecode
+    files and zip archives. The bytecode files in archives are loaded
+    without extracting them, and each worker opens the archives itself.
+
+    Files are loaded by load_module() in a pool of `workers` processes,
+    or, if `workers` is not given, one per CPU. If `workers` is 0 or 1
+    files are loaded one at a time in this process. Files are handed out
+    to workers `chunksize` at a time.
+
+    This is a generator of LoadResults, which come in the order that
+    loads finish, or if `ordered` is set, the order of the files. A file
+    that can't be loaded gives the exception raised as its error,
+    rather than stopping the rest from loading, as does an archive that
+    can't be read.
+
+    `fast_load`, `get_code`, `limits` and `cache` are passed on to
+    load_module(). Workers can share a cache.
+    """
+    kwargs = {
+        "fast_load": fast_load,
+        "get_code": get_code,
+        "limits": limits,
+        "cache": cache,
+    }
+    tasks = (
+        (filename, kwargs)
+        for filename in iter_bytecode_files(paths_or_dirs, archives=True)
+    )
+
+    if workers is not None and workers <= 1:
+        for task in tasks:
+            yield _unwrap_load_result(_load_module_result(task))
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_load_worker) as pool:
+        if ordered:
+            results = pool.imap(_load_module_result, tasks, chunksize)
+        else:
+            results = pool.imap_unordered(_load_module_result, tasks, chunksize)
+        for load_result in results:
+            yield _unwrap_load_result(load_result)
+
+
+# Suffix added to a bytecode file name for its saved CodeIndex.
+CODE_INDEX_SUFFIX = ".xdisidx"
+
+
+def unpack_header(header, magic_int, header_size, offset=0):
+    """Return the PEP 552 flags, timestamp, source size and SipHash in
+    the part of a bytecode file header at `offset` in `header` that
+    comes after the magic number. Those that aren't stored are None.
+
+    `header_size` is the full size of the header, as given by
+    _header_size().
+    """
+    flags = timestamp = source_size = sip_hash = None
+    if header_size == 16:
+        # PEP 552. https://www.python.org/dev/peps/pep-0552/
+        flags = unpack_from("<I", header, offset)[0]
+        if (flags & 1) or magic_int == 3393:  # 3393 is 3.7.0beta3
+            # SipHash
+            sip_hash = unpack_from("<Q", header, offset + 4)[0]
+        else:
+            # Uses older-style timestamp and size
+            timestamp, source_size = unpack_from("<II", header, offset + 4)
+    elif header_size == 12:
+        # timestamp, and source size mod 2**32
+        timestamp, source_size = unpack_from("<II", header, offset)
+    else:
+        timestamp = unpack_from("<I", header, offset)[0]
+    return flags, timestamp, source_size, sip_hash
+
+
+def _header_size(version, magic_int):
+    """Return the size of the header of a bytecode file for `version`
+    and `magic_int`, magic number included."""
+    if magic_int in (3439,) or version >= (3, 7):
+        # PEP 552 bits, then a SipHash or a timestamp and source size.
+        return 16
+    # Note: a higher magic number doesn't necessarily mean a later
+    # release.  At Python 3.0 the magic number decreased
+    # significantly. Hence, the range below. Also note inclusion of
+    # the size info, occurred within a Python major/minor
+    # release. That is why there is the test on the magic value rather than
+    # PYTHON_VERSION, although PYTHON_VERSION would probably work.
+    if (3200 <= magic_int < 20121) and version >= (1, 5) or magic_int in PYPY3_MAGICS:
+        return 12
+    return 8
+
+
+def _map_file(filename):
+    """Return a read-only mmap.mmap of bytecode file `filename`."""
+    try:
+        with open(filename, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                raise ImportError("File name: '%s' is empty" % filename)
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError as e:
+        raise ImportError("File name: '%s' can't be read: %s" % (filename, e))
+
+
+def load_module_index(filename, sidecar=True, data=None):
+    """Return an xdis.codeindex.CodeIndex for the code objects in
+    bytecode file `filename`.
+
+    If `sidecar` is set, the index is read from `filename` plus
+    CODE_INDEX_SUFFIX when that exists and was made for the file as
+    it is now. Otherwise the index is built and saved there.
+
+    `data` is the contents of the file, such as an mmap.mmap of it, if
+    the caller has them. Otherwise the file is mapped here, so that
+    only its header is read when the saved index is current.
+    """
+    if data is None:
+        with _map_file(filename) as data:
+            return load_module_index(filename, sidecar, data)
+
+    magic, magic_int, version = _check_magic(bytes(data[:4]), filename)
+    magic_int = magic2int(magic)
+    header_size = _header_size(version, magic_int)
+    header = bytes(data[:header_size])
+    if len(header) < header_size:
+        raise ImportError("Header of %s is cut short" % filename)
+
+    sidecar_path = filename + CODE_INDEX_SUFFIX
+    if sidecar and osp.exists(sidecar_path):
+        try:
+            index = CodeIndex.load(sidecar_path)
+        except (OSError, ValueError, KeyError, TypeError):
+            index = None
+        if (
+            index is not None
+            and index.magic_int == magic_int
+            and index.header == header
+            and index.size == len(data)
+        ):
+            return index
+
+    body = memoryview(data)[header_size:]
+    try:
+        index = build_code_index(body, magic_int)
+    finally:
+        body.release()
+    index.header = header
+    index.size = len(data)
+    if sidecar:
+        try:
+            index.save(sidecar_path)
+        except OSError:
+            # Not being able to save the index is not a reason to fail.
+            pass
+    return index
+
+
+def load_module_code(filename, name, firstlineno=None, index=None):
+    """Load just the code object named `name` from bytecode file
+    `filename`, without decoding the rest of the file.
+
+    `name` is matched against co_name and co_qualname; `firstlineno`
+    can be given to pick between code objects with the same name.
+    `index` is the file's xdis.codeindex.CodeIndex; when it is not
+    given, it comes from load_module_index().
+
+    The file is opened once and mapped, so that only its header and the
+    parts of it that the code object needs are read.
+    """
+    with _map_file(filename) as data:
+        if index is None:
+            index = load_module_index(filename, data=data)
+        entries = index.find(name, firstlineno)
+        if not entries:
+            raise KeyError("no code object named %r in %s" % (name, filename))
+        header_size = len(index.header)
+        if index.header != data[:header_size] or index.size != len(data):
+            raise ImportError("Code index is out of date for %s" % filename)
+        body = memoryview(data)[header_size:]
+        try:
+            return load_code_at(body, index, entries[0])
+        finally:
+            body.release()
+
+
 def write_bytecode_file(
     bytecode_path, code_obj, magic_int, compilation_ts=None, filesize=0
 ):
@@ -368,7 +1030,8 @@ def write_bytecode_file(
     if isinstance(code_obj, types.CodeType):
         fp.write(marshal.dumps(code_obj))
     else:
-        fp.write(xdis.marsh.dumps(code_obj))
+        # Marshal version 4 refers back to repeated objects, from 3.4 on.
+        fp.write(xdis.marsh.dumps(code_obj, version=4, python_version=version))
     fp.close()
 
 
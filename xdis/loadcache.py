@@ -0,0 +1,244 @@
+# Copyright (c) 2024 by Rocky Bernstein
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+An on-disk cache of what ``xdis.load.load_module()`` returns.
+
+Unmarshalling bytecode for another Python version is done in Python and
+is slow. Pass a LoadCache as ``cache`` to ``load_module()`` and the
+portable code objects it returns are saved, pickled, in a cache
+directory. Loading the same bytecode again, from any path, reads them
+back from there instead.
+
+Entries are found by a hash of the contents of the bytecode file, or
+if ``key="header"`` is given, by its path, size, modification time and
+header, which saves reading the whole file.
+
+Several processes can share a cache directory. Entries are written to a
+temporary file and renamed into place, so they are never seen half
+written. When the cache grows larger than its size bound, the least
+recently used entries are removed.
+
+Entries are pickles, so only use a cache directory that nobody else can
+write to.
+"""
+
+import hashlib
+import io
+import os
+import os.path as osp
+import pickle
+import tempfile
+import types
+from collections import namedtuple
+
+from xdis.load import is_pypy, load_module_from_file_object
+from xdis.version import __version__
+
+# Counts of what a LoadCache has done in this process.
+LoadCacheStats = namedtuple("LoadCacheStats", "hits misses stores evictions")
+
+# Suffix of the files holding cache entries.
+CACHE_ENTRY_SUFFIX = ".pickle"
+
+# Bytes read from a bytecode file for the "header" key.
+CACHE_HEADER_SIZE = 16
+
+
+class LoadCache:
+    """
+    A cache directory of pickled load_module() results.
+
+    ``max_bytes`` bounds the total size of the entries. When a new entry
+    takes the cache over it, the least recently used entries are removed
+    until it is down to ``low_water`` of it.
+    """
+
+    def __init__(
+        self, directory, max_bytes=256 * 1024 * 1024, key="content", low_water=0.8
+    ):
+        if key not in ("content", "header"):
+            raise ValueError("key should be 'content' or 'header', not %r" % (key,))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.key = key
+        self.low_water = low_water
+        self.hits = self.misses = self.stores = self.evictions = 0
+        # Our idea of the size of the cache, which other processes
+        # change too. None until the directory is first scanned.
+        self.size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def stats(self):
+        return LoadCacheStats(self.hits, self.misses, self.stores, self.evictions)
+
+    def entry_path(self, digest):
+        return osp.join(self.directory, digest[:2], digest + CACHE_ENTRY_SUFFIX)
+
+    def digest(self, filename, data, fast_load):
+        """Return the key of the cache entry for bytecode file `filename`,
+        whose contents are `data` or, for the "header" key, start with it.
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(("xdis %s %s\0" % (__version__, bool(fast_load))).encode())
+        if self.key == "header":
+            stat_result = os.stat(filename)
+            h.update(
+                (
+                    "%s\0%d\0%d\0"
+                    % (
+                        osp.realpath(filename),
+                        stat_result.st_size,
+                        stat_result.st_mtime_ns,
+                    )
+                ).encode("utf-8", "surrogateescape")
+            )
+        h.update(data)
+        return h.hexdigest()
+
+    def get(self, digest):
+        """Return the load_module() result saved under `digest`, or None."""
+        path = self.entry_path(digest)
+        try:
+            with open(path, "rb") as fp:
+                result = pickle.load(fp)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # Written by some other version of the classes, say.
+            self.misses += 1
+            self._remove(path)
+            return None
+        self.hits += 1
+        # Mark it as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, digest, result):
+        """Save load_module() result `result` under `digest`."""
+        path = self.entry_path(digest)
+        dirname = osp.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump(result, fp, pickle.HIGHEST_PROTOCOL)
+                nbytes = fp.tell()
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.stores += 1
+
+        if self.size is None:
+            self.size = self.scan()[0]
+        else:
+            self.size += nbytes
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def scan(self):
+        """Return the total size of the cache entries, and a list of
+        (last use, size, path) for each of them.
+        """
+        total = 0
+        entries = []
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if not entry.name.endswith(CACHE_ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat_result = entry.stat()
+                except OSError:
+                    # Removed by another process.
+                    continue
+                total += stat_result.st_size
+                entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+        return total, entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is no
+        bigger than low_water of max_bytes."""
+        total, entries = self.scan()
+        target = self.max_bytes * self.low_water
+        entries.sort()
+        for _, nbytes, path in entries:
+            if total <= target:
+                break
+            if self._remove(path):
+                self.evictions += 1
+            total -= nbytes
+        self.size = total
+
+    def clear(self):
+        for _, _, path in self.scan()[1]:
+            self._remove(path)
+        self.size = 0
+
+    def load_module(self, filename, fast_load=False):
+        """Return load_module(filename, fast_load=fast_load) from the cache
+        if it is there. Otherwise load it and save it in the cache.
+
+        Only results with portable code objects are saved. Code objects
+        for the running Python are quick to load anyway, and can't be
+        pickled.
+        """
+        with open(filename, "rb") as fp:
+            if self.key == "header":
+                data = fp.read(CACHE_HEADER_SIZE)
+            else:
+                data = fp.read()
+            digest = self.digest(filename, data, fast_load)
+            result = self.get(digest)
+            if result is not None:
+                # This depends on the file name as well as the contents.
+                return result[:4] + (is_pypy(result[2], filename),) + result[5:]
+
+            if self.key == "header":
+                fp.seek(0)
+                data = fp.read()
+
+        result = load_module_from_file_object(
+            io.BytesIO(data), filename=filename, fast_load=fast_load
+        )
+        if not isinstance(result[3], types.CodeType):
+            try:
+                self.put(digest, result)
+            except Exception:
+                # The cache only saves time; don't fail the load.
+                pass
+        return result
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
+
+    def __repr__(self):
+        return "LoadCache(%r, max_bytes=%d, key=%r)" % (
+            self.directory,
+            self.max_bytes,
+            self.key,
+        )
@@ -30,7 +30,10 @@ there). Details of the format may change between Python versions.
 import struct
 import types
 
-from xdis.codetype import Code2, Code3
+from xdis.codetype import Code2, Code3, to_portable
+from xdis.cross_types import LongTypeForPython3, UnicodeForPython3
+from xdis.magics import GRAAL3_MAGICS, magic2int, magic_int2tuple, magics
+from xdis.unmarshal import get_code_layout, graal_code, split_localsplus
 from xdis.version_info import PYTHON3, PYTHON_VERSION_TRIPLE, version_tuple_to_str
 
 try:
@@ -85,17 +88,58 @@ TYPE_SMALL_TUPLE = ")"  # since 3.4
 TYPE_SHORT_ASCII = "z"  # since 3.4
 TYPE_SHORT_ASCII_INTERNED = "Z"  # since 3.4
 
+# Or'd into the type of an object that is referred back to, since 3.4.
+FLAG_REF = 0x80
+
+
+# Marshalled data is written to a file this much at a time by dump().
+DUMP_CHUNK_SIZE = 64 * 1024
+
+_LONG = struct.Struct("<I")
+_SHORT = struct.Struct("<H")
+_DOUBLE = struct.Struct("<d")
+
+
+def _str_bytes(s):
+    """Return the bytes of a string marshaled as bytes: one byte per
+    character if it can, and otherwise UTF-8."""
+    try:
+        return s.encode("latin-1")
+    except UnicodeEncodeError:
+        return s.encode("utf-8", "surrogatepass")
+
+
+# Objects that marshal writes as just their type, and never refers back to.
+_UNREFERENCED_TYPES = (type(None), bool, type(Ellipsis), type(StopIteration))
+
 
 class _Marshaller:
-    """Python marshalling routine that runs in Python 2 and Python 3.
+    """Python marshalling routine.
     We also extend to allow for xdis Code2 and Code3 types and instances.
+
+    Marshaled data collects in the bytearray ``buffer``. If ``writefunc``
+    is given, the buffer is passed to it and emptied whenever it grows
+    past DUMP_CHUNK_SIZE, and by ``flush()``.
+
+    If ``refs`` is "identity" or "equal", objects are written in full
+    the first time, with FLAG_REF, and as a TYPE_REF back to that after.
+    As with marshal, objects that come up only once are flagged too, as
+    finding those first would take another pass.
     """
 
     dispatch = {}
 
-    def __init__(self, writefunc, python_version=None):
-        self._write = writefunc
-        self.python_version = python_version
+    def __init__(self, writefunc=None, python_version=None, refs=None):
+        self.buffer = bytearray()
+        self._writefunc = writefunc
+        self.python_version = python_version or PYTHON_VERSION_TRIPLE
+        self.refs = refs
+        # key -> (reference index, object), keeping the object alive so
+        # that its id isn't reused.
+        self.seen = {}
+        # id -> (object, key), for refs="equal"
+        self.keys = {}
+        self.flag = 0
 
     def dump(self, x):
         if (
@@ -106,15 +150,22 @@ class _Marshaller:
                 "code type passed for version %s but we are running version %s"
                 % (version_tuple_to_str(), self.python_version)
             )
+        if self.refs is not None and type(x) not in _UNREFERENCED_TYPES:
+            key = id(x) if self.refs == "identity" else self.equal_key(x)
+            seen = self.seen.get(key)
+            if seen is not None:
+                self.w_type(TYPE_REF)
+                self.w_long(seen[0])
+                return
+            self.seen[key] = (len(self.seen), x)
+            self.flag = FLAG_REF
         try:
             self.dispatch[type(x)](self, x)
         except KeyError:
             if isinstance(x, Code3):
                 self.dispatch[Code3](self, x)
-                return
             elif isinstance(x, Code2):
                 self.dispatch[Code2](self, x)
-                return
             else:
                 for tp in type(x).mro():
                     func = self.dispatch.get(tp)
@@ -122,68 +173,97 @@ class _Marshaller:
                         break
                 else:
                     raise ValueError("unmarshallable object")
-            func(self, x)
+                func(self, x)
+        if self._writefunc is not None and len(self.buffer) >= DUMP_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Pass what has been marshaled so far to writefunc."""
+        if self.buffer:
+            data, self.buffer = self.buffer, bytearray()
+            self._writefunc(data)
+
+    def equal_key(self, x):
+        """Return a key for `x` that is the same for equal constants of
+        the same type. Other objects are keyed by identity.
+        """
+        memo = self.keys.get(id(x))
+        if memo is not None:
+            return memo[1]
+        x_type = type(x)
+        if x_type in (str, bytes, int):
+            key = (x_type, x)
+        elif x_type is float:
+            # 0.0 == -0.0, but they are different constants.
+            key = (x_type, x.hex())
+        elif x_type is complex:
+            key = (x_type, x.real.hex(), x.imag.hex())
+        elif x_type is tuple:
+            # Keeps (1,) and (1.0,) apart.
+            key = (x_type,) + tuple(self.equal_key(item) for item in x)
+        elif x_type is frozenset:
+            key = (x_type, frozenset(self.equal_key(item) for item in x))
+        else:
+            key = (None, id(x))
+        self.keys[id(x)] = (x, key)
+        return key
+
+    def w_type(self, t):
+        self.buffer.append(ord(t) | self.flag)
+        self.flag = 0
 
     def w_long64(self, x):
         self.w_long(x)
         self.w_long(x >> 32)
 
     def w_long(self, x):
-        a = chr(x & 0xFF)
-        x >>= 8
-        b = chr(x & 0xFF)
-        x >>= 8
-        c = chr(x & 0xFF)
-        x >>= 8
-        d = chr(x & 0xFF)
-        self._write(a + b + c + d)
+        self.buffer += _LONG.pack(x & 0xFFFFFFFF)
 
     def w_short(self, x):
-        self._write(chr(x & 0xFF))
-        self._write(chr((x >> 8) & 0xFF))
+        self.buffer += _SHORT.pack(x & 0xFFFF)
+
+    def w_bytes(self, s):
+        """Write the length of bytes `s`, and `s`."""
+        self.buffer += _LONG.pack(len(s) & 0xFFFFFFFF)
+        self.buffer += s
 
     def dump_none(self, x):
-        self._write(TYPE_NONE)
+        self.w_type(TYPE_NONE)
 
     dispatch[type(None)] = dump_none
 
     def dump_bool(self, x):
         if x:
-            self._write(TYPE_TRUE)
+            self.w_type(TYPE_TRUE)
         else:
-            self._write(TYPE_FALSE)
+            self.w_type(TYPE_FALSE)
 
     dispatch[bool] = dump_bool
 
     def dump_stopiter(self, x):
         if x is not StopIteration:
             raise ValueError("unmarshallable object")
-        self._write(TYPE_STOPITER)
+        self.w_type(TYPE_STOPITER)
 
     dispatch[type(StopIteration)] = dump_stopiter
 
     def dump_ellipsis(self, x):
-        self._write(TYPE_ELLIPSIS)
+        self.w_type(TYPE_ELLIPSIS)
 
-    try:
-        dispatch[type(Ellipsis)] = dump_ellipsis
-    except NameError:
-        pass
+    dispatch[type(Ellipsis)] = dump_ellipsis
 
     # In Python3, this function is not used; see dump_long() below.
     def dump_int(self, x):
         y = x >> 31
         if y and y != -1:
-            self._write(TYPE_INT64)
+            self.w_type(TYPE_INT64)
             self.w_long64(x)
         else:
-            self._write(TYPE_INT)
+            self.w_type(TYPE_INT)
             self.w_long(x)
 
-    dispatch[int] = dump_int
-
     def dump_long(self, x):
-        self._write(TYPE_LONG)
+        self.w_type(TYPE_LONG)
         sign = 1
         if x < 0:
             sign = -1
@@ -196,81 +276,55 @@ class _Marshaller:
         for d in digits:
             self.w_short(d)
 
-    try:
-        long
-    except NameError:
-        dispatch[int] = dump_long
-    else:
-        dispatch[long] = dump_long  # noqa
+    dispatch[int] = dump_long
 
     def dump_float(self, x):
-        write = self._write
-        write(TYPE_FLOAT)
-        s = repr(x)
-        write(chr(len(s)))
-        write(s)
+        self.w_type(TYPE_FLOAT)
+        s = repr(x).encode("ascii")
+        self.buffer.append(len(s))
+        self.buffer += s
 
     dispatch[float] = dump_float
 
     def dump_binary_float(self, x):
-        write = self._write
-        write(TYPE_BINARY_FLOAT)
-        write(struct.pack("<d", x))
+        self.w_type(TYPE_BINARY_FLOAT)
+        self.buffer += _DOUBLE.pack(x)
 
     dispatch[TYPE_BINARY_FLOAT] = dump_float
 
     def dump_complex(self, x):
-        write = self._write
-        write(TYPE_COMPLEX)
-        s = repr(x.real)
-        write(chr(len(s)))
-        write(s)
-        s = repr(x.imag)
-        write(chr(len(s)))
-        write(s)
+        self.w_type(TYPE_COMPLEX)
+        for part in (x.real, x.imag):
+            s = repr(part).encode("ascii")
+            self.buffer.append(len(s))
+            self.buffer += s
 
-    try:
-        dispatch[complex] = dump_complex
-    except NameError:
-        pass
+    dispatch[complex] = dump_complex
 
     def dump_binary_complex(self, x):
-        write = self._write
-        write(TYPE_BINARY_COMPLEX)
-        write(struct.pack("<d", x.real))
-        write(struct.pack("<d", x.imag))
+        self.w_type(TYPE_BINARY_COMPLEX)
+        self.buffer += _DOUBLE.pack(x.real)
+        self.buffer += _DOUBLE.pack(x.imag)
 
     dispatch[TYPE_BINARY_COMPLEX] = dump_binary_complex
 
     def dump_string(self, x):
         # XXX we can't check for interned strings, yet,
         # so we (for now) never create TYPE_INTERNED or TYPE_STRINGREF
-        self._write(TYPE_STRING)
-        self.w_long(len(x))
-        self._write(x)
+        self.w_type(TYPE_STRING)
+        self.w_bytes(_str_bytes(x) if isinstance(x, str) else x)
 
-    if PYTHON_VERSION_TRIPLE > (2, 5):
-        dispatch[bytes] = dump_string
-        dispatch[bytearray] = dump_string
+    dispatch[bytes] = dump_string
+    dispatch[bytearray] = dump_string
 
     def dump_unicode(self, x):
-        self._write(TYPE_UNICODE)
-        if not PYTHON3 and self.python_version < (3, 0):
-            s = x.encode("utf8")
-        else:
-            s = x
-        self.w_long(len(s))
-        self._write(s)
+        self.w_type(TYPE_UNICODE)
+        self.w_bytes(x.encode("utf-8", "surrogatepass"))
 
-    try:
-        unicode
-    except NameError:
-        dispatch[str] = dump_unicode
-    else:
-        dispatch[unicode] = dump_unicode  # noqa
+    dispatch[str] = dump_unicode
 
     def dump_tuple(self, x):
-        self._write(TYPE_TUPLE)
+        self.w_type(TYPE_TUPLE)
         self.w_long(len(x))
         for item in x:
             self.dump(item)
@@ -279,7 +333,7 @@ class _Marshaller:
     dispatch[TYPE_TUPLE] = dump_tuple
 
     def dump_small_tuple(self, x):
-        self._write(TYPE_SMALL_TUPLE)
+        self.w_type(TYPE_SMALL_TUPLE)
         self.w_short(len(x))
         for item in x:
             self.dump(item)
@@ -287,7 +341,7 @@ class _Marshaller:
     dispatch[TYPE_SMALL_TUPLE] = dump_small_tuple
 
     def dump_list(self, x):
-        self._write(TYPE_LIST)
+        self.w_type(TYPE_LIST)
         self.w_long(len(x))
         for item in x:
             self.dump(item)
@@ -296,11 +350,11 @@ class _Marshaller:
     dispatch[TYPE_LIST] = dump_tuple
 
     def dump_dict(self, x):
-        self._write(TYPE_DICT)
+        self.w_type(TYPE_DICT)
         for key, value in x.items():
             self.dump(key)
             self.dump(value)
-        self._write(TYPE_NULL)
+        self.w_type(TYPE_NULL)
 
     dispatch[dict] = dump_dict
 
@@ -309,7 +363,7 @@ class _Marshaller:
         # but Python 3 marshaling, by default, will dump strings as
         # unicode. Force marsaling this type as string.
 
-        self._write(TYPE_CODE)
+        self.w_type(TYPE_CODE)
         self.w_long(x.co_argcount)
         self.w_long(x.co_nlocals)
         self.w_long(x.co_stacksize)
@@ -322,7 +376,7 @@ class _Marshaller:
         self.dump(x.co_consts)
 
         # The tuple "names" in Python2 must have string entries
-        self._write(TYPE_TUPLE)
+        self.w_type(TYPE_TUPLE)
         self.w_long(len(x.co_names))
         for name in x.co_names:
             self.dump_string(name)
@@ -341,7 +395,7 @@ class _Marshaller:
     # FIXME: will probably have to adjust similar to how we
     # adjusted dump_code2
     def dump_code3(self, x):
-        self._write(TYPE_CODE)
+        self.w_type(TYPE_CODE)
         self.w_long(x.co_argcount)
         if hasattr(x, "co_posonlyargcount"):
             self.w_long(x.co_posonlyargcount)
@@ -364,50 +418,37 @@ class _Marshaller:
         self.dump(linetable)
 
     dispatch[Code3] = dump_code3
-
-    try:
-        if PYTHON3:
-            dispatch[types.CodeType] = dump_code3
-        else:
-            dispatch[types.CodeType] = dump_code2
-    except NameError:
-        pass
+    dispatch[types.CodeType] = dump_code3
 
     def dump_set(self, x):
-        self._write(TYPE_SET)
+        self.w_type(TYPE_SET)
         self.w_long(len(x))
         for each in x:
             self.dump(each)
 
-    try:
-        dispatch[set] = dump_set
-    except NameError:
-        pass
+    dispatch[set] = dump_set
 
     def dump_frozenset(self, x):
-        self._write(TYPE_FROZENSET)
+        self.w_type(TYPE_FROZENSET)
         self.w_long(len(x))
         for each in x:
             self.dump(each)
 
-    try:
-        dispatch[frozenset] = dump_frozenset
-    except NameError:
-        pass
+    dispatch[frozenset] = dump_frozenset
 
     # FIXME: dump_ascii, dump_short_ascii are just guesses
     def dump_ascii(self, x):
-        self._write(TYPE_ASCII)
-        self.w_long(len(x))
-        self._write(x)
+        self.w_type(TYPE_ASCII)
+        self.w_bytes(_str_bytes(x))
 
     dispatch[TYPE_ASCII] = dump_ascii
 
     def dump_short_ascii(self, x):
-        self._write(TYPE_SHORT_ASCII)
+        self.w_type(TYPE_SHORT_ASCII)
+        s = _str_bytes(x)
         # FIXME: check len(x)?
-        self.w_short(len(x))
-        self._write(x)
+        self.w_short(len(s))
+        self.buffer += s
 
     dispatch[TYPE_SHORT_ASCII] = dump_short_ascii
 
@@ -418,74 +459,156 @@ class _NULL:
     pass
 
 
-class _StringBuffer:
-    def __init__(self, value):
-        self.bufstr = value
-        self.bufpos = 0
+# Readers of fixed-size fields, used with unpack_from() on the buffer.
+_unpack_short = struct.Struct("<h").unpack_from
+_unpack_long = struct.Struct("<i").unpack_from
+_unpack_long64 = struct.Struct("<q").unpack_from
+_unpack_double = struct.Struct("<d").unpack_from
+_unpack_complex = struct.Struct("<dd").unpack_from
+
+_REF = ord(TYPE_REF)
 
-    def read(self, n):
-        pos = self.bufpos
-        newpos = pos + n
-        ret = self.bufstr[pos:newpos]
-        self.bufpos = newpos
-        return ret
 
+def _magic_int(python_version):
+    """Return the magic number of Python `python_version`, a version
+    string such as "3.8" or a version tuple."""
+    if not isinstance(python_version, str):
+        python_version = version_tuple_to_str(python_version)
+    for version in (python_version, ".".join(python_version.split(".")[:2])):
+        if version in magics:
+            return magic2int(magics[version])
+    raise ValueError("no magic number is known for Python %s" % python_version)
+
+
+class _FastUnmarshaller:
+    """
+    Unmarshals the marshal data in ``buffer``: ``bytes``, ``bytearray``,
+    ``memoryview`` or ``mmap``.
+
+    When the Python version is known, from ``magic_int`` or else from
+    ``python_version``, objects are decoded as xdis.unmarshal.load_code()
+    decodes them for that version: code objects have that version's
+    layout and become xdis portable code objects, and strings, numbers
+    and references are handled the same way. Otherwise, code objects are
+    taken to have the Python 2 layout, and strings are left as bytes.
+    """
 
-class _Unmarshaller:
     dispatch = {}
 
-    def __init__(self, readfunc, python_version=None):
-        self._read = readfunc
+    # Where decoding for a known Python version differs. These follow
+    # xdis.unmarshal, which for one thing takes "<" to be a frozenset.
+    version_dispatch = {}
+
+    def __init__(self, buffer, python_version=None, intern_pool=None, magic_int=None):
+        # A view, rather than a copy, of what isn't already bytes. What is
+        # returned from it is copied out as bytes, and _load() releases it.
+        self.bufstr = buffer if isinstance(buffer, bytes) else memoryview(buffer)
+        self.bufpos = 0
         self._stringtable = []
+        self.internObjects = []
         self.python_version = python_version
+        self.intern_pool = intern_pool
+        # Where the last object with FLAG_REF starts, after its type
+        # code, and its place in internObjects.
+        self.ref_start = -1
+        self.ref_index = None
+
+        if magic_int is None and python_version is not None:
+            magic_int = _magic_int(python_version)
+        self.magic_int = magic_int
+        dispatch = self.dispatch
+        if magic_int is None:
+            self.version_tuple = None
+            self.code_layout = None
+            self.bytes_for_s = True
+            self.null = _NULL
+            self.unicode_for_python3 = False
+            self.short_complex = True
+        else:
+            dispatch = dict(dispatch)
+            dispatch.update(self.version_dispatch)
+            self.version_tuple = magic_int2tuple(magic_int)
+            self.code_layout = get_code_layout(magic_int)
+            self.bytes_for_s = False
+            self.null = None
+            self.unicode_for_python3 = self.version_tuple < (3, 0)
+            self.short_complex = magic_int <= 62061
+            self.is_graal = magic_int in GRAAL3_MAGICS
+            # As in xdis.unmarshal, strings in code objects after Python
+            # 3.0 are bytes, except in co_varnames.
+            self.code_bytes_for_s = self.version_tuple > (3, 0)
+            self.code_object_fields = tuple(
+                (name, name != "co_varnames" and self.code_bytes_for_s)
+                for name in self.code_layout.objects
+            )
+
+        # The routine for each type code, indexed by its value.
+        self.table = [None] * FLAG_REF
+        for c, func in dispatch.items():
+            self.table[ord(c)] = func
 
     def load(self):
-        c = self._read(1)
-        if not c:
+        pos = self.bufpos
+        try:
+            c = self.bufstr[pos]
+        except IndexError:
             raise EOFError
+        if c == _REF:
+            # References are the most common objects since 3.4.
+            self.bufpos = pos + 5
+            ret = self.internObjects[_unpack_long(self.bufstr, pos + 1)[0]]
+            if self.intern_pool is not None:
+                ret = self.intern_pool.intern(ret)
+            return ret
+        self.bufpos = pos + 1
+        func = self.table[c & (FLAG_REF - 1)]
+        if func is None:
+            raise ValueError(
+                "bad marshal code at position %d: %c" % (pos, c & (FLAG_REF - 1))
+            )
+        if c & FLAG_REF:
+            # References are numbered in the order that objects start,
+            # so take a place before decoding what is inside.
+            refs = self.internObjects
+            i = len(refs)
+            refs.append(None)
+            self.ref_start = pos + 1
+            self.ref_index = i
+            ret = func(self)
+            refs[i] = ret
+        else:
+            ret = func(self)
+        if self.intern_pool is not None:
+            ret = self.intern_pool.intern(ret)
+        return ret
+
+    def ref_early(self, obj):
+        """If the object whose type code has just been read has FLAG_REF,
+        refer to `obj` before it is filled in, as marshal does for lists
+        and dicts."""
+        if self.ref_start == self.bufpos:
+            self.internObjects[self.ref_index] = obj
+
+    def r_str(self, start, end):
+        """Return the buffer from `start` to `end` as a str, or as bytes
+        if it isn't UTF-8."""
+        self.bufpos = end
+        s = bytes(self.bufstr[start:end])
         try:
-            return self.dispatch[c](self)
-        except KeyError:
-            raise ValueError("bad marshal code: %c (%d)" % (c, Ord(c)))
-
-    def r_byte(self):
-        return Ord(self._read(1))
-
-    def r_short(self):
-        lo = Ord(self._read(1))
-        hi = Ord(self._read(1))
-        x = lo | (hi << 8)
-        if x & 0x8000:
-            x = x - 0x10000
-        return x
-
-    def r_long(self):
-        s = self._read(4)
-        a = Ord(s[0])
-        b = Ord(s[1])
-        c = Ord(s[2])
-        d = Ord(s[3])
-        x = a | (b << 8) | (c << 16) | (d << 24)
-        if d & 0x80 and x > 0:
-            x = -((1 << 32) - x)
-            return int(x)
+            return s.decode("utf-8")
+        except UnicodeDecodeError:
+            return s
+
+    def r_float(self):
+        pos = self.bufpos
+        if self.short_complex:
+            n = self.bufstr[pos]
+            pos += 1
         else:
-            return x
-
-    def r_long64(self):
-        a = Ord(self._read(1))
-        b = Ord(self._read(1))
-        c = Ord(self._read(1))
-        d = Ord(self._read(1))
-        e = Ord(self._read(1))
-        f = Ord(self._read(1))
-        g = Ord(self._read(1))
-        h = Ord(self._read(1))
-        x = a | (b << 8) | (c << 16) | (d << 24)
-        x = x | (e << 32) | (f << 40) | (g << 48) | (h << 56)
-        if h & 0x80 and x > 0:
-            x = -((1 << 64) - x)
-        return x
+            n = _unpack_long(self.bufstr, pos)[0]
+            pos += 4
+        self.bufpos = pos + n
+        return float(bytes(self.bufstr[pos : pos + n]))
 
     def load_null(self):
         return _NULL
@@ -496,6 +619,7 @@ class _Unmarshaller:
         return None
 
     dispatch[TYPE_NONE] = load_none
+    version_dispatch[TYPE_NULL] = load_none
 
     def load_true(self):
         return True
@@ -507,11 +631,6 @@ class _Unmarshaller:
 
     dispatch[TYPE_FALSE] = load_false
 
-    def load_ascii(self):
-        return self.r_byte()
-
-    dispatch[TYPE_ASCII] = load_null
-
     def load_stopiter(self):
         return StopIteration
 
@@ -522,412 +641,152 @@ class _Unmarshaller:
 
     dispatch[TYPE_ELLIPSIS] = load_ellipsis
 
-    dispatch[TYPE_INT] = r_long
+    def load_int(self):
+        pos = self.bufpos
+        self.bufpos = pos + 4
+        return _unpack_long(self.bufstr, pos)[0]
 
-    dispatch[TYPE_INT64] = r_long64
+    dispatch[TYPE_INT] = load_int
+
+    def load_int64(self):
+        pos = self.bufpos
+        self.bufpos = pos + 8
+        return _unpack_long64(self.bufstr, pos)[0]
+
+    dispatch[TYPE_INT64] = load_int64
 
     def load_long(self):
-        size = self.r_long()
-        sign = 1
-        if size < 0:
-            sign = -1
-            size = -size
+        size = self.load_int()
         x = 0
-        for i in range(size):
-            d = self.r_short()
-            x = x | (d << (i * 15))
-        return x * sign
+        for i in range(abs(size)):
+            x |= _unpack_short(self.bufstr, self.bufpos)[0] << (i * 15)
+            self.bufpos += 2
+        return -x if size < 0 else x
 
     dispatch[TYPE_LONG] = load_long
 
+    def load_python2_long(self):
+        return LongTypeForPython3(self.load_long())
+
+    version_dispatch[TYPE_LONG] = load_python2_long
+
     def load_float(self):
-        n = Ord(self._read(1))
-        s = self._read(n)
-        return float(s)
+        pos = self.bufpos
+        n = self.bufstr[pos]
+        self.bufpos = pos + 1 + n
+        return float(bytes(self.bufstr[pos + 1 : self.bufpos]))
 
     dispatch[TYPE_FLOAT] = load_float
 
     def load_binary_float(self):
-        f = self._read(8)
-        return float(struct.unpack("<d", f)[0])
+        pos = self.bufpos
+        self.bufpos = pos + 8
+        return _unpack_double(self.bufstr, pos)[0]
 
     dispatch[TYPE_BINARY_FLOAT] = load_binary_float
 
     def load_complex(self):
-        n = Ord(self._read(1))
-        s = self._read(n)
-        real = float(s)
-        n = Ord(self._read(1))
-        s = self._read(n)
-        imag = float(s)
-        return complex(real, imag)
+        real = self.r_float()
+        return complex(real, self.r_float())
 
     dispatch[TYPE_COMPLEX] = load_complex
 
+    def load_binary_complex(self):
+        pos = self.bufpos
+        self.bufpos = pos + 16
+        return complex(*_unpack_complex(self.bufstr, pos))
+
+    dispatch[TYPE_BINARY_COMPLEX] = load_binary_complex
+
     def load_string(self):
-        n = self.r_long()
-        return self._read(n)
+        pos = self.bufpos + 4
+        end = pos + _unpack_long(self.bufstr, self.bufpos)[0]
+        if self.bytes_for_s:
+            self.bufpos = end
+            return bytes(self.bufstr[pos:end])
+        return self.r_str(pos, end)
 
     dispatch[TYPE_STRING] = load_string
 
+    def r_intern(self, s):
+        if isinstance(s, str):
+            s = intern(s)
+        self._stringtable.append(s)
+        return s
+
     def load_interned(self):
-        n = self.r_long()
-        ret = intern(self._read(n))
-        self._stringtable.append(ret)
-        return ret
+        pos = self.bufpos + 4
+        return self.r_intern(
+            self.r_str(pos, pos + _unpack_long(self.bufstr, self.bufpos)[0])
+        )
 
     dispatch[TYPE_INTERNED] = load_interned
+    dispatch[TYPE_ASCII_INTERNED] = load_interned
 
-    def load_stringref(self):
-        n = self.r_long()
-        return self._stringtable[n]
-
-    dispatch[TYPE_STRINGREF] = load_stringref
-
-    def load_unicode(self):
-        n = self.r_long()
-        s = self._read(n)
-        ret = s.decode("utf8")
-        return ret
-
-    dispatch[TYPE_UNICODE] = load_unicode
-
-    def load_tuple(self):
-        return tuple(self.load_list())
-
-    dispatch[TYPE_TUPLE] = load_tuple
-
-    def load_list(self):
-        n = self.r_long()
-        list = [self.load() for i in range(n)]
-        return list
-
-    dispatch[TYPE_LIST] = load_list
-
-    def load_dict(self):
-        d = {}
-        while 1:
-            key = self.load()
-            if key is _NULL:
-                break
-            value = self.load()
-            d[key] = value
-        return d
-
-    dispatch[TYPE_DICT] = load_dict
-
-    def load_code(self):
-        argcount = self.r_long()
-        if self.python_version and self.python_version >= "3.0":
-            is_python3 = True
-            kwonlyargcount = self.r_long()
-        else:
-            is_python3 = False
-        nlocals = self.r_long()
-        stacksize = self.r_long()
-        flags = self.r_long()
-        code = self.load()
-        consts = self.load()
-        names = self.load()
-        varnames = self.load()
-        freevars = self.load()
-        cellvars = self.load()
-        filename = self.load()
-        name = self.load()
-        firstlineno = self.r_long()
-        lnotab = self.load()
-        if is_python3:
-            if PYTHON3:
-                return types.CodeType(
-                    argcount,
-                    kwonlyargcount,
-                    nlocals,
-                    stacksize,
-                    flags,
-                    code,
-                    consts,
-                    names,
-                    varnames,
-                    filename,
-                    name,
-                    firstlineno,
-                    lnotab,
-                    freevars,
-                    cellvars,
-                )
-            else:
-                return Code3(
-                    argcount,
-                    kwonlyargcount,
-                    nlocals,
-                    stacksize,
-                    flags,
-                    code,
-                    consts,
-                    names,
-                    varnames,
-                    filename,
-                    name,
-                    firstlineno,
-                    lnotab,
-                    freevars,
-                    cellvars,
-                )
-        else:
-            if PYTHON3:
-                return Code2(
-                    argcount,
-                    nlocals,
-                    stacksize,
-                    flags,
-                    code,
-                    consts,
-                    names,
-                    varnames,
-                    filename,
-                    name,
-                    firstlineno,
-                    lnotab,
-                    freevars,
-                    cellvars,
-                )
-            else:
-                return types.CodeType(
-                    argcount,
-                    nlocals,
-                    stacksize,
-                    flags,
-                    code,
-                    consts,
-                    names,
-                    varnames,
-                    filename,
-                    name,
-                    firstlineno,
-                    lnotab,
-                    freevars,
-                    cellvars,
-                )
-
-    dispatch[TYPE_CODE] = load_code
-
-    def load_set(self):
-        n = self.r_long()
-        args = [self.load() for i in range(n)]
-        return set(args)
-
-    dispatch[TYPE_SET] = load_set
-
-    def load_frozenset(self):
-        n = self.r_long()
-        args = [self.load() for i in range(n)]
-        return frozenset(args)
-
-    dispatch[TYPE_FROZENSET] = load_frozenset
-
-
-# ________________________________________________________________
-
-
-def _read(self, n):
-    pos = self.bufpos
-    newpos = pos + n
-    if newpos > len(self.bufstr):
-        raise EOFError
-    ret = self.bufstr[pos:newpos]
-    self.bufpos = newpos
-    return ret
-
-
-def _read1(self):
-    ret = self.bufstr[self.bufpos]
-    self.bufpos += 1
-    return ret
-
-
-def _r_short(self):
-    lo = Ord(_read1(self))
-    hi = Ord(_read1(self))
-    x = lo | (hi << 8)
-    if x & 0x8000:
-        x = x - 0x10000
-    return x
-
-
-def _r_long(self):
-    # inlined this most common case
-    p = self.bufpos
-    s = self.bufstr
-    a = Ord(s[p])
-    b = Ord(s[p + 1])
-    c = Ord(s[p + 2])
-    d = Ord(s[p + 3])
-    self.bufpos += 4
-    x = a | (b << 8) | (c << 16) | (d << 24)
-    if d & 0x80 and x > 0:
-        x = -((1 << 32) - x)
-        return int(x)
-    else:
-        return x
-
-
-def _r_long64(self):
-    a = Ord(_read1(self))
-    b = Ord(_read1(self))
-    c = Ord(_read1(self))
-    d = Ord(_read1(self))
-    e = Ord(_read1(self))
-    f = Ord(_read1(self))
-    g = Ord(_read1(self))
-    h = Ord(_read1(self))
-    x = a | (b << 8) | (c << 16) | (d << 24)
-    x = x | (e << 32) | (f << 40) | (g << 48) | (h << 56)
-    if h & 0x80 and x > 0:
-        x = -((1 << 64) - x)
-    return x
-
-
-_load_dispatch = {}
-
-
-class _FastUnmarshaller:
-    dispatch = {}
-
-    def __init__(self, buffer, python_version=None):
-        self.bufstr = buffer
-        self.bufpos = 0
-        self._stringtable = []
-        self.python_version = python_version
-
-    def load(self):
-        # make flow space happy
-        c = "?"
+    def load_short_ascii_interned(self):
+        pos = self.bufpos + 1
+        end = pos + self.bufstr[self.bufpos]
+        self.bufpos = end
         try:
-            c = self.bufstr[self.bufpos]
-            if PYTHON3:
-                c = chr(c)
-            self.bufpos += 1
-            return _load_dispatch[c](self)
-        except KeyError:
-            exception = ValueError(
-                "bad marshal code at position %d: %c" % (self.bufpos - 1, c)
-            )
-        except IndexError:
-            exception = EOFError
-        raise exception
-
-    def load_null(self):
-        return _NULL
-
-    dispatch[TYPE_NULL] = load_null
-
-    def load_none(self):
-        return None
-
-    dispatch[TYPE_NONE] = load_none
-
-    def load_true(self):
-        return True
-
-    dispatch[TYPE_TRUE] = load_true
-
-    def load_false(self):
-        return False
-
-    dispatch[TYPE_FALSE] = load_false
-
-    def load_stopiter(self):
-        return StopIteration
-
-    dispatch[TYPE_STOPITER] = load_stopiter
-
-    def load_ellipsis(self):
-        return Ellipsis
-
-    dispatch[TYPE_ELLIPSIS] = load_ellipsis
-
-    def load_int(self):
-        return _r_long(self)
-
-    dispatch[TYPE_INT] = load_int
-
-    def load_int64(self):
-        return _r_long64(self)
-
-    dispatch[TYPE_INT64] = load_int64
-
-    def load_long(self):
-        size = _r_long(self)
-        sign = 1
-        if size < 0:
-            sign = -1
-            size = -size
-        x = 0
-        for i in range(size):
-            d = _r_short(self)
-            x = x | (d << (i * 15))
-        return x * sign
-
-    dispatch[TYPE_LONG] = load_long
-
-    def load_float(self):
-        n = Ord(_read1(self))
-        s = _read(self, n)
-        return float(s)
-
-    dispatch[TYPE_FLOAT] = load_float
-
-    def load_complex(self):
-        n = Ord(_read1(self))
-        s = _read(self, n)
-        real = float(s)
-        n = Ord(_read1(self))
-        s = _read(self, n)
-        imag = float(s)
-        return complex(real, imag)
+            ret = intern(bytes(self.bufstr[pos:end]).decode("ascii"))
+        except UnicodeDecodeError:
+            ret = self.r_str(pos, end)
+        self._stringtable.append(ret)
+        return ret
 
-    dispatch[TYPE_COMPLEX] = load_complex
+    dispatch[TYPE_SHORT_ASCII_INTERNED] = load_short_ascii_interned
 
-    def load_string(self):
-        n = _r_long(self)
-        return _read(self, n)
+    def load_ascii(self):
+        pos = self.bufpos + 4
+        return self.r_str(pos, pos + _unpack_long(self.bufstr, self.bufpos)[0])
 
-    dispatch[TYPE_STRING] = load_string
+    dispatch[TYPE_ASCII] = load_ascii
 
-    def load_interned(self):
-        n = _r_long(self)
-        s = _read(self, n)
-        if PYTHON3:
-            s = s.decode("utf8")
-        ret = intern(s)
-        self._stringtable.append(ret)
-        return ret
+    def load_short_ascii(self):
+        pos = self.bufpos + 1
+        return self.r_str(pos, pos + self.bufstr[self.bufpos])
 
-    dispatch[TYPE_INTERNED] = load_interned
+    dispatch[TYPE_SHORT_ASCII] = load_short_ascii
 
     def load_stringref(self):
-        n = _r_long(self)
-        return self._stringtable[n]
+        return self._stringtable[self.load_int()]
 
     dispatch[TYPE_STRINGREF] = load_stringref
 
+    def load_ref(self):
+        return self.internObjects[self.load_int()]
+
+    dispatch[TYPE_REF] = load_ref
+
     def load_unicode(self):
-        n = _r_long(self)
-        s = _read(self, n)
-        ret = s.decode("utf8")
-        return ret
+        pos = self.bufpos + 4
+        end = pos + _unpack_long(self.bufstr, self.bufpos)[0]
+        self.bufpos = end
+        s = bytes(self.bufstr[pos:end])
+        if self.unicode_for_python3:
+            return UnicodeForPython3(s)
+        return s.decode("utf8")
 
     dispatch[TYPE_UNICODE] = load_unicode
 
     def load_tuple(self):
-        return tuple(self.load_list())
+        load = self.load
+        return tuple([load() for i in range(self.load_int())])
 
     dispatch[TYPE_TUPLE] = load_tuple
 
+    def load_small_tuple(self):
+        n = self.bufstr[self.bufpos]
+        self.bufpos += 1
+        load = self.load
+        return tuple([load() for i in range(n)])
+
+    dispatch[TYPE_SMALL_TUPLE] = load_small_tuple
+
     def load_list(self):
-        n = _r_long(self)
         list = []
-        for i in range(n):
+        self.ref_early(list)
+        for i in range(self.load_int()):
             list.append(self.load())
         return list
 
@@ -935,21 +794,70 @@ class _FastUnmarshaller:
 
     def load_dict(self):
         d = {}
+        self.ref_early(d)
+        null = self.null
         while 1:
             key = self.load()
-            if key is _NULL:
+            if key is null:
                 break
+            # As in xdis.unmarshal and marshal, a NULL value ends the dict
+            # too.
             value = self.load()
+            if value is null:
+                break
             d[key] = value
         return d
 
     dispatch[TYPE_DICT] = load_dict
 
     def load_code(self):
-        argcount = _r_long(self)
-        nlocals = _r_long(self)
-        stacksize = _r_long(self)
-        flags = _r_long(self)
+        layout = self.code_layout
+        if layout is None:
+            return self.load_python2_code()
+
+        fields = dict(layout.defaults)
+        header = layout.header
+        if header is not None:
+            fields.update(
+                zip(layout.header_fields, header.unpack_from(self.bufstr, self.bufpos))
+            )
+            self.bufpos += header.size
+        bytes_for_s = self.bytes_for_s
+        self.bytes_for_s = True
+        co_code = self.load()
+        if self.is_graal:
+            self.bytes_for_s = bytes_for_s
+            return graal_code(co_code, self.version_tuple)
+
+        fields["co_code"] = co_code
+        for name, field_bytes_for_s in self.code_object_fields:
+            self.bytes_for_s = field_bytes_for_s
+            fields[name] = self.load()
+        if layout.firstlineno is not None:
+            fields["co_firstlineno"] = layout.firstlineno.unpack_from(
+                self.bufstr, self.bufpos
+            )[0]
+            self.bufpos += layout.firstlineno.size
+            self.bytes_for_s = self.code_bytes_for_s
+            for name in layout.trailer:
+                fields[name] = self.load()
+        self.bytes_for_s = bytes_for_s
+
+        if layout.has_localsplus:
+            split_localsplus(fields)
+            if self.intern_pool is not None:
+                for name in ("co_varnames", "co_cellvars", "co_freevars"):
+                    fields[name] = self.intern_pool.intern(fields[name])
+        return to_portable(version_triple=self.version_tuple, **fields)
+
+    dispatch[TYPE_CODE] = load_code
+    version_dispatch[TYPE_CODE_OLD] = load_code
+
+    def load_python2_code(self):
+        argcount = self.load_int()
+        nlocals = self.load_int()
+        stacksize = self.load_int()
+        flags = self.load_int()
         code = self.load()
         consts = self.load()
         names = self.load()
@@ -958,64 +866,42 @@ class _FastUnmarshaller:
         cellvars = self.load()
         filename = self.load()
         name = self.load()
-        firstlineno = _r_long(self)
+        firstlineno = self.load_int()
         lnotab = self.load()
-        if PYTHON3:
-            if isinstance(name, bytes):
-                name = name.decode()
-            return Code2(
-                argcount,
-                nlocals,
-                stacksize,
-                flags,
-                code,
-                consts,
-                names,
-                varnames,
-                filename.decode(),
-                name,
-                firstlineno,
-                lnotab,
-                freevars,
-                cellvars,
-            )
-        else:
-            return types.CodeType(
-                argcount,
-                nlocals,
-                stacksize,
-                flags,
-                code,
-                consts,
-                names,
-                varnames,
-                filename,
-                name,
-                firstlineno,
-                lnotab,
-                freevars,
-                cellvars,
-            )
-
-    dispatch[TYPE_CODE] = load_code
+        if isinstance(filename, bytes):
+            filename = filename.decode()
+        if isinstance(name, bytes):
+            name = name.decode()
+        return Code2(
+            argcount,
+            nlocals,
+            stacksize,
+            flags,
+            code,
+            consts,
+            names,
+            varnames,
+            filename,
+            name,
+            firstlineno,
+            lnotab,
+            freevars,
+            cellvars,
+        )
 
     def load_set(self):
-        n = _r_long(self)
-        args = [self.load() for i in range(n)]
-        return set(args)
+        return set([self.load() for i in range(self.load_int())])
 
     dispatch[TYPE_SET] = load_set
+    version_dispatch[TYPE_FROZENSET] = load_set
 
     def load_frozenset(self):
-        n = _r_long(self)
-        args = [self.load() for i in range(n)]
-        return frozenset(args)
+        return frozenset([self.load() for i in range(self.load_int())])
 
     dispatch[TYPE_FROZENSET] = load_frozenset
+    version_dispatch[TYPE_SET] = load_frozenset
 
 
-_load_dispatch = _FastUnmarshaller.dispatch
-
 # _________________________________________________________________
 #
 # user interface
@@ -1023,69 +909,77 @@ _load_dispatch = _FastUnmarshaller.dispatch
 version = 1
 
 
+def _marshaller(writefunc, version, python_version, refs):
+    """Return a _Marshaller which, for marshal `version` 3 or later and
+    Python 3.4 or later, writes references of kind `refs`.
+    """
+    if version < 3 or (python_version or PYTHON_VERSION_TRIPLE) < (3, 4):
+        return _Marshaller(writefunc, python_version)
+    if refs not in ("identity", "equal"):
+        raise ValueError("refs should be 'identity' or 'equal', not %r" % (refs,))
+    return _Marshaller(writefunc, python_version, refs)
+
+
 @builtinify
-def dump(x, f, version=version, python_version=None):
-    # XXX 'version' is ignored, we always dump in a version-0-compatible format
-    m = _Marshaller(f.write, python_version)
+def dump(x, f, version=version, python_version=None, refs="identity"):
+    """Write `x` to binary file `f`, a piece at a time. See dumps()."""
+    m = _marshaller(f.write, version, python_version, refs)
     m.dump(x)
+    m.flush()
+
+
+def _load(um):
+    try:
+        return um.load()
+    except (IndexError, struct.error):
+        raise EOFError("marshal data is cut short")
+    finally:
+        if isinstance(um.bufstr, memoryview):
+            um.bufstr.release()
 
 
 @builtinify
-def load(f, python_version=None):
-    um = _Unmarshaller(f.read, python_version)
-    return um.load()
+def load(f, python_version=None, intern_pool=None, magic_int=None):
+    """Return the object marshaled in binary file `f`. See loads().
+
+    The rest of `f` is read, and if `f` is seekable, it is left just
+    after the object.
+    """
+    seekable = getattr(f, "seekable", lambda: False)()
+    start = f.tell() if seekable else None
+    um = _FastUnmarshaller(f.read(), python_version, intern_pool, magic_int)
+    try:
+        return _load(um)
+    finally:
+        if start is not None:
+            f.seek(start + um.bufpos)
 
 
 @builtinify
-def dumps(x, version=version, python_version=PYTHON_VERSION_TRIPLE):
-    # XXX 'version' is ignored, we always dump in a version-0-compatible format
-    buffer = []
-    m = _Marshaller(buffer.append, python_version=python_version)
+def dumps(x, version=version, python_version=PYTHON_VERSION_TRIPLE, refs="identity"):
+    """Return `x` marshaled for Python `python_version`.
+
+    For marshal `version` 3 or later and Python 3.4 or later, an object
+    that comes up more than once is written once and referred back to
+    after that. `refs` says which objects are the same: "identity", as
+    marshal.dumps() does, or "equal", which also takes in equal strings,
+    numbers and tuples of them. Otherwise, each is written in full.
+    """
+    m = _marshaller(None, version, python_version, refs)
     m.dump(x)
-    if python_version:
-        is_python3 = python_version >= (3, 0)
-    else:
-        is_python3 = PYTHON3
-
-    if is_python3:
-        if PYTHON_VERSION_TRIPLE >= (3, 0):
-            # Python 3.x handling  Python 3.x
-            buf = []
-            for b in buffer:
-                if isinstance(b, str) and PYTHON3:
-                    s2b = bytes(ord(b[j]) for j in range(len(b)))
-                    buf.append(s2b)
-                elif isinstance(b, bytearray):
-                    buf.append(str(b))
-                else:
-                    buf.append(b)
-            return b"".join(buf)
-        else:
-            # Python 2.x handling Python 3.x
-            buf = b""
-            for b in buffer:
-                buf += b.decode(errors="ignore")
-                pass
-            return buf
-    else:
-        # Python 2 or 3 handling Python 2.x
-        buf = []
-        for b in buffer:
-            if isinstance(b, str) and PYTHON3:
-                try:
-                    s2b = bytes(ord(b[j]) for j in range(len(b)))
-                except ValueError:
-                    s2b = b.encode("utf-8")
-                buf.append(s2b)
-            elif isinstance(b, bytearray):
-                buf.append(str(b))
-            else:
-                buf.append(b)
-
-        return "".join(buf)
+    return bytes(m.buffer)
 
 
 @builtinify
-def loads(s, python_version=None):
-    um = _FastUnmarshaller(s, python_version)
-    return um.load()
+def loads(s, python_version=None, intern_pool=None, magic_int=None):
+    """Return the object marshaled in buffer `s`.
+
+    If the Python version is given, by `magic_int` or else by
+    `python_version`, the result is what xdis.unmarshal.load_code()
+    gives for that version, for any version it handles. Otherwise, code
+    objects are taken to be Python 2 ones.
+
+    `intern_pool` is an xdis.internpool.InternPool that each object
+    decoded is put through.
+    """
+    return _load(_FastUnmarshaller(s, python_version, intern_pool, magic_int))
@@ -59,6 +59,7 @@ from xdis.opcodes import (
     opcode_311,
     opcode_312,
 )
+from xdis.opcodes.base import update_decoders
 from xdis.version_info import IS_PYPY, version_tuple_to_str
 
 # FIXME
@@ -320,6 +321,8 @@ def remap_opcodes(op_obj, alternate_opmap):
 
     setattr(op_obj, "opmap", new_opmap)
     setattr(op_obj, "REMAPPED", True)
+    if hasattr(op_obj, "opcode_decoders"):
+        update_decoders(vars(op_obj))
     return op_obj
 
 
@@ -19,6 +19,7 @@ limited by, and somewhat compatible with the corresponding
 Python opcode.py structures
 """
 
+from collections import namedtuple
 from copy import deepcopy
 from typing import Dict, List, Set
 
@@ -404,6 +405,7 @@ def finalize_opcodes(loc):
         | set([op for op in loc["hasnargs"] if op not in loc["nofollow"]])
         | set([op for op in loc["hasvargs"]])
     )
+    update_decoders(loc)
     opcode_check(loc)
     return
 
@@ -473,6 +475,134 @@ def update_sets(loc):
     loc["STORE_OPS"] = frozenset(loc["hasstore"])
 
 
+# How xdis.bytecode.get_instructions_bytes() decodes an opcode: whether
+# it has an operand, its optype as xdis.bytecode.get_optype() gives it,
+# its size in bytes, how its operand is resolved into an argval and
+# argrepr (one of RESOLVERS, or None), and its opcode_arg_fmt formatter,
+# or None.
+OpcodeDecoder = namedtuple(
+    "OpcodeDecoder", "opname has_arg optype size resolver formatter"
+)
+
+# The kinds of argument resolution. Most are named after the opcode
+# category that get_instructions_bytes() first finds the opcode in.
+RESOLVERS = frozenset(
+    [
+        "const",
+        "name",
+        "global",  # LOAD_GLOBAL in 3.11+: name index >> 1, with NULL flag
+        "attr",  # LOAD_ATTR in 3.12+: name index >> 1, with NULL|self flag
+        "super_attr",  # LOAD_SUPER_ATTR in 3.12+: name index >> 2
+        "jrel",
+        "jrel_backward",  # JUMP_BACKWARD...: the offset is subtracted
+        "for_iter",  # FOR_ITER in 3.12+, which skips a cache entry
+        "jabs",
+        "local",
+        "free",
+        "localplus",  # 3.11+ locals and free: varnames followed by cells
+        "compare",
+        "compare_shifted",  # 3.12+ comparisons: cmp_op index >> 4
+        "call_function",  # CALL_FUNCTION in 3.6+
+        "call_function_ex",  # CALL_FUNCTION_EX in 3.6+
+        "nargs",  # before 3.6: positional and keyword counts
+    ]
+)
+
+# The order xdis.bytecode.get_optype() tests opcode categories in.
+OPTYPE_SETS = (
+    ("compare", "COMPARE_OPS"),
+    ("const", "CONST_OPS"),
+    ("free", "FREE_OPS"),
+    ("jabs", "JABS_OPS"),
+    ("jrel", "JREL_OPS"),
+    ("local", "LOCAL_OPS"),
+    ("name", "NAME_OPS"),
+    ("nargs", "NARGS_OPS"),
+    ("vargs", "VARGS_OPS"),
+    ("encoded_arg", "ENCODED_ARG_OPS"),
+)
+
+
+def _resolver(op, opname, loc):
+    version_tuple = loc["version_tuple"]
+    python_version = loc["python_version"]
+    if op in loc["CONST_OPS"]:
+        return "const"
+    elif op in loc["NAME_OPS"]:
+        if version_tuple >= (3, 11) and opname == "LOAD_GLOBAL":
+            return "global"
+        elif version_tuple >= (3, 12) and opname == "LOAD_ATTR":
+            return "attr"
+        elif version_tuple >= (3, 12) and opname == "LOAD_SUPER_ATTR":
+            return "super_attr"
+        return "name"
+    elif op in loc["JREL_OPS"]:
+        if "JUMP_BACKWARD" in opname:
+            return "jrel_backward"
+        elif version_tuple >= (3, 12) and opname == "FOR_ITER":
+            return "for_iter"
+        return "jrel"
+    elif op in loc["JABS_OPS"]:
+        return "jabs"
+    elif op in loc["LOCAL_OPS"]:
+        return "localplus" if version_tuple >= (3, 11) else "local"
+    elif op in loc["FREE_OPS"]:
+        return "localplus" if version_tuple >= (3, 11) else "free"
+    elif op in loc["COMPARE_OPS"]:
+        return "compare_shifted" if python_version >= (3, 12) else "compare"
+    elif op in loc["NARGS_OPS"]:
+        if python_version >= (3, 6):
+            if opname == "CALL_FUNCTION":
+                return "call_function"
+            elif opname == "CALL_FUNCTION_EX":
+                return "call_function_ex"
+        elif opname not in ("RAISE_VARARGS", "DUP_TOPX", "MAKE_FUNCTION"):
+            return "nargs"
+    return None
+
+
+def make_decoders(loc) -> tuple:
+    """Return a tuple of 256 OpcodeDecoders, indexed by opcode, for the
+    opcode module whose dictionary is `loc`. Everything that
+    get_instructions_bytes() would otherwise work out for each
+    instruction it decodes is worked out here, once.
+    """
+    wordcode_size = loc["version_tuple"] >= (3, 6)
+    arg_fmt = loc.get("opcode_arg_fmt", {})
+    decoders = []
+    for op in range(256):
+        opname = loc["opname"][op]
+        has_arg = op >= loc["HAVE_ARGUMENT"]
+        if wordcode_size:
+            size = 2
+        else:
+            size = 3 if has_arg else 1
+        for optype, set_name in OPTYPE_SETS:
+            if op in loc[set_name]:
+                break
+        else:
+            optype = "??"
+        decoders.append(
+            OpcodeDecoder(
+                opname,
+                has_arg,
+                optype,
+                size,
+                _resolver(op, opname, loc) if has_arg else None,
+                arg_fmt.get(opname),
+            )
+        )
+    return tuple(decoders)
+
+
+def update_decoders(loc):
+    """Set, or reset, ``opcode_decoders`` in the opcode module whose
+    dictionary is `loc`. This has to be redone if the opcodes or
+    opcode_arg_fmt of the module change after finalize_opcodes().
+    """
+    loc["opcode_decoders"] = make_decoders(loc)
+
+
 def dump_opcodes(opmap):
     """Utility for dumping opcodes"""
     op2name = {}
@@ -34,6 +34,7 @@ from xdis.opcodes.base import (
     rm_op,
     store_op,
     unary_op,
+    update_decoders,
     update_pj3,
     varargs_op,
 )
@@ -383,6 +384,8 @@ opcode_arg_fmt = opcode_arg_fmt36 = {
         "RAISE_VARARGS": format_RAISE_VARARGS_older,
     },
 }
+# opcode_arg_fmt has changed since finalize_opcodes().
+update_decoders(loc)
 
 opcode_extended_fmt36 = opcode_extended_fmt = {
     **opcode_extended_fmt35,
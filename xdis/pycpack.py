@@ -0,0 +1,337 @@
+# Copyright (c) 2024 by Rocky Bernstein
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Pyc packs: many bytecode files in one file, with an index.
+
+A corpus of many small bytecode files, like test/bytecode_*, spends
+much of its time in the file system. A pack holds the files one after
+another, followed by an index sorted by name. For each file, the index
+has where it is in the pack, its size, its magic number and the other
+header fields.
+
+PycPackWriter, or write_pack(), makes a pack. PycPack reads one through
+a memory map, so a bytecode file in it is unmarshalled in place.
+
+The layout of a pack is:
+
+* PACK_HEADER: the pack magic, format version, number of entries, and
+  the offset of the index.
+* The bytecode files.
+* The index: an ENTRY_STRUCT record for each file, in name order,
+  followed by the UTF-8 names those records point into.
+"""
+
+import mmap
+import os
+import os.path as osp
+import tempfile
+from bisect import bisect_left
+from collections import namedtuple
+from struct import Struct
+
+from xdis.headerscan import MAX_HEADER_SIZE, parse_header
+from xdis.load import iter_bytecode_files, load_module_from_file_object
+
+PACK_MAGIC = b"XDISPACK"
+PACK_FORMAT = 1
+
+# magic, format version, entry count, index offset
+PACK_HEADER = Struct("<8sIIQ")
+
+# offset, size, name offset, name size, magic_int, fields present,
+# PEP 552 flags, timestamp, source size, SipHash
+ENTRY_STRUCT = Struct("<QIIIIIIIIQ")
+
+# Bits in the "fields present" of an entry.
+HAS_FLAGS = 1
+HAS_TIMESTAMP = 2
+HAS_SOURCE_SIZE = 4
+HAS_SIP_HASH = 8
+
+# The index entry for a bytecode file in a pack. Header fields the file
+# doesn't have, or that couldn't be read, are None.
+PackEntry = namedtuple(
+    "PackEntry",
+    "name offset size magic_int flags timestamp source_size sip_hash",
+)
+
+
+class PycPackWriter:
+    """
+    Writes a pack to ``path``. Add bytecode files with ``add()`` or
+    ``add_file()``, then ``close()`` it. Until then, the pack is kept in
+    a temporary file, which is renamed to ``path`` at the end.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=osp.dirname(osp.abspath(path)), suffix=".tmp"
+        )
+        self.fp = os.fdopen(fd, "wb")
+        self.fp.write(PACK_HEADER.pack(PACK_MAGIC, PACK_FORMAT, 0, 0))
+        self.entries = {}
+
+    def add(self, name, data):
+        """Add the bytecode file with contents `data`, as `name`."""
+        if name in self.entries:
+            raise ValueError("%s is already in the pack" % name)
+        self.entries[name] = (self.fp.tell(), len(data)) + _header_fields(
+            name, data[:MAX_HEADER_SIZE]
+        )
+        self.fp.write(data)
+
+    def add_file(self, path, name=None):
+        """Add bytecode file `path`, as `name` or if that's not given,
+        as `path`."""
+        with open(path, "rb") as fp:
+            self.add(path if name is None else name, fp.read())
+
+    def close(self):
+        if self.fp is None:
+            return
+        names = sorted(self.entries)
+        index_offset = self.fp.tell()
+        encoded = [name.encode("utf-8", "surrogateescape") for name in names]
+        name_offset = index_offset + ENTRY_STRUCT.size * len(names)
+        for name, name_bytes in zip(names, encoded):
+            offset, size, magic_int, present = self.entries[name][:4]
+            fields = self.entries[name][4:]
+            self.fp.write(
+                ENTRY_STRUCT.pack(
+                    offset,
+                    size,
+                    name_offset,
+                    len(name_bytes),
+                    magic_int,
+                    present,
+                    *fields
+                )
+            )
+            name_offset += len(name_bytes)
+        for name_bytes in encoded:
+            self.fp.write(name_bytes)
+        self.fp.seek(0)
+        self.fp.write(
+            PACK_HEADER.pack(PACK_MAGIC, PACK_FORMAT, len(names), index_offset)
+        )
+        self.fp.close()
+        self.fp = None
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Give up on the pack, removing the temporary file."""
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _header_fields(name, data):
+    """Return the magic_int, fields-present bits, and PEP 552 flags,
+    timestamp, source size and SipHash, with 0 for those not present,
+    of bytecode file `name`, which starts with `data`.
+    """
+    header = parse_header(name, data)
+    fields = (header.flags, header.timestamp, header.source_size, header.sip_hash)
+    present = 0
+    for bit, value in zip(
+        (HAS_FLAGS, HAS_TIMESTAMP, HAS_SOURCE_SIZE, HAS_SIP_HASH), fields
+    ):
+        if value is not None:
+            present |= bit
+    return (header.magic_int or 0, present) + tuple(value or 0 for value in fields)
+
+
+def write_pack(path, paths_or_dirs, root=None):
+    """Write a pack to `path` of the bytecode files in `paths_or_dirs`,
+    which are found as by xdis.load.iter_bytecode_files(). Files are
+    named by their path relative to `root`, if given, with "/" between
+    directories. Return the number of files written.
+    """
+    with PycPackWriter(path) as writer:
+        for filename in iter_bytecode_files(paths_or_dirs):
+            name = filename if root is None else osp.relpath(filename, root)
+            writer.add_file(filename, name.replace(os.sep, "/"))
+        return len(writer.entries)
+
+
+class PackMember:
+    """
+    A read-only file object for a bytecode file in a pack, reading
+    straight from the memory map. load_module_from_file_object()
+    unmarshals from getbuffer() without copying.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.position = 0
+
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else self.position + size
+        data = bytes(self.view[self.position : end])
+        self.position += len(data)
+        return data
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=0):
+        if whence == 1:
+            position += self.position
+        elif whence == 2:
+            position += len(self.view)
+        self.position = position
+        return position
+
+    def getbuffer(self):
+        return self.view
+
+    def close(self):
+        self.view.release()
+
+
+class PycPack:
+    """
+    Reads the pack at ``path`` through a memory map.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            self.mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mapped)
+        try:
+            magic, pack_format, self.count, self.index_offset = PACK_HEADER.unpack_from(
+                self.buffer, 0
+            )
+        except Exception:
+            self.close()
+            raise ValueError("%s is too short to be a pyc pack" % path)
+        if magic != PACK_MAGIC or pack_format != PACK_FORMAT:
+            self.close()
+            raise ValueError("%s is not a format %d pyc pack" % (path, PACK_FORMAT))
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, i):
+        return ENTRY_STRUCT.unpack_from(
+            self.buffer, self.index_offset + i * ENTRY_STRUCT.size
+        )
+
+    def _name(self, record):
+        return str(
+            self.buffer[record[2] : record[2] + record[3]], "utf-8", "surrogateescape"
+        )
+
+    def _entry(self, i):
+        record = self._record(i)
+        present = record[5]
+        fields = [
+            value if present & bit else None
+            for bit, value in zip(
+                (HAS_FLAGS, HAS_TIMESTAMP, HAS_SOURCE_SIZE, HAS_SIP_HASH),
+                record[6:],
+            )
+        ]
+        return PackEntry(self._name(record), record[0], record[1], record[4], *fields)
+
+    def names(self):
+        """Return a list of the names in the pack, in order."""
+        return [self._name(self._record(i)) for i in range(self.count)]
+
+    def _find(self, name):
+        names = _PackNames(self)
+        i = bisect_left(names, name)
+        if i < self.count and names[i] == name:
+            return i
+        return None
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def entry(self, name):
+        """Return the PackEntry for `name`, raising KeyError if there is
+        none."""
+        i = self._find(name)
+        if i is None:
+            raise KeyError(name)
+        return self._entry(i)
+
+    def __iter__(self):
+        """Yield the PackEntry of each file in the pack, in name order."""
+        for i in range(self.count):
+            yield self._entry(i)
+
+    def data(self, name):
+        """Return a memoryview of the contents of bytecode file `name`."""
+        entry = self.entry(name)
+        return self.buffer[entry.offset : entry.offset + entry.size]
+
+    def open(self, name):
+        """Return a PackMember file object for bytecode file `name`."""
+        return PackMember(self.data(name))
+
+    def load_module(self, name, **kwargs):
+        """Return xdis.load.load_module() for bytecode file `name`. The
+        keyword arguments are those of load_module_from_file_object().
+        """
+        return load_module_from_file_object(self.open(name), filename=name, **kwargs)
+
+    def iter_modules(self, **kwargs):
+        """Yield the name and load_module() of each file in the pack."""
+        for entry in self:
+            yield entry.name, self.load_module(entry.name, **kwargs)
+
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.release()
+            self.buffer = None
+            try:
+                self.mapped.close()
+            except BufferError:
+                # Lazily decoded code objects still use it.
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _PackNames:
+    """The names in a pack as a sequence, for bisect."""
+
+    def __init__(self, pack):
+        self.pack = pack
+
+    def __len__(self):
+        return self.pack.count
+
+    def __getitem__(self, i):
+        return self.pack._name(self.pack._record(i))
@@ -26,12 +26,17 @@ you can use Python's built-in ``marshal.loads()`` to produce a code
 object.
 """
 
-import io
+import marshal
 import sys
-from struct import unpack
+import time
+from collections import namedtuple
+from functools import lru_cache
+from mmap import mmap
+from struct import Struct
 from typing import Union
 
 from xdis.codetype import to_portable
+from xdis.codetype.base import CodeBase
 from xdis.cross_types import LongTypeForPython3, UnicodeForPython3
 from xdis.magics import GRAAL3_MAGICS, PYPY3_MAGICS, magic_int2tuple
 from xdis.version_info import PYTHON3, PYTHON_VERSION_TRIPLE
@@ -53,6 +58,18 @@ else:
 # FLAG_REF is the marshal.c name
 FLAG_REF = 0x80
 
+# Precompiled struct readers. These are used with unpack_from()
+# to pull fixed-width fields directly out of the marshal buffer.
+_unpack_int16 = Struct("<h").unpack_from
+_unpack_int32 = Struct("<i").unpack_from
+_pack_int32_into = Struct("<i").pack_into
+_unpack_int64 = Struct("<q").unpack_from
+_unpack_double = Struct("<d").unpack_from
+
+# Types that load_code() will parse in place rather than read from
+# a file-like object.
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap)
+
 
 # The keys in the following dictionary are unmarshal codes, like "s",
 # "c", "<", etc. The values of the dictionary are names of routines
@@ -97,6 +114,290 @@ UNMARSHAL_DISPATCH_TABLE = {
 }
 
 
+# Bits in co_localspluskinds, since Python 3.11.
+CO_FAST_LOCAL = 0x20
+CO_FAST_CELL = 0x40
+CO_FAST_FREE = 0x80
+
+# A CodeLayout describes how a code object is marshaled for a
+# particular generation of the code format. Fields are:
+#
+#  header:        a Struct for the integer fields that precede co_code,
+#                 or None if there are none
+#  header_fields: names of the fields unpacked by header
+#  objects:       names of the marshaled objects that follow co_code
+#  firstlineno:   a Struct for co_firstlineno, or None if it is not stored
+#  trailer:       names of the marshaled objects that follow co_firstlineno
+#  has_localsplus: True if co_varnames, co_cellvars and co_freevars have
+#                 to be derived from co_localsplusnames and co_localspluskinds
+#  defaults:      values of the fields that are not stored
+CodeLayout = namedtuple(
+    "CodeLayout",
+    "header header_fields objects firstlineno trailer has_localsplus defaults",
+)
+
+_CODE_DEFAULTS = {
+    "co_argcount": 0,
+    "co_posonlyargcount": None,
+    "co_kwonlyargcount": 0,
+    "co_nlocals": 0,
+    "co_stacksize": 0,
+    "co_flags": 0,
+    "co_varnames": tuple(),
+    "co_freevars": tuple(),
+    "co_cellvars": tuple(),
+    "co_qualname": None,
+    "co_firstlineno": -1,  # Bogus sentinel value; SET_LINENO is used instead
+    "co_lnotab": b"",
+    "co_exceptiontable": None,
+}
+
+
+# The code fields that can be asked for in load_code_fields().
+# co_lnotab holds co_linetable in 3.10 and later.
+CODE_FIELD_NAMES = (
+    "co_argcount",
+    "co_posonlyargcount",
+    "co_kwonlyargcount",
+    "co_nlocals",
+    "co_stacksize",
+    "co_flags",
+    "co_code",
+    "co_consts",
+    "co_names",
+    "co_varnames",
+    "co_freevars",
+    "co_cellvars",
+    "co_filename",
+    "co_name",
+    "co_qualname",
+    "co_firstlineno",
+    "co_lnotab",
+    "co_exceptiontable",
+)
+
+# Fields that are derived from co_localsplusnames and co_localspluskinds
+# in 3.11 and later.
+_LOCALSPLUS_FIELDS = frozenset(
+    ("co_varnames", "co_freevars", "co_cellvars", "co_nlocals")
+)
+
+
+def _code_layout(
+    header_fields,
+    objects,
+    firstlineno=None,
+    trailer=(),
+    has_localsplus=False,
+    **defaults,
+):
+    header_format = "<" + "".join(fmt for _, fmt in header_fields)
+    code_defaults = dict(_CODE_DEFAULTS)
+    code_defaults.update(defaults)
+    return CodeLayout(
+        header=Struct(header_format) if header_fields else None,
+        header_fields=tuple(name for name, _ in header_fields),
+        objects=("co_consts", "co_names") + objects,
+        firstlineno=Struct(firstlineno) if firstlineno else None,
+        trailer=trailer,
+        has_localsplus=has_localsplus,
+        defaults=code_defaults,
+    )
+
+
+_CODE_LAYOUT_30 = _code_layout(
+    (
+        ("co_argcount", "i"),
+        ("co_kwonlyargcount", "i"),
+        ("co_nlocals", "i"),
+        ("co_stacksize", "i"),
+        ("co_flags", "i"),
+    ),
+    ("co_varnames", "co_freevars", "co_cellvars", "co_filename", "co_name"),
+    "<i",
+    ("co_lnotab",),
+)
+
+# Code layouts, from newest to oldest, keyed by the first version
+# that uses the layout.
+CODE_LAYOUTS = (
+    (
+        (3, 11),
+        _code_layout(
+            (
+                ("co_argcount", "i"),
+                ("co_posonlyargcount", "i"),
+                ("co_kwonlyargcount", "i"),
+                ("co_stacksize", "i"),
+                ("co_flags", "i"),
+            ),
+            (
+                "co_localsplusnames",
+                "co_localspluskinds",
+                "co_filename",
+                "co_name",
+                "co_qualname",
+            ),
+            "<i",
+            ("co_lnotab", "co_exceptiontable"),
+            has_localsplus=True,
+        ),
+    ),
+    (
+        (3, 8),
+        _code_layout(
+            (
+                ("co_argcount", "i"),
+                ("co_posonlyargcount", "i"),
+                ("co_kwonlyargcount", "i"),
+                ("co_nlocals", "i"),
+                ("co_stacksize", "i"),
+                ("co_flags", "i"),
+            ),
+            ("co_varnames", "co_freevars", "co_cellvars", "co_filename", "co_name"),
+            "<i",
+            ("co_lnotab",),
+        ),
+    ),
+    ((3, 0), _CODE_LAYOUT_30),
+    (
+        (2, 3),
+        _code_layout(
+            (
+                ("co_argcount", "i"),
+                ("co_nlocals", "i"),
+                ("co_stacksize", "i"),
+                ("co_flags", "i"),
+            ),
+            ("co_varnames", "co_freevars", "co_cellvars", "co_filename", "co_name"),
+            "<i",
+            ("co_lnotab",),
+        ),
+    ),
+    (
+        (2, 0),
+        _code_layout(
+            (
+                ("co_argcount", "h"),
+                ("co_nlocals", "h"),
+                ("co_stacksize", "h"),
+                ("co_flags", "h"),
+            ),
+            ("co_varnames", "co_freevars", "co_cellvars", "co_filename", "co_name"),
+            "<h",
+            ("co_lnotab",),
+        ),
+    ),
+    (
+        (1, 5),
+        _code_layout(
+            (
+                ("co_argcount", "h"),
+                ("co_nlocals", "h"),
+                ("co_stacksize", "h"),
+                ("co_flags", "h"),
+            ),
+            ("co_varnames", "co_filename", "co_name"),
+            "<h",
+            ("co_lnotab",),
+        ),
+    ),
+    (
+        (1, 3),
+        _code_layout(
+            (
+                ("co_argcount", "h"),
+                ("co_nlocals", "h"),
+                ("co_flags", "h"),
+            ),
+            ("co_varnames", "co_filename", "co_name"),
+        ),
+    ),
+    ((1, 0), _code_layout((), ("co_filename", "co_name"))),
+)
+
+# Python 3.8 alpha releases that do not store co_posonlyargcount.
+CODE_LAYOUT_MAGIC_OVERRIDES = {
+    magic_int: _CODE_LAYOUT_30._replace(
+        defaults=dict(_CODE_LAYOUT_30.defaults, co_posonlyargcount=0)
+    )
+    for magic_int in (3400, 3401, 3410, 3411)
+}
+
+
+@lru_cache(maxsize=None)
+def get_code_layout(magic_int: int) -> CodeLayout:
+    """
+    Return the CodeLayout describing how code objects are marshaled for
+    bytecode with magic ``magic_int``.
+    """
+    if magic_int in CODE_LAYOUT_MAGIC_OVERRIDES:
+        return CODE_LAYOUT_MAGIC_OVERRIDES[magic_int]
+    version_tuple = magic_int2tuple(magic_int)
+    for first_version, layout in CODE_LAYOUTS:
+        if version_tuple >= first_version:
+            return layout
+    return CODE_LAYOUTS[-1][1]
+
+
+def split_localsplus(fields: dict):
+    """
+    Replace co_localsplusnames and co_localspluskinds in the code fields
+    ``fields`` with the co_varnames, co_cellvars, co_freevars and co_nlocals
+    they imply.
+    """
+    # parse localsplusnames list: https://github.com/python/cpython/blob/3.11/Objects/codeobject.c#L208C12
+    co_localsplusnames = fields.pop("co_localsplusnames")
+    co_localspluskinds = fields.pop("co_localspluskinds")
+
+    co_varnames = tuple()
+    co_freevars = tuple()
+    co_cellvars = tuple()
+
+    for name, kind in zip(co_localsplusnames, co_localspluskinds):
+        if kind & CO_FAST_LOCAL:
+            co_varnames += (name,)
+            if kind & CO_FAST_CELL:
+                co_cellvars += (name,)
+        elif kind & CO_FAST_CELL:
+            co_cellvars += (name,)
+        elif kind & CO_FAST_FREE:
+            co_freevars += (name,)
+
+    fields["co_varnames"] = co_varnames
+    fields["co_freevars"] = co_freevars
+    fields["co_cellvars"] = co_cellvars
+    fields["co_nlocals"] = len(co_varnames)
+
+
+def graal_code(co_code, version_triple: tuple):
+    """
+    Return a portable code object for Graal bytecode ``co_code``. Graal
+    doesn't marshal the other code fields, so they are left empty.
+    """
+    return to_portable(
+        co_argcount=0,
+        co_posonlyargcount=0,
+        co_kwonlyargcount=0,
+        co_nlocals=0,
+        co_stacksize=0,
+        co_flags=0,
+        co_code=co_code,
+        co_consts=tuple(),
+        co_names=tuple(),
+        co_varnames=tuple(),
+        co_filename="??",
+        co_name="??",
+        co_qualname="??",
+        co_firstlineno=0,
+        co_lnotab="",
+        co_freevars=tuple(),
+        co_cellvars=tuple(),
+        co_exceptiontable=None,
+        version_triple=version_triple,
+    )
+
+
 def compat_str(s: Union[str, bytes]) -> Union[str, bytes]:
     """
     This handles working with strings between Python2 and Python3.
@@ -129,9 +430,216 @@ def compat_u2s(u):
         return str(u)
 
 
+# An internObjects entry for an object that was skipped over in lazy mode.
+_LazyRef = namedtuple("_LazyRef", "offset ref_index bytes_for_s")
+
+
+# Sizes of the marshal types that have a fixed size, not counting
+# the type code. This is used in skipping over objects.
+SKIP_SIZES = {
+    "0": 0,
+    "N": 0,
+    "S": 0,
+    ".": 0,
+    "F": 0,
+    "T": 0,
+    "i": 4,
+    "r": 4,
+    "R": 4,
+    "I": 8,
+    "g": 8,
+    "y": 16,
+}
+
+# For marshal types that start with a length or item count: the size of
+# that, and the least number of bytes of marshal data that each unit of
+# it takes up. These let r_object_limited() refuse a bad length before
+# anything is allocated for it.
+LENGTH_PREFIXES = {
+    ord("s"): (_unpack_int32, 4, 1),
+    ord("a"): (_unpack_int32, 4, 1),
+    ord("A"): (_unpack_int32, 4, 1),
+    ord("t"): (_unpack_int32, 4, 1),
+    ord("u"): (_unpack_int32, 4, 1),
+    ord("z"): (None, 1, 1),
+    ord("Z"): (None, 1, 1),
+    ord("l"): (_unpack_int32, 4, 2),
+    ord("("): (_unpack_int32, 4, 1),
+    ord("["): (_unpack_int32, 4, 1),
+    ord("<"): (_unpack_int32, 4, 1),
+    ord(">"): (_unpack_int32, 4, 1),
+    ord(")"): (None, 1, 1),
+}
+
+
+class UnmarshalLimitError(ValueError):
+    """
+    Raised when unmarshalling goes past one of the UnmarshalLimits given,
+    or when an object claims to be larger than the data left.
+    """
+
+
+class UnmarshalLimits:
+    """
+    Bounds on the work done to unmarshal untrusted data. A limit of None
+    means no limit.
+
+      max_objects: the most objects to decode
+      max_bytes:   the most bytes of marshal data to decode. A string or
+                   container that would run past this is refused before
+                   anything is allocated for it.
+      max_depth:   the deepest that objects can be nested
+      timeout:     the most seconds that a load can take
+    """
+
+    def __init__(self, max_objects=None, max_bytes=None, max_depth=None, timeout=None):
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.timeout = timeout
+
+    def __repr__(self) -> str:
+        return (
+            "UnmarshalLimits(max_objects=%r, max_bytes=%r, max_depth=%r, timeout=%r)"
+            % (self.max_objects, self.max_bytes, self.max_depth, self.timeout)
+        )
+
+
+# Marshal types that iter_load() handles by pushing a frame.
+CONTAINER_TYPES = frozenset(")([<>{cC")
+
+# Containers that, since marshal version 3 (Python 3.4), may be handed to
+# the running Python's marshal module when they are large enough. See
+# t_native().
+NATIVE_TYPES = ")([<>"
+NATIVE_MIN_ITEMS = 16
+
+# How n_scan() skips over each marshal type code that the running
+# Python's marshal module decodes the same way we do: a size for
+# fixed-size objects, or one of the NATIVE_ constants below.
+NATIVE_SHORT_STR = -1
+NATIVE_STR = -2
+NATIVE_SMALL_TUPLE = -3
+NATIVE_SEQUENCE = -4
+NATIVE_REF = -5
+NATIVE_SCAN = {
+    ord("0"): 0,
+    ord("N"): 0,
+    ord("S"): 0,
+    ord("."): 0,
+    ord("F"): 0,
+    ord("T"): 0,
+    ord("i"): 4,
+    ord("g"): 8,
+    ord("y"): 16,
+    ord("z"): NATIVE_SHORT_STR,
+    ord("Z"): NATIVE_SHORT_STR,
+    ord("a"): NATIVE_STR,
+    ord("A"): NATIVE_STR,
+    ord("t"): NATIVE_STR,
+    ord("u"): NATIVE_STR,
+    ord(")"): NATIVE_SMALL_TUPLE,
+    ord("("): NATIVE_SEQUENCE,
+    ord("["): NATIVE_SEQUENCE,
+    ord("r"): NATIVE_REF,
+}
+# "s" is bytes to marshal, so it can only be handed off when we would
+# also decode it as bytes.
+NATIVE_SCAN_BYTES = dict(NATIVE_SCAN)
+NATIVE_SCAN_BYTES[ord("s")] = NATIVE_STR
+
+
+class _Frame:
+    """
+    A container that iter_load() is in the middle of decoding.
+    """
+
+    __slots__ = (
+        "kind",
+        "items",
+        "ref",
+        "bytes_for_s",
+        "remaining",
+        "index",
+        "key",
+        "field_names",
+        "field_bytes_for_s",
+    )
+
+    def __init__(self, kind: str, items, ref, bytes_for_s: bool):
+        self.kind = kind
+        # For a code object, ``items`` is a dictionary of code fields.
+        self.items = items
+        self.ref = ref
+        self.bytes_for_s = bytes_for_s
+        self.remaining = 0
+        self.index = 0
+        self.key = None
+        self.field_names = ()
+        self.field_bytes_for_s = ()
+
+    def child_bytes_for_s(self) -> bool:
+        """The bytes_for_s setting for the next item of the container."""
+        if self.kind == "c":
+            return self.field_bytes_for_s[self.index]
+        return self.bytes_for_s
+
+
+class LazyCode(CodeBase):
+    """
+    A stand-in for a code object that has been located in the marshal data
+    but not yet decoded. It is decoded the first time one of its code
+    attributes is accessed, or when ``materialize()`` is called.
+
+    ``start`` and ``end`` give the span of the code object in the
+    marshal data.
+    """
+
+    def __init__(self, unmarshaller, start: int, ref_index: int):
+        self._unmarshaller = unmarshaller
+        self._code = None
+        self.start = start
+        self.end = None
+        self.ref_index = ref_index
+
+    def materialize(self):
+        """
+        Decode and return the code object this stands for.
+        """
+        if self._code is None:
+            self._code = self._unmarshaller.decode_at(self.start, self.ref_index)
+        return self._code
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __repr__(self) -> str:
+        return repr(self.materialize())
+
+
 class _VersionIndependentUnmarshaller:
-    def __init__(self, fp, magic_int, bytes_for_s, code_objects={}):
+    def __init__(
+        self,
+        fp,
+        magic_int,
+        bytes_for_s,
+        code_objects={},
+        lazy=False,
+        intern_pool=None,
+        native=True,
+        limits=None,
+        profile=None,
+    ):
         """
+        ``fp`` is either a buffer (``bytes``, ``bytearray``,
+        ``memoryview`` or ``mmap``) holding the marshal data, or a
+        file-like object whose remaining contents are read in one go.
+        Either way, objects are parsed with a cursor over a
+        ``memoryview`` so that no intermediate reads or copies are
+        needed.
+
         Marshal versions:
             0/Historical: Until 2.4/magic int 62041
             1: [2.4, 2.5) (self.magic_int: 62041 until 62071)
@@ -140,8 +648,37 @@ class _VersionIndependentUnmarshaller:
             4: [3.4a3, current) (self.magic_int: 3280 onwards)
 
         In Python 3, a ``bytes`` type is used for strings.
+
+        If ``lazy`` is set, code objects nested inside another code
+        object are not decoded. Instead they are skipped over and
+        represented by a ``LazyCode`` placeholder which decodes them on
+        first use.
+
+        ``intern_pool`` is an ``xdis.internpool.InternPool``. If given,
+        each constant decoded is replaced by an equal one already in the
+        pool, or added to the pool.
+
+        If ``native`` is set, large containers of constants that the
+        running Python's ``marshal`` module decodes just as we would are
+        handed over to it. This is not done when there is an intern pool,
+        since the constants inside would not be pooled.
+
+        ``limits`` is an ``UnmarshalLimits``. If given, exceeding any of
+        its limits raises ``UnmarshalLimitError``. Limits can't be
+        combined with ``lazy``, or with an intern pool.
+
+        ``profile`` is an ``xdis.unmarshal_profile.UnmarshalProfile`` to
+        record counts, bytes and time by marshal type and code object in.
+        It can't be combined with ``lazy``.
         """
         self.fp = fp
+        if isinstance(fp, BUFFER_TYPES):
+            buffer = fp
+        else:
+            buffer = fp.read()
+        self.buffer = memoryview(buffer).cast("B")
+        self.offset = 0
+
         self.magic_int = magic_int
         self.code_objects = code_objects
 
@@ -161,9 +698,101 @@ class _VersionIndependentUnmarshaller:
 
         self.internStrings = []
         self.internObjects = []
-        self.version_tuple = tuple()
-        self.is_graal = False
-        self.is_pypy = False
+        self.version_tuple = version
+
+        self.lazy = lazy
+
+        self.limits = limits
+        if limits is not None:
+            if lazy or intern_pool is not None:
+                raise ValueError("limits can't be used with lazy or intern_pool")
+            self.object_count = 0
+            self.depth = 0
+            self.deadline = None
+            # As with the intern pool below, this costs nothing when there
+            # are no limits.
+            self.r_object_unlimited = self.r_object
+            self.r_object = self.r_object_limited
+
+        self.profile = profile
+        if profile is not None:
+            if lazy:
+                raise ValueError("profile can't be used with lazy")
+            # [bytes, time] of the objects inside each object being decoded
+            self.profile_stack = []
+            # [objects, bytes, time] of what is inside each code object
+            # being decoded, with bytes and time only for nested code
+            self.profile_codes = []
+            self.r_object_unprofiled = self.r_object
+            self.r_object = self.r_object_profiled
+
+        self.intern_pool = intern_pool
+        if intern_pool is not None:
+            # Shadow r_object() so that everything decoded goes through
+            # the pool. This costs nothing when there is no pool.
+            self.r_object_unpooled = self.r_object
+            self.r_object = self.r_object_pooled
+
+        # Set by load_code_fields(): the code fields to decode, the record
+        # type to hold them, and the records made so far.
+        self.projection = None
+        self.code_record = None
+        self.code_records = []
+        # Nesting level of the code object being decoded.
+        self.code_depth = 0
+        # When we are re-decoding a part of the buffer that was skipped
+        # over before, its references have already been assigned slots
+        # in internObjects. This is the next such slot to fill, or None
+        # if we are not re-decoding.
+        self.replay_ref = None
+        self.is_graal = self.magic_int in GRAAL3_MAGICS
+        self.is_pypy = self.magic_int in PYPY3_MAGICS
+
+        # Resolve how code objects are laid out once, rather than
+        # for every code object we encounter.
+        self.code_layout = get_code_layout(self.magic_int)
+
+        # FIXME: Check/verify that is true:
+        self.code_bytes_for_s = PYTHON_VERSION_TRIPLE >= (3, 0) and (
+            self.version_tuple > (3, 0)
+        )
+        self.code_object_fields = tuple(
+            (name, False if name == "co_varnames" else self.code_bytes_for_s)
+            for name in self.code_layout.objects
+        )
+
+        # Marshaled code fields in order, with their bytes_for_s settings.
+        # This is used by iter_load().
+        code_fields = (
+            (("co_code", True),)
+            + self.code_object_fields
+            + tuple((name, self.code_bytes_for_s) for name in self.code_layout.trailer)
+        )
+        self.code_field_names = tuple(name for name, _ in code_fields)
+        self.code_field_bytes_for_s = tuple(flag for _, flag in code_fields)
+        # co_firstlineno comes just before the trailer fields.
+        self.code_trailer_index = len(code_fields) - len(self.code_layout.trailer)
+
+        # Bind the unmarshal routines once, indexed by marshal type code,
+        # so that r_object() does not have to look them up for each object.
+        self.dispatch_table = [None] * 128
+        for marshal_type, func_suffix in UNMARSHAL_DISPATCH_TABLE.items():
+            self.dispatch_table[ord(marshal_type)] = getattr(self, "t_" + func_suffix)
+
+        # Objects decoded by marshal would not be counted against limits.
+        self.native = (
+            native
+            and PYTHON3
+            and self.marshal_version >= 3
+            and intern_pool is None
+            and limits is None
+            and profile is None
+        )
+        if self.native:
+            # t_native() falls back to these.
+            self.python_dispatch_table = list(self.dispatch_table)
+            for marshal_type in NATIVE_TYPES:
+                self.dispatch_table[ord(marshal_type)] = self.t_native
 
     def load(self):
         """
@@ -180,15 +809,81 @@ class _VersionIndependentUnmarshaller:
         if self.marshal_version < 3:
             assert self.internObjects == []
 
-        return self.r_object()
+        if self.limits is not None and self.limits.timeout is not None:
+            self.deadline = time.monotonic() + self.limits.timeout
+        if self.profile is None:
+            return self.r_object()
+
+        start, start_time = self.offset, time.perf_counter()
+        obj = self.r_object()
+        self.profile.add_load(
+            self, self.offset - start, time.perf_counter() - start_time
+        )
+        return obj
+
+    # Low-level readers. These advance ``self.offset`` over
+    # ``self.buffer``.
+
+    def r_byte(self) -> int:
+        b = self.buffer[self.offset]
+        self.offset += 1
+        return b
+
+    def r_int16(self) -> int:
+        n = _unpack_int16(self.buffer, self.offset)[0]
+        self.offset += 2
+        return n
+
+    def r_int32(self) -> int:
+        n = _unpack_int32(self.buffer, self.offset)[0]
+        self.offset += 4
+        return n
+
+    def r_int64(self) -> int:
+        n = _unpack_int64(self.buffer, self.offset)[0]
+        self.offset += 8
+        return n
+
+    def r_double(self) -> float:
+        d = _unpack_double(self.buffer, self.offset)[0]
+        self.offset += 8
+        return d
+
+    def r_bytes(self, n: int) -> bytes:
+        """
+        Return the next ``n`` bytes of the buffer as a ``bytes`` object.
+        """
+        start = self.offset
+        self.offset = start + n
+        return self.buffer[start : self.offset].tobytes()
+
+    def r_str(self, n: int) -> Union[str, bytes]:
+        """
+        Like ``compat_str(self.r_bytes(n))``, but decoded straight out of the
+        buffer.
+        """
+        start = self.offset
+        self.offset = start + n
+        view = self.buffer[start : self.offset]
+        try:
+            return str(view, "utf-8")
+        except UnicodeDecodeError:
+            # If not Unicode, return bytes,
+            # and it will get converted to str when needed.
+            return view.tobytes()
 
     # Python 3.4+ support for reference objects.
     # The names follow marshal.c
     def r_ref_reserve(self, obj, save_ref):
         i = None
         if save_ref:
-            i = len(self.internObjects)
-            self.internObjects.append(obj)
+            if self.replay_ref is None:
+                i = len(self.internObjects)
+                self.internObjects.append(obj)
+            else:
+                i = self.replay_ref
+                self.replay_ref += 1
+                self.internObjects[i] = obj
         return obj, i
 
     def r_ref_insert(self, obj, i):
@@ -198,15 +893,244 @@ class _VersionIndependentUnmarshaller:
 
     def r_ref(self, obj, save_ref):
         if save_ref:
-            self.internObjects.append(obj)
+            self.r_ref_reserve(obj, save_ref)
         return obj
 
+    def r_next_ref(self) -> int:
+        """
+        Return the slot in internObjects that the next reference will get.
+        """
+        if self.replay_ref is None:
+            return len(self.internObjects)
+        return self.replay_ref
+
+    def r_intern(self, s):
+        # Interned strings seen while skipping have already been
+        # recorded, so don't record them again when re-decoding.
+        if self.replay_ref is None:
+            self.internStrings.append(s)
+        return s
+
+    def decode_at(self, offset: int, ref_index: int, bytes_for_s=False):
+        """
+        Decode the object whose type code is at ``offset`` in the buffer.
+        The first reference made while decoding it gets slot
+        ``ref_index`` in internObjects.
+
+        This is used to decode objects that were skipped over in lazy mode.
+        """
+        saved = self.offset, self.replay_ref, self.code_depth
+        self.offset, self.replay_ref, self.code_depth = offset, ref_index, 0
+        try:
+            return self.r_object(bytes_for_s=bytes_for_s)
+        finally:
+            self.offset, self.replay_ref, self.code_depth = saved
+
+    # Skipping over objects. This is used in lazy mode to find the end of
+    # a code object without building anything. We still have to walk the
+    # object, though, so that references and interned strings get the same
+    # numbering that they would have if the object had been decoded.
+
+    def s_object(self, bytes_for_s=False):
+        """
+        Skip over the object at the current offset. Return its marshal type.
+        """
+        start = self.offset
+        byte1 = self.buffer[start]
+        self.offset = start + 1
+        ref = None
+        if byte1 & FLAG_REF:
+            if self.replay_ref is None:
+                ref = len(self.internObjects)
+                self.internObjects.append(_LazyRef(start, ref, bytes_for_s))
+            else:
+                self.replay_ref += 1
+            byte1 = byte1 & (FLAG_REF - 1)
+        marshal_type = chr(byte1)
+
+        size = SKIP_SIZES.get(marshal_type)
+        if size is not None:
+            self.offset += size
+        elif marshal_type in "sau":
+            self.offset += 4 + _unpack_int32(self.buffer, start + 1)[0]
+        elif marshal_type == "l":
+            n = self.r_int32()
+            self.offset += 2 * abs(n)
+        elif marshal_type == "f":
+            n = self.r_byte()
+            self.offset += n
+        elif marshal_type == "x":
+            for _ in range(2):
+                if self.magic_int <= 62061:
+                    n = self.r_byte()
+                    self.offset += n
+                else:
+                    n = self.r_int32()
+                    self.offset += n
+        elif marshal_type == "z":
+            n = self.r_byte()
+            self.offset += n
+        elif marshal_type in "At":
+            self.r_intern(self.r_str(self.r_int32()))
+        elif marshal_type == "Z":
+            self.r_intern(self.r_str(self.r_byte()))
+        elif marshal_type in "([<>":
+            for _ in range(self.r_int32()):
+                self.s_object(bytes_for_s)
+        elif marshal_type == ")":
+            for _ in range(self.r_byte()):
+                self.s_object(bytes_for_s)
+        elif marshal_type == "{":
+            # Stop where t_dict() would.
+            while self.s_object(bytes_for_s) not in "0N":
+                if self.s_object(bytes_for_s) in "0N":
+                    break
+        elif marshal_type in "cC":
+            if self.projection is None:
+                self.s_code()
+            else:
+                # We still want a record for code objects that
+                # are inside skipped fields.
+                self.r_ref_insert(self.p_code(), ref)
+        else:
+            raise KeyError(marshal_type)
+        return marshal_type
+
+    def s_code(self):
+        """
+        Skip over the fields of a code object, whose type code
+        has already been read.
+        """
+        layout = self.code_layout
+        if layout.header is not None:
+            self.offset += layout.header.size
+        self.s_object(bytes_for_s=True)
+        if self.is_graal:
+            return
+        for _, field_bytes_for_s in self.code_object_fields:
+            self.s_object(bytes_for_s=field_bytes_for_s)
+        if layout.firstlineno is not None:
+            self.offset += layout.firstlineno.size
+            for _ in layout.trailer:
+                self.s_object(bytes_for_s=self.code_bytes_for_s)
+
+    def n_scan(self, n: int, first_ref: int, bytes_for_s=False):
+        """
+        Skip over the ``n`` objects at self.offset if the running Python's
+        marshal module would decode them just as we would, independently
+        of what comes before. Return None, leaving self.offset somewhere
+        in between, as soon as we come across something that isn't so.
+
+        Objects to be saved as references get _LazyRef slots, as in
+        s_object(). marshal numbers references from 0 rather than from
+        ``first_ref``, so references are fine only if they are to objects
+        in what is scanned. The offsets of these references are returned,
+        so that they can be renumbered.
+
+        Since this is only worthwhile if it is much faster than decoding,
+        there is no recursion or method call per object here.
+        """
+        buffer = self.buffer
+        offset = self.offset
+        refs = self.internObjects
+        scan = NATIVE_SCAN_BYTES if bytes_for_s else NATIVE_SCAN
+        ref_offsets = []
+        # Objects left to skip in the enclosing sequences.
+        stack = []
+        while True:
+            while n == 0:
+                if not stack:
+                    self.offset = offset
+                    return ref_offsets
+                n = stack.pop()
+            n -= 1
+            byte1 = buffer[offset]
+            if byte1 & FLAG_REF:
+                byte1 = byte1 & (FLAG_REF - 1)
+                refs.append(_LazyRef(offset, len(refs), bytes_for_s))
+            kind = scan.get(byte1)
+            if kind is None:
+                # Sets are decoded as the other kind of set by
+                # t_frozenset() and t_set(), longs become
+                # LongTypeForPython3, and t_dict() stops at a None key or
+                # value; so these are not handed off when nested. Nor are
+                # code objects.
+                self.offset = offset
+                return None
+            offset += 1
+            if kind >= 0:
+                offset += kind
+            elif kind == NATIVE_REF:
+                if _unpack_int32(buffer, offset)[0] < first_ref:
+                    self.offset = offset
+                    return None
+                ref_offsets.append(offset)
+                offset += 4
+            elif kind == NATIVE_SHORT_STR:
+                offset += 1 + buffer[offset]
+            elif kind == NATIVE_STR:
+                offset += 4 + _unpack_int32(buffer, offset)[0]
+            else:
+                stack.append(n)
+                if kind == NATIVE_SMALL_TUPLE:
+                    n = buffer[offset]
+                    offset += 1
+                else:
+                    n = _unpack_int32(buffer, offset)[0]
+                    offset += 4
+
+    def t_native(self, save_ref, bytes_for_s=False):
+        """
+        Hand the container whose type code has just been read over to the
+        running Python's marshal module if it is large and marshal would
+        decode it just as we would. Otherwise, decode it ourselves.
+        """
+        buffer = self.buffer
+        start = self.offset - 1
+        marshal_type = chr(buffer[start] & (FLAG_REF - 1))
+        if marshal_type == ")":
+            n = buffer[self.offset]
+        else:
+            n = _unpack_int32(buffer, self.offset)[0]
+
+        if n >= NATIVE_MIN_ITEMS and self.replay_ref is None:
+            ref = len(self.internObjects)
+            if save_ref:
+                self.internObjects.append(None)
+            # Scan the items rather than the container itself, since
+            # sets are handled differently at the top than when nested.
+            self.offset += 1 if marshal_type == ")" else 4
+            ref_offsets = self.n_scan(n, ref, bytes_for_s)
+            if ref_offsets is not None:
+                data = buffer[start : self.offset]
+                if ref_offsets:
+                    data = bytearray(data)
+                    for offset in ref_offsets:
+                        offset -= start
+                        _pack_int32_into(
+                            data, offset, _unpack_int32(data, offset)[0] - ref
+                        )
+                obj = marshal.loads(data)
+                if marshal_type == "<":
+                    obj = frozenset(obj)
+                elif marshal_type == ">":
+                    obj = set(obj)
+                if save_ref:
+                    self.internObjects[ref] = obj
+                return obj
+            # Undo the scan, and decode the container ourselves.
+            del self.internObjects[ref:]
+            self.offset = start + 1
+
+        return self.python_dispatch_table[ord(marshal_type)](save_ref, bytes_for_s)
+
     # In marshal.c this is one big case statement
     def r_object(self, bytes_for_s=False):
         """
         In Python3 strings are bytes type
         """
-        byte1 = ord(self.fp.read(1))
+        byte1 = self.buffer[self.offset]
+        self.offset += 1
 
         # FLAG_REF indicates whether we "intern" or
         # save a reference to the object.
@@ -217,26 +1141,269 @@ class _VersionIndependentUnmarshaller:
             # Since 3.4, "flag" is the marshal.c name
             save_ref = True
             byte1 = byte1 & (FLAG_REF - 1)
-        marshal_type = chr(byte1)
 
-        # print(marshal_type)  # debug
-
-        if marshal_type in UNMARSHAL_DISPATCH_TABLE:
-            func_suffix = UNMARSHAL_DISPATCH_TABLE[marshal_type]
-            unmarshal_func = getattr(self, "t_" + func_suffix)
+        unmarshal_func = self.dispatch_table[byte1]
+        if unmarshal_func is not None:
             return unmarshal_func(save_ref, bytes_for_s)
         else:
-            try:
-                sys.stderr.write(
-                    "Unknown type %i (hex %x) %c\n"
-                    % (ord(marshal_type), ord(marshal_type), marshal_type)
-                )
-            except TypeError:
-                sys.stderr.write(
-                    "Unknown type %i %c\n" % (ord(marshal_type), marshal_type)
+            return self.r_unknown(byte1)
+
+    def r_object_pooled(self, bytes_for_s=False):
+        return self.intern_pool.intern(self.r_object_unpooled(bytes_for_s))
+
+    def r_object_limited(self, bytes_for_s=False):
+        """
+        r_object() checked against self.limits.
+        """
+        limits = self.limits
+        buffer = self.buffer
+        start = self.offset
+
+        self.object_count += 1
+        if limits.max_objects is not None and self.object_count > limits.max_objects:
+            raise UnmarshalLimitError(
+                "more than %d objects to unmarshal" % limits.max_objects
+            )
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise UnmarshalLimitError(
+                "unmarshalling took more than %s seconds" % limits.timeout
+            )
+
+        # Check the length of a string or container before we read it.
+        end = start + 1
+        prefix = LENGTH_PREFIXES.get(buffer[start] & (FLAG_REF - 1))
+        if prefix is not None:
+            unpack, size, unit = prefix
+            if end + size > len(buffer):
+                raise UnmarshalLimitError("marshal data ends at offset %d" % start)
+            n = buffer[end] if unpack is None else unpack(buffer, end)[0]
+            end += size + abs(n) * unit
+            if end > len(buffer):
+                raise UnmarshalLimitError(
+                    "object at offset %d has length %d, but the marshal data "
+                    "ends at offset %d" % (start, n, len(buffer))
                 )
+        if limits.max_bytes is not None and end > limits.max_bytes:
+            raise UnmarshalLimitError(
+                "more than %d bytes of marshal data to unmarshal" % limits.max_bytes
+            )
 
-        return
+        self.depth += 1
+        if limits.max_depth is not None and self.depth > limits.max_depth:
+            raise UnmarshalLimitError(
+                "objects are nested more than %d deep" % limits.max_depth
+            )
+        try:
+            return self.r_object_unlimited(bytes_for_s)
+        finally:
+            self.depth -= 1
+
+    def r_object_profiled(self, bytes_for_s=False):
+        """
+        r_object(), recording what is decoded in self.profile.
+        """
+        buffer = self.buffer
+        start = self.offset
+        byte1 = buffer[start]
+        marshal_type = chr(byte1 & (FLAG_REF - 1))
+        stack = self.profile_stack
+        codes = self.profile_codes
+        if codes:
+            codes[-1][0] += 1
+        is_code = marshal_type in "cC"
+        if is_code:
+            codes.append([0, 0, 0.0])
+        stack.append([0, 0.0])
+        start_time = time.perf_counter()
+        try:
+            obj = self.r_object_unprofiled(bytes_for_s)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            inner_bytes, inner_time = stack.pop()
+            if is_code:
+                objects, code_bytes, code_time = codes.pop()
+
+        nbytes = self.offset - start
+        if stack:
+            stack[-1][0] += nbytes
+            stack[-1][1] += elapsed
+        profile = self.profile
+        profile.add_object(
+            marshal_type,
+            nbytes,
+            nbytes - inner_bytes,
+            elapsed,
+            elapsed - inner_time,
+            # Before marshal version 3, "R" refers to interned strings.
+            byte1 & FLAG_REF or (marshal_type == "t" and self.marshal_version < 3),
+        )
+        if marshal_type in "rR":
+            profile.add_ref_reuse((marshal_type, _unpack_int32(buffer, start + 1)[0]))
+        elif is_code:
+            if codes:
+                codes[-1][1] += nbytes
+                codes[-1][2] += elapsed
+            profile.add_code(
+                obj,
+                start,
+                len(codes),
+                objects,
+                nbytes,
+                nbytes - code_bytes,
+                elapsed,
+                elapsed - code_time,
+            )
+        return obj
+
+    def r_unknown(self, byte1: int):
+        marshal_type = chr(byte1)
+        try:
+            sys.stderr.write(
+                "Unknown type %i (hex %x) %c\n"
+                % (ord(marshal_type), ord(marshal_type), marshal_type)
+            )
+        except TypeError:
+            sys.stderr.write("Unknown type %i %c\n" % (ord(marshal_type), marshal_type))
+        return None
+
+    def iter_load(self):
+        """
+        Like load(), but without recursion: containers being decoded are
+        kept on an explicit stack, so deeply nested objects don't run into
+        Python's recursion limit.
+
+        This is a generator. It yields each code object as soon as it has
+        been decoded, so nested code objects come before the code objects
+        that contain them. The generator's return value is what load()
+        would have returned.
+
+        Lazy decoding is not done here.
+        """
+        if self.marshal_version == 0:
+            self.internStrings = []
+        if self.marshal_version < 3:
+            assert self.internObjects == []
+
+        intern = None if self.intern_pool is None else self.intern_pool.intern
+        stack = []
+        bytes_for_s = False
+        while True:
+            byte1 = self.r_byte()
+            save_ref = False
+            if byte1 & FLAG_REF:
+                save_ref = True
+                byte1 = byte1 & (FLAG_REF - 1)
+            marshal_type = chr(byte1)
+
+            if marshal_type in CONTAINER_TYPES:
+                frame = self.r_frame(marshal_type, save_ref, bytes_for_s)
+                if frame.remaining > 0:
+                    stack.append(frame)
+                    bytes_for_s = frame.child_bytes_for_s()
+                    continue
+                value = self.finish_frame(frame)
+                if frame.kind == "c":
+                    yield value
+            else:
+                unmarshal_func = self.dispatch_table[byte1]
+                if unmarshal_func is not None:
+                    value = unmarshal_func(save_ref, bytes_for_s)
+                else:
+                    value = self.r_unknown(byte1)
+            if intern is not None:
+                value = intern(value)
+
+            # Hand the value up to the containers on the stack, finishing
+            # off those that are now complete.
+            while stack:
+                frame = stack[-1]
+                if self.add_to_frame(frame, value):
+                    bytes_for_s = frame.child_bytes_for_s()
+                    break
+                stack.pop()
+                value = self.finish_frame(frame)
+                if intern is not None:
+                    value = intern(value)
+                if frame.kind == "c":
+                    yield value
+            else:
+                return value
+
+    def r_frame(self, marshal_type: str, save_ref: bool, bytes_for_s: bool):
+        """
+        Start decoding a container whose type code has been read. Return
+        the _Frame for it. This mirrors what the corresponding t_ routine
+        does before reading the container's items.
+        """
+        if marshal_type in "cC":
+            _, ref = self.r_ref_reserve(None, save_ref)
+            frame = _Frame("c", self.r_code_header(), ref, bytes_for_s)
+            frame.field_names = self.code_field_names
+            frame.field_bytes_for_s = self.code_field_bytes_for_s
+            frame.remaining = len(self.code_field_names)
+        elif marshal_type == "{":
+            frame = _Frame("{", self.r_ref(dict(), save_ref), None, bytes_for_s)
+            # A dictionary ends with a NULL key; we don't know its size.
+            frame.remaining = 1
+        elif marshal_type == "[":
+            n = self.r_int32()
+            frame = _Frame("[", self.r_ref(list(), save_ref), None, bytes_for_s)
+            frame.remaining = n
+        else:
+            n = self.r_byte() if marshal_type == ")" else self.r_int32()
+            _, ref = self.r_ref_reserve(tuple(), save_ref)
+            frame = _Frame(marshal_type, [], ref, bytes_for_s)
+            frame.remaining = n
+        return frame
+
+    def add_to_frame(self, frame, value) -> bool:
+        """
+        Add ``value`` as the next item of the container in ``frame``.
+        Return True if the container needs more items.
+        """
+        kind = frame.kind
+        if kind == "c":
+            name = frame.field_names[frame.index]
+            frame.items[name] = value
+            frame.index += 1
+            frame.remaining -= 1
+            if name == "co_code" and self.is_graal:
+                return False
+            if frame.index == self.code_trailer_index and frame.remaining > 0:
+                frame.items["co_firstlineno"] = self.r_code_firstlineno()
+        elif kind == "{":
+            # Like t_dict(), stop at a key or value of None.
+            if value is None:
+                return False
+            if frame.index == 0:
+                frame.key = value
+                frame.index = 1
+            else:
+                frame.items[frame.key] = value
+                frame.index = 0
+        else:
+            frame.items.append(value)
+            frame.remaining -= 1
+        return frame.remaining > 0
+
+    def finish_frame(self, frame):
+        """
+        Build the object for a container that has all of its items.
+        """
+        kind = frame.kind
+        if kind == "c":
+            fields = frame.items
+            if self.is_graal:
+                return self.r_ref_insert(self.graal_code(fields["co_code"]), frame.ref)
+            return self.r_ref_insert(self.build_code(fields), frame.ref)
+        elif kind in "{[":
+            return frame.items
+        elif kind == "<":
+            return self.r_ref_insert(frozenset(frame.items), frame.ref)
+        elif kind == ">":
+            return self.r_ref_insert(set(frame.items), frame.ref)
+        else:
+            return self.r_ref_insert(tuple(frame.items), frame.ref)
 
     # In C this NULL. Not sure what it should
     # translate here. Note NULL != None which is below
@@ -259,16 +1426,16 @@ class _VersionIndependentUnmarshaller:
         return True
 
     def t_int32(self, save_ref, bytes_for_s=False):
-        return self.r_ref(int(unpack("<i", self.fp.read(4))[0]), save_ref)
+        return self.r_ref(self.r_int32(), save_ref)
 
     def t_long(self, save_ref, bytes_for_s=False):
-        n = unpack("<i", self.fp.read(4))[0]
+        n = self.r_int32()
         if n == 0:
-            return long(0)
+            return self.r_ref(long(0), save_ref)
         size = abs(n)
         d = long(0)
         for j in range(0, size):
-            md = int(unpack("<h", self.fp.read(2))[0])
+            md = self.r_int16()
             # This operation and turn "d" from a long back
             # into an int.
             d += md << j * 15
@@ -280,26 +1447,23 @@ class _VersionIndependentUnmarshaller:
 
     # Python 3.4 removed this.
     def t_int64(self, save_ref, bytes_for_s=False):
-        obj = unpack("<q", self.fp.read(8))[0]
-        if save_ref:
-            self.internObjects.append(obj)
-        return obj
+        return self.r_ref(self.r_int64(), save_ref)
 
     # float - Seems not in use after Python 2.4
     def t_float(self, save_ref, bytes_for_s=False):
-        strsize = unpack("B", self.fp.read(1))[0]
-        s = self.fp.read(strsize)
+        strsize = self.r_byte()
+        s = self.r_bytes(strsize)
         return self.r_ref(float(s), save_ref)
 
     def t_binary_float(self, save_ref, bytes_for_s=False):
-        return self.r_ref(float(unpack("<d", self.fp.read(8))[0]), save_ref)
+        return self.r_ref(self.r_double(), save_ref)
 
     def t_complex(self, save_ref, bytes_for_s=False):
         def unpack_pre_24() -> float:
-            return float(self.fp.read(unpack("B", self.fp.read(1))[0]))
+            return float(self.r_bytes(self.r_byte()))
 
         def unpack_newer() -> float:
-            return float(self.fp.read(unpack("<i", self.fp.read(4))[0]))
+            return float(self.r_bytes(self.r_int32()))
 
         get_float = unpack_pre_24 if self.magic_int <= 62061 else unpack_newer
 
@@ -309,8 +1473,8 @@ class _VersionIndependentUnmarshaller:
 
     def t_binary_complex(self, save_ref, bytes_for_s=False):
         # binary complex
-        real = unpack("<d", self.fp.read(8))[0]
-        imag = unpack("<d", self.fp.read(8))[0]
+        real = self.r_double()
+        imag = self.r_double()
         return self.r_ref(complex(real, imag), save_ref)
 
     # Note: could mean bytes in Python3 processing Python2 bytecode
@@ -319,10 +1483,11 @@ class _VersionIndependentUnmarshaller:
         In Python3, this is a ``bytes`` type.  In Python2, it is a string type;
         ``bytes_for_s`` distinguishes what we need.
         """
-        strsize = unpack("<i", self.fp.read(4))[0]
-        s = self.fp.read(strsize)
-        if not bytes_for_s:
-            s = compat_str(s)
+        strsize = self.r_int32()
+        if bytes_for_s:
+            s = self.r_bytes(strsize)
+        else:
+            s = self.r_str(strsize)
         return self.r_ref(s, save_ref)
 
     # Python 3.4
@@ -333,9 +1498,9 @@ class _VersionIndependentUnmarshaller:
         the string.
         """
         # FIXME: check
-        strsize = unpack("<i", self.fp.read(4))[0]
-        interned = compat_str(self.fp.read(strsize))
-        self.internStrings.append(interned)
+        strsize = self.r_int32()
+        interned = self.r_str(strsize)
+        self.r_intern(interned)
         return self.r_ref(interned, save_ref)
 
     # Since Python 3.4
@@ -344,34 +1509,32 @@ class _VersionIndependentUnmarshaller:
         There are true strings in Python3 as opposed to
         bytes.
         """
-        strsize = unpack("<i", self.fp.read(4))[0]
-        s = self.fp.read(strsize)
-        s = compat_str(s)
-        return self.r_ref(s, save_ref)
+        strsize = self.r_int32()
+        return self.r_ref(self.r_str(strsize), save_ref)
 
     # Since Python 3.4
     def t_short_ASCII(self, save_ref, bytes_for_s=False):
-        strsize = unpack("B", self.fp.read(1))[0]
-        return self.r_ref(compat_str(self.fp.read(strsize)), save_ref)
+        strsize = self.r_byte()
+        return self.r_ref(self.r_str(strsize), save_ref)
 
     # Since Python 3.4
     def t_short_ASCII_interned(self, save_ref, bytes_for_s=False):
         # FIXME: check
-        strsize = unpack("B", self.fp.read(1))[0]
-        interned = compat_str(self.fp.read(strsize))
-        self.internStrings.append(interned)
+        strsize = self.r_byte()
+        interned = self.r_str(strsize)
+        self.r_intern(interned)
         return self.r_ref(interned, save_ref)
 
     # Since Python 3.4
     def t_interned(self, save_ref, bytes_for_s=False):
-        strsize = unpack("<i", self.fp.read(4))[0]
-        interned = compat_str(self.fp.read(strsize))
-        self.internStrings.append(interned)
+        strsize = self.r_int32()
+        interned = self.r_str(strsize)
+        self.r_intern(interned)
         return self.r_ref(interned, save_ref)
 
     def t_unicode(self, save_ref, bytes_for_s=False):
-        strsize = unpack("<i", self.fp.read(4))[0]
-        unicodestring = self.fp.read(strsize)
+        strsize = self.r_int32()
+        unicodestring = self.r_bytes(strsize)
         if PYTHON_VERSION_TRIPLE >= (3, 0) and self.version_tuple < (3, 0):
             string = UnicodeForPython3(unicodestring)
         else:
@@ -382,7 +1545,7 @@ class _VersionIndependentUnmarshaller:
     # Since Python 3.4
     def t_small_tuple(self, save_ref, bytes_for_s=False):
         # small tuple - since Python 3.4
-        tuplesize = unpack("B", self.fp.read(1))[0]
+        tuplesize = self.r_byte()
         ret, i = self.r_ref_reserve(tuple(), save_ref)
         while tuplesize > 0:
             ret += (self.r_object(bytes_for_s=bytes_for_s),)
@@ -391,16 +1554,16 @@ class _VersionIndependentUnmarshaller:
         return self.r_ref_insert(ret, i)
 
     def t_tuple(self, save_ref, bytes_for_s=False):
-        tuplesize = unpack("<i", self.fp.read(4))[0]
-        ret = self.r_ref(tuple(), save_ref)
+        tuplesize = self.r_int32()
+        ret, i = self.r_ref_reserve(tuple(), save_ref)
         while tuplesize > 0:
             ret += (self.r_object(bytes_for_s=bytes_for_s),)
             tuplesize -= 1
-        return ret
+        return self.r_ref_insert(ret, i)
 
     def t_list(self, save_ref, bytes_for_s=False):
         # FIXME: check me
-        n = unpack("<i", self.fp.read(4))[0]
+        n = self.r_int32()
         ret = self.r_ref(list(), save_ref)
         while n > 0:
             ret += (self.r_object(bytes_for_s=bytes_for_s),)
@@ -408,7 +1571,7 @@ class _VersionIndependentUnmarshaller:
         return ret
 
     def t_frozenset(self, save_ref, bytes_for_s=False):
-        setsize = unpack("<i", self.fp.read(4))[0]
+        setsize = self.r_int32()
         ret, i = self.r_ref_reserve(tuple(), save_ref)
         while setsize > 0:
             ret += (self.r_object(bytes_for_s=bytes_for_s),)
@@ -416,7 +1579,7 @@ class _VersionIndependentUnmarshaller:
         return self.r_ref_insert(frozenset(ret), i)
 
     def t_set(self, save_ref, bytes_for_s=False):
-        setsize = unpack("<i", self.fp.read(4))[0]
+        setsize = self.r_int32()
         ret, i = self.r_ref_reserve(tuple(), save_ref)
         while setsize > 0:
             ret += (self.r_object(bytes_for_s=bytes_for_s),)
@@ -438,188 +1601,141 @@ class _VersionIndependentUnmarshaller:
         return ret
 
     def t_python2_string_reference(self, save_ref, bytes_for_s=False):
-        refnum = unpack("<i", self.fp.read(4))[0]
+        refnum = self.r_int32()
         return self.internStrings[refnum]
 
     def t_code(self, save_ref, bytes_for_s=False):
-        # FIXME: use tables to simplify this?
         # FIXME: Python 1.0 .. 1.3 isn't well known
 
+        if self.lazy and self.code_depth > 0:
+            # Leave decoding this code object until it is needed.
+            ret = LazyCode(self, self.offset - 1, self.r_next_ref())
+            self.r_ref(ret, save_ref)
+            self.s_code()
+            ret.end = self.offset
+            return ret
+
         ret, i = self.r_ref_reserve(None, save_ref)
-        self.version_tuple = magic_int2tuple(self.magic_int)
 
-        if self.version_tuple >= (2, 3):
-            co_argcount = unpack("<i", self.fp.read(4))[0]
-        elif self.version_tuple >= (1, 3):
-            co_argcount = unpack("<h", self.fp.read(2))[0]
-        else:
-            co_argcount = 0
+        if self.projection is not None:
+            return self.r_ref_insert(self.p_code(), i)
 
-        if self.version_tuple >= (3, 8):
-            co_posonlyargcount = (
-                0
-                if self.magic_int in (3400, 3401, 3410, 3411)
-                else unpack("<i", self.fp.read(4))[0]
-            )
-        else:
-            co_posonlyargcount = None
+        fields = self.r_code_header()
+        co_code = self.r_object(bytes_for_s=True)
 
-        if self.version_tuple >= (3, 0):
-            kwonlyargcount = unpack("<i", self.fp.read(4))[0]
-        else:
-            kwonlyargcount = 0
-
-        co_nlocals = 0
-        if self.version_tuple < (3, 11):
-            if self.version_tuple >= (2, 3):
-                co_nlocals = unpack("<i", self.fp.read(4))[0]
-            elif self.version_tuple >= (1, 3):
-                co_nlocals = unpack("<h", self.fp.read(2))[0]
-
-        if self.version_tuple >= (2, 3):
-            co_stacksize = unpack("<i", self.fp.read(4))[0]
-        elif self.version_tuple >= (1, 5):
-            co_stacksize = unpack("<h", self.fp.read(2))[0]
-        else:
-            co_stacksize = 0
+        if self.is_graal:
+            return self.r_ref_insert(self.graal_code(co_code), i)
 
-        if self.version_tuple >= (2, 3):
-            co_flags = unpack("<i", self.fp.read(4))[0]
-        elif self.version_tuple >= (1, 3):
-            co_flags = unpack("<h", self.fp.read(2))[0]
-        else:
-            co_flags = 0
+        fields["co_code"] = co_code
+        self.code_depth += 1
+        for name, field_bytes_for_s in self.code_object_fields:
+            fields[name] = self.r_object(bytes_for_s=field_bytes_for_s)
+        self.code_depth -= 1
 
-        co_code = self.r_object(bytes_for_s=True)
+        if self.code_layout.firstlineno is not None:
+            fields["co_firstlineno"] = self.r_code_firstlineno()
+            for name in self.code_layout.trailer:
+                fields[name] = self.r_object(bytes_for_s=self.code_bytes_for_s)
 
-        self.is_graal = self.magic_int in GRAAL3_MAGICS
-        self.is_pypy = self.magic_int in PYPY3_MAGICS
+        return self.r_ref_insert(self.build_code(fields), i)
 
-        # FIXME: Check/verify that is true:
-        bytes_for_s = PYTHON_VERSION_TRIPLE >= (3, 0) and (self.version_tuple > (3, 0))
-        if self.is_graal:
-            co_consts = tuple()
-            co_names = tuple()
-            code = to_portable(
-                co_argcount=0,
-                co_posonlyargcount=0,
-                co_kwonlyargcount=0,
-                co_nlocals=0,
-                co_stacksize=0,
-                co_flags=0,
-                co_code=co_code,
-                co_consts=tuple(),
-                co_names=tuple(),
-                co_varnames=tuple(),
-                co_filename="??",
-                co_name="??",
-                co_qualname="??",
-                co_firstlineno=0,
-                co_lnotab="",
-                co_freevars=tuple(),
-                co_cellvars=tuple(),
-                co_exceptiontable=None,
-                version_triple=self.version_tuple,
+    # Helper routines for t_code. All version-specific decisions have
+    # been made in advance and are recorded in self.code_layout.
+
+    def r_code_header(self) -> dict:
+        """
+        Read the integer fields that precede co_code. Return a dictionary of
+        code fields with these filled in, and defaults for the fields that
+        are not stored.
+        """
+        layout = self.code_layout
+        fields = dict(layout.defaults)
+        header = layout.header
+        if header is not None:
+            fields.update(
+                zip(layout.header_fields, header.unpack_from(self.buffer, self.offset))
             )
-            ret = code
-            return self.r_ref_insert(ret, i)
-
-        co_consts = self.r_object(bytes_for_s=bytes_for_s)
-        co_names = self.r_object(bytes_for_s=bytes_for_s)
-
-        co_varnames = tuple()
-        co_freevars = tuple()
-        co_cellvars = tuple()
-
-        if self.version_tuple >= (3, 11):
-            # parse localsplusnames list: https://github.com/python/cpython/blob/3.11/Objects/codeobject.c#L208C12
-            co_localsplusnames = self.r_object(bytes_for_s=bytes_for_s)
-            co_localspluskinds = self.r_object(bytes_for_s=bytes_for_s)
-
-            CO_FAST_LOCAL = 0x20
-            CO_FAST_CELL = 0x40
-            CO_FAST_FREE = 0x80
-
-            for name, kind in zip(co_localsplusnames, co_localspluskinds):
-                if kind & CO_FAST_LOCAL:
-                    co_varnames += (name,)
-                    if kind & CO_FAST_CELL:
-                        co_cellvars += (name,)
-                elif kind & CO_FAST_CELL:
-                    co_cellvars += (name,)
-                elif kind & CO_FAST_FREE:
-                    co_freevars += (name,)
-
-            co_nlocals = len(co_varnames)
-            co_filename = self.r_object(bytes_for_s=bytes_for_s)
-            co_name = self.r_object(bytes_for_s=bytes_for_s)
-            co_qualname = self.r_object(bytes_for_s=bytes_for_s)
+            self.offset += header.size
+        return fields
 
-        else:
-            co_qualname = None
-            if self.version_tuple >= (1, 3):
-                co_varnames = self.r_object(bytes_for_s=False)
-            else:
-                co_varnames = tuple()
+    def r_code_firstlineno(self) -> int:
+        firstlineno = self.code_layout.firstlineno
+        lineno = firstlineno.unpack_from(self.buffer, self.offset)[0]
+        self.offset += firstlineno.size
+        return lineno
 
-            if self.version_tuple >= (2, 0):
-                co_freevars = self.r_object(bytes_for_s=bytes_for_s)
-                co_cellvars = self.r_object(bytes_for_s=bytes_for_s)
+    def graal_code(self, co_code):
+        return graal_code(co_code, self.version_tuple)
 
-            co_filename = self.r_object(bytes_for_s=bytes_for_s)
-            co_name = self.r_object(bytes_for_s=bytes_for_s)
+    def build_code(self, fields: dict):
+        """
+        Turn the code fields read by t_code() into a portable code object.
+        """
+        if self.code_layout.has_localsplus:
+            split_localsplus(fields)
+            if self.intern_pool is not None:
+                intern = self.intern_pool.intern
+                for name in ("co_varnames", "co_cellvars", "co_freevars"):
+                    fields[name] = intern(fields[name])
 
-        co_exceptiontable = None
-        if self.version_tuple >= (1, 5):
-            if self.version_tuple >= (2, 3):
-                co_firstlineno = unpack("<i", self.fp.read(4))[0]
-            else:
-                co_firstlineno = unpack("<h", self.fp.read(2))[0]
+        # Note: in 3.11+ co_lnotab is really co_linetable; it
+        # will be parsed later in opcode.findlinestarts.
+        code = to_portable(version_triple=self.version_tuple, **fields)
 
-            if self.version_tuple >= (3, 11):
-                co_linetable = self.r_object(bytes_for_s=bytes_for_s)
-                co_lnotab = (
-                    co_linetable  # will be parsed later in opcode.findlinestarts
-                )
-                co_exceptiontable = self.r_object(bytes_for_s=bytes_for_s)
-            else:
-                co_lnotab = self.r_object(bytes_for_s=bytes_for_s)
+        self.code_objects[str(code)] = code
+        return code
+
+    def p_code(self):
+        """
+        Read the fields of a code object, whose type code has already been
+        read, decoding only those in self.projection and skipping over the
+        rest. Return a self.code_record, which is also added to
+        self.code_records.
+        """
+        wanted = self.projection
+        layout = self.code_layout
+        fields = self.r_code_header()
+        if "co_code" in wanted:
+            fields["co_code"] = self.r_object(bytes_for_s=True)
         else:
-            # < 1.5 there is no lnotab, so no firstlineno.
-            # SET_LINENO is used instead.
-            co_firstlineno = -1  # Bogus sentinel value
-            co_lnotab = b""
-
-        code = to_portable(
-            co_argcount=co_argcount,
-            co_posonlyargcount=co_posonlyargcount,
-            co_kwonlyargcount=kwonlyargcount,
-            co_nlocals=co_nlocals,
-            co_stacksize=co_stacksize,
-            co_flags=co_flags,
-            co_code=co_code,
-            co_consts=co_consts,
-            co_names=co_names,
-            co_varnames=co_varnames,
-            co_filename=co_filename,
-            co_name=co_name,
-            co_qualname=co_qualname,
-            co_firstlineno=co_firstlineno,
-            co_lnotab=co_lnotab,
-            co_freevars=co_freevars,
-            co_cellvars=co_cellvars,
-            co_exceptiontable=co_exceptiontable,
-            version_triple=self.version_tuple,
-        )
+            self.s_object(bytes_for_s=True)
 
-        self.code_objects[str(code)] = code
-        ret = code
-        return self.r_ref_insert(ret, i)
+        if not self.is_graal:
+            want_localsplus = layout.has_localsplus and not wanted.isdisjoint(
+                _LOCALSPLUS_FIELDS
+            )
+            for name, field_bytes_for_s in self.code_object_fields:
+                if name in wanted or (
+                    want_localsplus
+                    and name in ("co_localsplusnames", "co_localspluskinds")
+                ):
+                    fields[name] = self.r_object(bytes_for_s=field_bytes_for_s)
+                else:
+                    self.s_object(bytes_for_s=field_bytes_for_s)
+            if want_localsplus:
+                split_localsplus(fields)
+
+            if layout.firstlineno is not None:
+                fields["co_firstlineno"] = self.r_code_firstlineno()
+                for name in layout.trailer:
+                    if name in wanted:
+                        fields[name] = self.r_object(bytes_for_s=self.code_bytes_for_s)
+                    else:
+                        self.s_object(bytes_for_s=self.code_bytes_for_s)
+
+        record = self.code_record(
+            *[fields.get(name) for name in self.code_record._fields]
+        )
+        self.code_records.append(record)
+        return record
 
     # Since Python 3.4
     def t_object_reference(self, save_ref=None, bytes_for_s=False):
-        refnum = unpack("<i", self.fp.read(4))[0]
+        refnum = self.r_int32()
         o = self.internObjects[refnum]
+        if isinstance(o, _LazyRef):
+            # The object was skipped over in lazy mode; decode it now.
+            o = self.decode_at(o.offset, o.ref_index, o.bytes_for_s)
         return o
 
     def t_unknown(self, save_ref=None, bytes_for_s=False):
@@ -631,10 +1747,131 @@ class _VersionIndependentUnmarshaller:
 # user interface
 
 
-def load_code(fp, magic_int, bytes_for_s=False, code_objects={}):
-    if isinstance(fp, bytes):
-        fp = io.BytesIO(fp)
+def iter_code_objects(
+    fp, magic_int, bytes_for_s=False, code_objects={}, intern_pool=None
+):
+    """
+    Unmarshal the object in ``fp`` for bytecode with magic ``magic_int``,
+    yielding each code object as soon as it has been decoded. Nested
+    code objects come before the code objects that contain them, so for a
+    module, the module's code object comes last.
+
+    Decoding is done without recursion, and stops when the iterator is
+    no longer advanced. ``fp`` and ``intern_pool`` are handled as in
+    ``load_code()``. The iterator's return value is the unmarshalled
+    object.
+    """
+    is_file = not isinstance(fp, BUFFER_TYPES)
+    if is_file and getattr(fp, "seekable", lambda: False)():
+        start = fp.tell()
+    else:
+        start = None
+    um_gen = _VersionIndependentUnmarshaller(
+        fp, magic_int, bytes_for_s, code_objects=code_objects, intern_pool=intern_pool
+    )
+    try:
+        return (yield from um_gen.iter_load())
+    finally:
+        um_gen.buffer.release()
+        if start is not None:
+            fp.seek(start + um_gen.offset)
+
+
+@lru_cache(maxsize=None)
+def _code_record_type(fields: tuple):
+    return namedtuple("CodeFields", fields)
+
+
+def load_code_fields(fp, magic_int, fields, bytes_for_s=False) -> list:
+    """
+    Pull just the code fields named in ``fields``, e.g. ``("co_names",
+    "co_consts")``, out of the code objects in ``fp`` for bytecode with
+    magic ``magic_int``. Everything else is skipped over rather than
+    decoded, and no code objects are built.
+
+    A list of records is returned, one per code object, with nested code
+    objects before the code objects that contain them. Each record is a
+    namedtuple with the requested fields. Where ``co_consts`` is requested,
+    nested code objects in it are replaced by their records.
+
+    The valid field names are in ``CODE_FIELD_NAMES``. ``fp`` is handled as
+    in ``load_code()``.
+    """
+    fields = tuple(fields)
+    for name in fields:
+        if name not in CODE_FIELD_NAMES:
+            raise ValueError("%s is not a code field name" % name)
+
+    is_file = not isinstance(fp, BUFFER_TYPES)
+    if is_file and getattr(fp, "seekable", lambda: False)():
+        start = fp.tell()
+    else:
+        start = None
+    um_gen = _VersionIndependentUnmarshaller(fp, magic_int, bytes_for_s)
+    um_gen.projection = frozenset(fields)
+    um_gen.code_record = _code_record_type(fields)
+    try:
+        um_gen.load()
+        return um_gen.code_records
+    finally:
+        um_gen.buffer.release()
+        if start is not None:
+            fp.seek(start + um_gen.offset)
+
+
+def load_code(
+    fp,
+    magic_int,
+    bytes_for_s=False,
+    code_objects={},
+    lazy=False,
+    intern_pool=None,
+    limits=None,
+    profile=None,
+):
+    """
+    Unmarshal the object in ``fp`` for bytecode with magic ``magic_int``.
+
+    ``fp`` can be a ``bytes``, ``bytearray``, ``memoryview`` or ``mmap``
+    buffer, which is parsed in place, or a file-like object. For a
+    file-like object, the remaining contents are read and, if the file is
+    seekable, it is left positioned just after the unmarshalled object.
+
+    If ``lazy`` is True, code objects nested in the returned code object
+    are ``LazyCode`` placeholders that are decoded on first use. These
+    hold on to the marshal data, so an ``mmap`` passed in can't be closed
+    while they are alive.
+
+    ``intern_pool`` is an ``xdis.internpool.InternPool`` shared between
+    loads. When given, strings, numbers and constant tuples that are
+    equal to ones seen in earlier loads are replaced by those.
+
+    ``limits`` is an ``UnmarshalLimits`` for data that can't be trusted.
+    ``UnmarshalLimitError`` is raised as soon as one of the limits is
+    exceeded.
+
+    ``profile`` is an ``xdis.unmarshal_profile.UnmarshalProfile`` in which
+    to record where the bytes and time go.
+    """
+    is_file = not isinstance(fp, BUFFER_TYPES)
+    if is_file and getattr(fp, "seekable", lambda: False)():
+        start = fp.tell()
+    else:
+        start = None
     um_gen = _VersionIndependentUnmarshaller(
-        fp, magic_int, bytes_for_s, code_objects=code_objects
+        fp,
+        magic_int,
+        bytes_for_s,
+        code_objects=code_objects,
+        lazy=lazy,
+        intern_pool=intern_pool,
+        limits=limits,
+        profile=profile,
     )
-    return um_gen.load()
+    try:
+        return um_gen.load()
+    finally:
+        if not lazy:
+            um_gen.buffer.release()
+        if start is not None:
+            fp.seek(start + um_gen.offset)
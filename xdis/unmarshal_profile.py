@@ -0,0 +1,299 @@
+# Copyright (c) 2024 by Rocky Bernstein
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Where the bytes and time go when unmarshalling a bytecode file.
+
+Pass an UnmarshalProfile as ``profile`` to ``xdis.unmarshal.load_code()``
+or ``xdis.load.load_module()``. Afterwards it holds, for each marshal
+type code and for each code object, the number of objects, the bytes of
+marshal data they take up, and the time taken to decode them. It also
+has how many references were saved and reused, and how many bytes each
+code object field, such as co_consts or the line table, takes up.
+
+Bytes and time are given both including and excluding what is nested
+inside. For code objects, "self" excludes only nested code objects.
+"""
+
+import json
+from bisect import bisect_left
+from collections import namedtuple
+
+from xdis.unmarshal import UNMARSHAL_DISPATCH_TABLE, _VersionIndependentUnmarshaller
+
+# What is kept for each code object decoded. offset is where it starts
+# in the marshal data, and depth is how many code objects enclose it.
+# fields is a dictionary from code field name to the bytes that field
+# takes up, not counting nested code objects.
+CodeProfile = namedtuple(
+    "CodeProfile",
+    "co_name co_firstlineno offset depth objects bytes self_bytes time self_time "
+    "fields",
+)
+
+
+def type_code_name(type_code: str) -> str:
+    """
+    Return the name of the t_ routine for marshal type code ``type_code``,
+    e.g. "t_code" for "c".
+    """
+    suffix = UNMARSHAL_DISPATCH_TABLE.get(type_code)
+    if suffix is None:
+        return "unknown %r" % type_code
+    return "t_" + suffix
+
+
+class UnmarshalProfile:
+    """
+    Counts, bytes and times collected while unmarshalling.
+    """
+
+    def __init__(self):
+        # Type code -> [count, bytes, self_bytes, time, self_time]
+        self.types = {}
+        self.codes = []
+        # Objects saved for later reference, references to them, and
+        # the number of different objects that were referred to.
+        self.refs_saved = 0
+        self.refs_reused = 0
+        self.reused = set()
+        self.total_bytes = 0
+        self.total_time = 0.0
+        # Code objects before this in self.codes are from earlier loads.
+        self.codes_loaded = 0
+
+    def add_object(
+        self,
+        type_code: str,
+        nbytes: int,
+        self_bytes: int,
+        elapsed: float,
+        self_time: float,
+        saved: bool,
+    ):
+        stats = self.types.get(type_code)
+        if stats is None:
+            stats = self.types[type_code] = [0, 0, 0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += nbytes
+        stats[2] += self_bytes
+        stats[3] += elapsed
+        stats[4] += self_time
+        if saved:
+            self.refs_saved += 1
+
+    def add_ref_reuse(self, key):
+        self.refs_reused += 1
+        self.reused.add(key)
+
+    def add_code(
+        self,
+        code,
+        offset: int,
+        depth: int,
+        objects: int,
+        nbytes: int,
+        self_bytes: int,
+        elapsed: float,
+        self_time: float,
+    ):
+        self.codes.append(
+            CodeProfile(
+                code.co_name,
+                getattr(code, "co_firstlineno", None),
+                offset,
+                depth,
+                objects,
+                nbytes,
+                self_bytes,
+                elapsed,
+                self_time,
+                None,
+            )
+        )
+
+    def add_load(self, unmarshaller, nbytes: int, elapsed: float):
+        """
+        Called at the end of a load by ``unmarshaller``.
+        """
+        self.total_bytes += nbytes
+        self.total_time += elapsed
+        first = self.codes_loaded
+        self.codes[first:] = _code_fields(unmarshaller, self.codes[first:])
+        self.codes_loaded = len(self.codes)
+
+    def fields(self) -> dict:
+        """
+        Return a dictionary from code field name to the total bytes that
+        field takes up in all code objects.
+        """
+        totals = {}
+        for code in self.codes:
+            for name, nbytes in code.fields.items():
+                totals[name] = totals.get(name, 0) + nbytes
+        return totals
+
+    def as_dict(self) -> dict:
+        return {
+            "total_bytes": self.total_bytes,
+            "total_time": self.total_time,
+            "refs_saved": self.refs_saved,
+            "refs_reused": self.refs_reused,
+            "distinct_refs_reused": len(self.reused),
+            "types": {
+                type_code_name(type_code): {
+                    "type_code": type_code,
+                    "count": count,
+                    "bytes": nbytes,
+                    "self_bytes": self_bytes,
+                    "time": elapsed,
+                    "self_time": self_time,
+                }
+                for type_code, (
+                    count,
+                    nbytes,
+                    self_bytes,
+                    elapsed,
+                    self_time,
+                ) in self.types.items()
+            },
+            "fields": self.fields(),
+            "codes": [
+                dict(code._asdict(), co_name=_name_str(code.co_name))
+                for code in self.codes
+            ],
+        }
+
+    def to_json(self, indent=2) -> str:
+        return json.dumps(self.as_dict(), indent=indent)
+
+    def format_table(self, max_codes=20) -> str:
+        """
+        Return the profile as text tables: by marshal type, by code field,
+        and for the ``max_codes`` code objects that took longest to decode
+        themselves.
+        """
+        total_bytes = self.total_bytes or 1
+        lines = [
+            "%d bytes in %.3f ms; %d references saved, %d reused (%d distinct)"
+            % (
+                self.total_bytes,
+                self.total_time * 1000,
+                self.refs_saved,
+                self.refs_reused,
+                len(self.reused),
+            ),
+            "",
+            "%-32s %8s %10s %10s %6s %10s"
+            % ("Type", "Count", "Bytes", "Self bytes", "%", "Self ms"),
+        ]
+        for type_code, (count, nbytes, self_bytes, _, self_time) in sorted(
+            self.types.items(), key=lambda item: -item[1][2]
+        ):
+            lines.append(
+                "%-32s %8d %10d %10d %6.1f %10.3f"
+                % (
+                    "%s (%s)" % (type_code_name(type_code), type_code),
+                    count,
+                    nbytes,
+                    self_bytes,
+                    100.0 * self_bytes / total_bytes,
+                    self_time * 1000,
+                )
+            )
+
+        lines += ["", "%-32s %10s %6s" % ("Code field", "Bytes", "%")]
+        for name, nbytes in sorted(self.fields().items(), key=lambda item: -item[1]):
+            lines.append(
+                "%-32s %10d %6.1f" % (name, nbytes, 100.0 * nbytes / total_bytes)
+            )
+
+        lines += [
+            "",
+            "%-32s %6s %8s %10s %10s %10s"
+            % ("Code object", "Line", "Objects", "Bytes", "Self bytes", "Self ms"),
+        ]
+        codes = sorted(self.codes, key=lambda code: -code.self_time)
+        for code in codes[:max_codes]:
+            lines.append(
+                "%-32s %6s %8d %10d %10d %10.3f"
+                % (
+                    "  " * code.depth + _name_str(code.co_name),
+                    code.co_firstlineno,
+                    code.objects,
+                    code.bytes,
+                    code.self_bytes,
+                    code.self_time * 1000,
+                )
+            )
+        if len(codes) > max_codes:
+            lines.append("... and %d more" % (len(codes) - max_codes))
+        return "\n".join(lines)
+
+
+def _code_fields(unmarshaller, codes: list) -> list:
+    """
+    Return the CodeProfiles in ``codes`` with their ``fields`` filled in,
+    by going back over the code objects in the marshal data of
+    ``unmarshaller``.
+    """
+    # Skipping over objects records references and interned strings, so
+    # use another unmarshaller for that.
+    scratch = _VersionIndependentUnmarshaller(
+        unmarshaller.buffer, unmarshaller.magic_int, False, native=False
+    )
+    layout = scratch.code_layout
+    by_offset = sorted(codes, key=lambda code: code.offset)
+    offsets = [code.offset for code in by_offset]
+
+    def nested_bytes(depth: int, start: int, end: int) -> int:
+        """Bytes of the code objects directly inside a field."""
+        nbytes = 0
+        i = bisect_left(offsets, start)
+        while i < len(offsets) and offsets[i] < end:
+            if by_offset[i].depth == depth:
+                nbytes += by_offset[i].bytes
+            i += 1
+        return nbytes
+
+    result = []
+    for code in codes:
+        fields = {}
+        scratch.offset = code.offset + 1
+        if layout.header is not None:
+            fields["header"] = layout.header.size
+            scratch.offset += layout.header.size
+        for i, name in enumerate(scratch.code_field_names):
+            if i == scratch.code_trailer_index and layout.firstlineno is not None:
+                fields["co_firstlineno"] = layout.firstlineno.size
+                scratch.offset += layout.firstlineno.size
+            start = scratch.offset
+            scratch.s_object()
+            fields[name] = (
+                scratch.offset
+                - start
+                - nested_bytes(code.depth + 1, start, scratch.offset)
+            )
+            if name == "co_code" and scratch.is_graal:
+                break
+        result.append(code._replace(fields=fields))
+    return result
+
+
+def _name_str(name) -> str:
+    if isinstance(name, bytes):
+        return name.decode("latin-1")
+    return str(name)
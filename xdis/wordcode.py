@@ -16,7 +16,7 @@
 
 """Python disassembly functions specific to wordcode from Python 3.6+
 """
-from xdis.bytecode import op_has_argument
+from xdis.cross_dis import JumpTargetIndex, op_has_argument
 
 
 def unpack_opargs_wordcode(code, opc):
@@ -52,19 +52,7 @@ def findlabels(code, opc):
     """Returns a list of instruction offsets in the supplied bytecode
     which are the targets of jump instruction.
     """
-    offsets = []
-    for offset, op, arg in unpack_opargs_wordcode(code, opc):
-        if arg is not None:
-            arg2 = arg * 2 if opc.version_tuple >= (3, 10) else arg
-            if op in opc.JREL_OPS:
-                jump_offset = offset + 2 + arg2
-            elif op in opc.JABS_OPS:
-                jump_offset = arg2
-            else:
-                continue
-            if jump_offset not in offsets:
-                offsets.append(jump_offset)
-    return offsets
+    return list(JumpTargetIndex(code, opc).sources)
 
 
 def get_jump_target_maps(code, opc) -> dict:
@@ -75,24 +63,4 @@ def get_jump_target_maps(code, opc) -> dict:
     instructions. The values of the dictionary may be useful in control-flow
     analysis.
     """
-    offset2prev = {}
-    prev_offset = -1
-    for offset, op, arg in unpack_opargs_wordcode(code, opc):
-        if prev_offset >= 0:
-            prev_list = offset2prev.get(offset, [])
-            prev_list.append(prev_offset)
-            offset2prev[offset] = prev_list
-        prev_offset = offset
-        if op in opc.NOFOLLOW:
-            prev_offset = -1
-        if arg is not None:
-            jump_offset = -1
-            if op in opc.JREL_OPS:
-                jump_offset = offset + 2 + arg
-            elif op in opc.JABS_OPS:
-                jump_offset = arg
-            if jump_offset >= 0:
-                prev_list = offset2prev.get(jump_offset, [])
-                prev_list.append(offset)
-                offset2prev[jump_offset] = prev_list
-    return offset2prev
+    return JumpTargetIndex(code, opc).jump_target_maps()